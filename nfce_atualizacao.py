@@ -0,0 +1,145 @@
+"""
+Atualização pelo GitHub Releases: consulta com cache e ETag, download
+retomável e conferência do SHA-256
+"""
+import os
+import json
+import time
+import re
+import hashlib
+import requests
+
+
+VERSION = "1.0.3"
+GITHUB_REPO = "mtzcode/sincroniza_nfce"
+GITHUB_RELEASE_URL = f"https://api.github.com/repos/{GITHUB_REPO}/releases/latest"
+ATUALIZACAO_CACHE_FILE = 'atualizacao_cache.json'
+ATUALIZACAO_TTL = 3600  # segundos sem consultar a API de releases
+ATUALIZACAO_TIMEOUT = (10, 30)  # (conexão, leitura) em segundos
+# Tamanho dos blocos do download: cresce em links rápidos e diminui em links lentos
+ATUALIZACAO_CHUNK_INICIAL = 64 * 1024
+ATUALIZACAO_CHUNK_MINIMO = 16 * 1024
+ATUALIZACAO_CHUNK_MAXIMO = 4 * 1024 * 1024
+
+HEADERS_ATUALIZACAO = {
+    'User-Agent': f'VerificadorNFCe/{VERSION}',
+    'Accept': 'application/vnd.github.v3+json'
+}
+
+
+def versao_comparavel(texto):
+    """'v1.0.10' -> (1, 0, 10), para comparar versões numericamente"""
+    return tuple(int(parte) for parte in re.findall(r'\d+', texto))
+
+
+def consultar_release(url=GITHUB_RELEASE_URL, cache_arquivo=ATUALIZACAO_CACHE_FILE, ttl=ATUALIZACAO_TTL):
+    """
+    Consulta a release mais recente. Dentro do TTL usa o cache local sem
+    acessar a rede; depois faz uma requisição condicional (If-None-Match),
+    que devolve 304 sem corpo quando nada mudou.
+    """
+    cache = {}
+    if os.path.exists(cache_arquivo):
+        try:
+            with open(cache_arquivo, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except Exception:
+            cache = {}
+    if cache.get('url') != url:
+        cache = {}
+    if cache.get('release') and time.time() - cache.get('verificado_em', 0) < ttl:
+        return cache['release']
+
+    headers = dict(HEADERS_ATUALIZACAO)
+    if cache.get('etag') and cache.get('release'):
+        headers['If-None-Match'] = cache['etag']
+    response = requests.get(url, headers=headers, timeout=ATUALIZACAO_TIMEOUT)
+    if response.status_code == 304:
+        release = cache['release']
+    elif response.status_code == 200:
+        release = response.json()
+        cache['etag'] = response.headers.get('ETag')
+    else:
+        raise RuntimeError(f'Não foi possível verificar atualizações. Status: {response.status_code}')
+    cache.update({'url': url, 'release': release, 'verificado_em': time.time()})
+    try:
+        with open(cache_arquivo, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+    except Exception as e:
+        print(f'Erro ao salvar cache de atualização: {e}')
+    return release
+
+
+def hash_publicado(release, asset):
+    """
+    Procura o SHA-256 publicado do executável, nesta ordem: campo `digest`
+    do asset, arquivo `<nome>.sha256` / `SHA256SUMS` na release, ou uma linha
+    'SHA256: <hash>' no texto da release.
+    """
+    digest = asset.get('digest') or ''
+    if digest.startswith('sha256:'):
+        return digest.split(':', 1)[1].lower()
+    nomes_hash = (f"{asset['name']}.sha256", 'SHA256SUMS', 'SHA256SUMS.txt', 'checksums.txt')
+    for outro in release.get('assets', []):
+        if outro['name'] in nomes_hash:
+            response = requests.get(outro['browser_download_url'], headers=HEADERS_ATUALIZACAO,
+                                    timeout=ATUALIZACAO_TIMEOUT)
+            response.raise_for_status()
+            for linha in response.text.splitlines():
+                partes = linha.split()
+                if partes and re.fullmatch(r'[0-9a-fA-F]{64}', partes[0]) and (
+                        len(partes) == 1 or partes[-1].lstrip('*') == asset['name']):
+                    return partes[0].lower()
+    match = re.search(r'sha-?256\W+([0-9a-fA-F]{64})', release.get('body') or '', re.IGNORECASE)
+    return match.group(1).lower() if match else None
+
+
+def baixar_com_retomada(url, destino, progresso=None):
+    """
+    Baixa `url` para `destino` retomando de onde parou (HTTP Range) se já
+    existir um download parcial. O tamanho dos blocos se adapta à velocidade
+    do link. Retorna o caminho do arquivo completo.
+    """
+    parcial = destino + '.part'
+    ja_baixado = os.path.getsize(parcial) if os.path.exists(parcial) else 0
+    headers = dict(HEADERS_ATUALIZACAO, Accept='application/octet-stream')
+    if ja_baixado:
+        headers['Range'] = f'bytes={ja_baixado}-'
+    with requests.get(url, headers=headers, stream=True, timeout=ATUALIZACAO_TIMEOUT) as response:
+        if response.status_code == 416:
+            # Range além do fim: o parcial já está completo
+            os.replace(parcial, destino)
+            return destino
+        if response.status_code == 200:
+            ja_baixado = 0  # servidor ignorou o Range: recomeçar
+        elif response.status_code != 206:
+            raise RuntimeError(f'Falha ao baixar atualização. Status: {response.status_code}')
+        total = ja_baixado + int(response.headers.get('Content-Length', 0) or 0)
+        chunk = ATUALIZACAO_CHUNK_INICIAL
+        with open(parcial, 'ab' if ja_baixado else 'wb') as f:
+            while True:
+                inicio = time.monotonic()
+                dados = response.raw.read(chunk, decode_content=True)
+                if not dados:
+                    break
+                f.write(dados)
+                ja_baixado += len(dados)
+                duracao = time.monotonic() - inicio
+                if duracao < 0.25:
+                    chunk = min(chunk * 2, ATUALIZACAO_CHUNK_MAXIMO)
+                elif duracao > 1.0:
+                    chunk = max(chunk // 2, ATUALIZACAO_CHUNK_MINIMO)
+                if progresso and total:
+                    progresso(min(99, ja_baixado * 100 // total))
+    if total and ja_baixado < total:
+        raise RuntimeError('Download interrompido; será retomado na próxima tentativa')
+    os.replace(parcial, destino)
+    return destino
+
+
+def sha256_arquivo(caminho):
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
@@ -0,0 +1,240 @@
+"""
+Carga inicial retomável de anos de arquivos, com checkpoint, nova tentativa das falhas e ETA
+"""
+import os
+import json
+import time
+import itertools
+
+from nfce_ciclo import arquivos_xml, CopiadorNotas, ItemPlano
+from nfce_destinos import MapaDestinos
+from nfce_layout import extrair_ano_da_origem, extrair_pdv_do_arquivo
+from nfce_limites import LimitadorTaxa
+from nfce_validacao import validar_em_lote
+
+
+CARGA_FILE = 'carga_inicial_nfce.json'
+
+# Arquivos por lote da carga inicial (o checkpoint é gravado ao fim de cada lote)
+CARGA_LOTE = 2000
+
+
+def pastas_mes_origem(origem, apos=None):
+    """
+    Pastas de mês da origem, em ordem estável: [(pasta_ano, pasta_mes, caminho)].
+    A origem pode ser a pasta de um ano (com as subpastas `Mes XX`) ou uma
+    pasta com vários `Ano XXXX`. Só lista diretórios, sem abrir os meses.
+    Com `apos` (cursor), os meses inteiros já processados ficam de fora.
+    """
+    with os.scandir(origem) as entradas:
+        subpastas = sorted(e.name for e in entradas if e.is_dir())
+    if any(nome.lower().startswith('mes') for nome in subpastas):
+        anos = [('', origem)]
+    else:
+        anos = [(nome, os.path.join(origem, nome)) for nome in subpastas if nome.lower().startswith('ano')]
+
+    pastas = []
+    for pasta_ano, caminho_ano in anos:
+        with os.scandir(caminho_ano) as entradas:
+            meses = sorted(e.name for e in entradas if e.is_dir() and e.name.lower().startswith('mes'))
+        pastas.extend((pasta_ano, pasta_mes, os.path.join(caminho_ano, pasta_mes)) for pasta_mes in meses
+                      if not apos or [pasta_ano, pasta_mes] >= apos[:2])
+    return pastas
+
+
+def enumerar_origem(origem, apos=None, ao_listar=None):
+    """
+    Percorre a origem sob demanda, em ordem estável, gerando
+    (cursor, arquivo, caminho, ano, mes, tamanho, mtime), um mês por vez.
+    O cursor [pasta_ano, pasta_mes, arquivo] permite retomar depois de `apos`.
+    `ao_listar(pasta_ano, pasta_mes, quantidade)` é chamado ao listar cada
+    mês, com quantos arquivos dele ainda serão gerados.
+    """
+    for pasta_ano, pasta_mes, caminho_mes in pastas_mes_origem(origem, apos):
+        ano = extrair_ano_da_origem(os.path.dirname(caminho_mes))
+        arquivos = arquivos_xml(caminho_mes)
+        nomes = [arquivo for arquivo in sorted(arquivos) if not apos or [pasta_ano, pasta_mes, arquivo] > apos]
+        if ao_listar:
+            ao_listar(pasta_ano, pasta_mes, len(nomes))
+        for arquivo in nomes:
+            yield ([pasta_ano, pasta_mes, arquivo], arquivo, os.path.join(caminho_mes, arquivo),
+                   ano, pasta_mes.upper(), arquivos[arquivo].st_size, arquivos[arquivo].st_mtime)
+
+
+def _ler_carga(caminho):
+    if not os.path.exists(caminho):
+        return None
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f'Erro ao ler checkpoint da carga inicial: {e}')
+        return None
+
+
+def _salvar_carga(caminho, estado):
+    try:
+        temporario = caminho + '.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(estado, f, ensure_ascii=False, indent=4)
+        os.replace(temporario, caminho)
+    except Exception as e:
+        print(f'Erro ao salvar checkpoint da carga inicial: {e}')
+
+
+def _entradas_falhas(origem, estado, repetidas):
+    """
+    As notas de estado['falhas'] (cursores [pasta_ano, pasta_mes, arquivo]) no
+    formato de enumerar_origem, para uma nova tentativa; marca cada uma em
+    `repetidas`. A lista é lida só quando a enumeração da origem termina.
+    """
+    for pasta_ano, pasta_mes, arquivo in list(estado['falhas']):
+        caminho_mes = os.path.join(origem, pasta_ano, pasta_mes)
+        caminho = os.path.join(caminho_mes, arquivo)
+        try:
+            stat = os.stat(caminho)
+        except FileNotFoundError:
+            # Saiu da origem: não há mais o que copiar
+            estado['falhas'].remove([pasta_ano, pasta_mes, arquivo])
+            estado['erros'] -= 1
+            continue
+        except OSError:
+            stat = None
+        repetidas.add((pasta_ano, pasta_mes, arquivo))
+        yield ([pasta_ano, pasta_mes, arquivo], arquivo, caminho, extrair_ano_da_origem(os.path.dirname(caminho_mes)),
+               pasta_mes.upper(), stat.st_size if stat else 0, stat.st_mtime if stat else 0)
+
+
+def carga_pendente(caminho=CARGA_FILE):
+    """Estado de uma carga inicial interrompida (ou None)"""
+    estado = _ler_carga(caminho)
+    return estado if estado and not estado.get('concluida') else None
+
+
+def executar_carga_inicial(origem, destino_base, config=None, progresso=None, parar=None,
+                           indice=None, lacunas=None, replicador=None, limitador=None,
+                           checkpoint=CARGA_FILE, lote=CARGA_LOTE, reiniciar=False):
+    """
+    Carga inicial (backfill) de uma origem com anos de XMLs arquivados.
+    Enumera a origem sob demanda (enumerar_origem), valida cada lote no pool
+    de processos e grava pelo CopiadorNotas, sem sobrescrever. Ao fim de cada
+    lote grava o cursor em `checkpoint`: se o app fechar, a próxima execução
+    com a mesma origem continua de onde parou.
+    `progresso(processados, total, arquivos_por_segundo, eta_segundos)` é
+    chamado a cada lote; `parar()` interrompe entre lotes ou durante a espera
+    do limite de I/O. O total é estimado sem percorrer a origem: os meses já
+    listados contam pelo número real de arquivos, os demais pela média dos
+    listados, e a estimativa se ajusta a cada mês.
+    Notas com erro (leitura, gravação) ficam em estado['falhas'] e são
+    tentadas de novo ao fim da enumeração; a carga só conclui sem falhas
+    pendentes, senão a próxima execução as tenta outra vez.
+    As cópias passam pelo `limitador` (LimitadorTaxa; sem ele, um próprio da
+    carga, de `carga_limite_kb_s`/`carga_limite_arquivos_s`, sem limite por
+    padrão), separado do limite do monitoramento.
+    Pode rodar junto com o monitoramento: se os dois gravarem o mesmo arquivo,
+    o segundo recebe FileExistsError e conta como já existente.
+    Retorna o estado final (contadores e cursor).
+    """
+    config = config or {}
+    mapa = MapaDestinos.de_config(destino_base, config)
+    estado = None if reiniciar else _ler_carga(checkpoint)
+    if not estado or estado.get('origem') != origem or estado.get('concluida'):
+        estado = {
+            'origem': origem, 'destino': destino_base, 'cursor': None, 'concluida': False,
+            'processados': 0, 'copiados': 0, 'existentes': 0, 'invalidos': 0, 'erros': 0,
+        }
+    estado.setdefault('falhas', [])  # cursores das notas com erro, a tentar de novo
+    limitador = limitador or LimitadorTaxa.de_config(config, 'carga_')
+    baixa_prioridade = config.get('baixa_prioridade', False)
+    contagens = {'Copiado': 'copiados', 'Já existe': 'existentes', 'XML Inválido': 'invalidos', 'Erro': 'erros'}
+    cursores = {}  # arquivo -> cursor, das notas do lote atual
+    novas_falhas = []
+
+    def evento(arquivo, status, pdv, mes, erro=None, tamanho=0):
+        chave = contagens.get('Erro' if status.startswith('Erro') else status)
+        if chave:
+            estado[chave] += 1
+        if chave == 'erros' and arquivo in cursores:
+            novas_falhas.append(cursores[arquivo])
+        if chave in ('invalidos', 'erros'):
+            print(f'Carga inicial: {status} {arquivo}' + (f': {erro}' if erro else ''))
+
+    copiador = CopiadorNotas(mapa, config, evento, indice, lacunas, replicador)
+    # Estimativa do total: só as pastas de mês são listadas de início
+    meses = len(pastas_mes_origem(origem, estado['cursor']))
+    listados = {}
+
+    def ao_listar(pasta_ano, pasta_mes, quantidade):
+        listados[(pasta_ano, pasta_mes)] = quantidade
+
+    # Depois da origem, as falhas (inclusive as desta execução) são tentadas de novo
+    repetidas = set()
+    fonte = itertools.chain(enumerar_origem(origem, estado['cursor'], ao_listar),
+                            _entradas_falhas(origem, estado, repetidas))
+    inicio = time.monotonic()
+    processados_sessao = 0
+    while not (parar and parar()):
+        bloco = list(itertools.islice(fonte, lote))
+        if not bloco:
+            estado['concluida'] = not estado['falhas']
+            estado['total'] = estado['processados']
+            break
+        cursores.clear()
+        cursores.update((arquivo, cursor) for cursor, arquivo, *_ in bloco)
+        # Uma falha tentada de novo sai da contagem de erros; se falhar outra vez, volta
+        estado['erros'] -= sum(1 for cursor, *_ in bloco if tuple(cursor) in repetidas)
+
+        # Uma listagem por pasta de destino do lote (em todos os shards)
+        existentes = {}
+        pendentes = []
+        for posicao, (_, arquivo, caminho, ano, mes, tamanho, mtime) in enumerate(bloco):
+            pdv = extrair_pdv_do_arquivo(arquivo)
+            pasta_destino = mapa.pasta(ano, pdv, mes, arquivo, mtime)
+            if pasta_destino not in existentes:
+                existentes[pasta_destino] = set().union(
+                    *(mapa.listar(pasta) for pasta in mapa.pastas_equivalentes(ano, pdv, mes, arquivo, mtime))
+                )
+            if arquivo not in existentes[pasta_destino]:
+                pendentes.append((posicao, ItemPlano(arquivo, caminho, ano, mes, pdv, pasta_destino,
+                                                     os.path.join(pasta_destino, arquivo), tamanho, False, mtime)))
+
+        validacoes = validar_em_lote([item.caminho_arquivo for _, item in pendentes],
+                                     baixa_prioridade=baixa_prioridade, com_dados=True)
+        feitos = len(bloco)
+        for posicao, item in pendentes:
+            # Parar durante a espera do limite encerra o lote antes deste arquivo
+            if not limitador.consumir(item.tamanho, parar):
+                feitos = posicao
+                break
+            # Se o monitoramento copiou antes, conta como já existente
+            copiador.copiar(item, validacoes[item.caminho_arquivo])
+        copiador.concluir()
+        estado['existentes'] += feitos - sum(1 for posicao, _ in pendentes if posicao < feitos)
+        for chave in ('deduplicados', 'bytes_economizados'):
+            if copiador.contadores[chave]:
+                estado[chave] = estado.get(chave, 0) + copiador.contadores.pop(chave)
+
+        feitas = {tuple(cursor) for cursor, *_ in bloco[:feitos]}
+        estado['erros'] += sum(1 for cursor, *_ in bloco[feitos:] if tuple(cursor) in repetidas)
+        estado['falhas'] = [cursor for cursor in estado['falhas'] if tuple(cursor) not in feitas] + novas_falhas
+        novas_falhas.clear()
+        if not feitos:
+            break
+        novas = [cursor for cursor, *_ in bloco[:feitos] if tuple(cursor) not in repetidas]
+        if novas:
+            estado['cursor'] = novas[-1]
+        estado['processados'] += len(novas)
+        processados_sessao += len(novas)
+        media = sum(listados.values()) / len(listados)
+        restantes = max(sum(listados.values()) - processados_sessao, 0) + round((meses - len(listados)) * media)
+        estado['total'] = estado['processados'] + restantes
+        if indice:
+            indice.confirmar()
+        _salvar_carga(checkpoint, estado)
+
+        if progresso:
+            taxa = processados_sessao / max(time.monotonic() - inicio, 0.001)
+            progresso(estado['processados'], estado['total'], taxa, restantes / taxa if taxa else -1)
+
+    _salvar_carga(checkpoint, estado)
+    return estado
@@ -0,0 +1,429 @@
+"""
+Peças do ciclo de cópia sem interface: planejamento por pasta de destino,
+prioridade do mês corrente, cópia em grupos pelo destino, verificação
+direcionada e reconciliação de origem e destino
+"""
+import os
+import datetime
+import threading
+import time
+import re
+import collections
+import fnmatch
+import concurrent.futures
+
+from nfce_destinos import MapaDestinos
+from nfce_historico import AgregadorEventos, registrar_operacao
+from nfce_layout import extrair_ano_da_origem, extrair_pdv_do_arquivo, normalizar_pdv, numero_mes
+from nfce_limites import prioridade_reduzida
+from nfce_validacao import ler_e_validar, status_da_validacao, validar_em_lote
+
+
+def arquivos_xml(pasta, filtro=None):
+    """
+    Lista os XMLs de uma pasta com o stat, via scandir (sem stat extra no Windows).
+    `filtro(nome)` descarta arquivos pelo nome antes de qualquer stat.
+    """
+    arquivos = {}
+    try:
+        with os.scandir(pasta) as entradas:
+            for entrada in entradas:
+                if not entrada.name.lower().endswith('.xml') or (filtro and not filtro(entrada.name)):
+                    continue
+                if entrada.is_file():
+                    arquivos[entrada.name] = entrada.stat()
+    except FileNotFoundError:
+        pass
+    return arquivos
+
+
+ItemPlano = collections.namedtuple(
+    'ItemPlano',
+    'arquivo caminho_arquivo ano mes pdv pasta_destino destino_final tamanho existe mtime'
+)
+
+
+class AlvoVerificacao(collections.namedtuple('AlvoVerificacao', 'pdv mes padrao')):
+    """
+    Recorte para uma verificação direcionada: PDV (PDV-031), mês (10) e/ou
+    padrão de nome (*35251*). Campos None não restringem.
+    """
+
+    def __new__(cls, pdv=None, mes=None, padrao=None):
+        return super().__new__(cls, pdv, mes, padrao)
+
+    @classmethod
+    def interpretar(cls, texto):
+        """Ex.: '031 10', 'PDV-031', 'mes 10', '*3525100277*'"""
+        pdv = mes = padrao = None
+        for parte in re.split(r'[\s,;]+', texto.strip()):
+            if not parte or parte.lower() in ('mes', 'mês'):
+                continue
+            if any(c in parte for c in '*?[') or parte.lower().endswith('.xml'):
+                padrao = parte
+            elif parte.upper().startswith('PDV') or (parte.isdigit() and len(parte) == 3):
+                pdv = normalizar_pdv(parte)
+            elif parte.isdigit() and 1 <= int(parte) <= 12:
+                mes = int(parte)
+            else:
+                raise ValueError(f'Não entendi "{parte}" (use PDV, mês ou padrão de arquivo)')
+        if not (pdv or mes or padrao):
+            raise ValueError('Informe um PDV, um mês ou um padrão de arquivo')
+        return cls(pdv, mes, padrao)
+
+    def aceita_mes(self, pasta_mes):
+        return self.mes is None or numero_mes(pasta_mes) == self.mes
+
+    def aceita_arquivo(self, nome_arquivo):
+        if self.pdv and extrair_pdv_do_arquivo(nome_arquivo) != self.pdv:
+            return False
+        return not self.padrao or fnmatch.fnmatch(nome_arquivo.lower(), self.padrao.lower())
+
+    def descricao(self):
+        partes = [self.pdv or '', f'MES {self.mes:02d}' if self.mes else '', self.padrao or '']
+        return ' '.join(parte for parte in partes if parte)
+
+
+def planejar_ciclo(origem, destino_base, mapa=None, marcas=None, listar_destino=True, alvo=None):
+    """
+    Monta todo o trabalho de um ciclo antes de copiar qualquer arquivo.
+    Retorna {pasta_destino: [ItemPlano, ...]} com as pastas e os arquivos em
+    ordem, para que as cópias de uma mesma pasta fiquem em sequência.
+    Cada pasta de destino é listada uma única vez para saber o que já existe
+    (em todos os shards, quando houver mais de um).
+    Com `marcas` (MarcasNumeracao), só entram os arquivos acima da maior
+    numeração já resolvida de cada PDV/série/mês: as pastas de destino sem
+    candidatos nem são listadas.
+    Com listar_destino=False (destino fora do ar) nada é listado no destino
+    e todos os candidatos saem como não existentes.
+    Com `alvo` (AlvoVerificacao) só entram os meses e arquivos do recorte.
+    """
+    mapa = mapa or MapaDestinos(destino_base)
+    ano = extrair_ano_da_origem(origem)
+    grupos = {}
+    with os.scandir(origem) as subpastas:
+        for subpasta in subpastas:
+            if not (subpasta.is_dir() and subpasta.name.lower().startswith('mes')):
+                continue
+            if alvo and not alvo.aceita_mes(subpasta.name):
+                continue
+            mes = subpasta.name.upper()
+            filtro = None
+            if marcas or alvo:
+                def filtro(nome, mes=mes):
+                    if alvo and not alvo.aceita_arquivo(nome):
+                        return False
+                    return not (marcas and marcas.conhecido(ano, mes, nome))
+            try:
+                for arquivo, stat in arquivos_xml(subpasta.path, filtro).items():
+                    pdv = extrair_pdv_do_arquivo(arquivo)
+                    pasta_destino = mapa.pasta(ano, pdv, mes, arquivo, stat.st_mtime)
+                    grupos.setdefault(pasta_destino, []).append(
+                        (arquivo, os.path.join(subpasta.path, arquivo), ano, mes, pdv,
+                         stat.st_size, stat.st_mtime)
+                    )
+            except Exception as e:
+                print(f'Erro ao processar subpasta {subpasta.name}: {e}')
+
+    plano = {}
+    for pasta_destino in sorted(grupos):
+        arquivo_grupo, _, ano_grupo, mes_grupo, pdv_grupo, _, mtime_grupo = grupos[pasta_destino][0]
+        existentes = set()
+        equivalentes = mapa.pastas_equivalentes(ano_grupo, pdv_grupo, mes_grupo, arquivo_grupo, mtime_grupo)
+        for pasta in equivalentes if listar_destino else ():
+            existentes |= mapa.listar(pasta)
+        plano[pasta_destino] = [
+            ItemPlano(arquivo, caminho, ano_item, mes, pdv, pasta_destino,
+                      os.path.join(pasta_destino, arquivo), tamanho, arquivo in existentes, mtime)
+            for arquivo, caminho, ano_item, mes, pdv, tamanho, mtime in sorted(grupos[pasta_destino])
+        ]
+    return plano
+
+
+def rodar_em_segundo_plano(funcao, *args, **kwargs):
+    """
+    Roda `funcao` numa thread daemon e devolve um Future com o resultado.
+    Daemon para não segurar o fechamento do aplicativo no meio de uma listagem.
+    """
+    futuro = concurrent.futures.Future()
+
+    def rodar():
+        try:
+            futuro.set_result(funcao(*args, **kwargs))
+        except Exception as e:
+            futuro.set_exception(e)
+
+    threading.Thread(target=rodar, daemon=True).start()
+    return futuro
+
+
+class AgendadorTrabalho:
+    """
+    Separa o trabalho pendente do ciclo em prioritário e backlog.
+    Prioritário: arquivos do mês/ano corrente ou modificados dentro da janela
+    de recentes, sempre primeiro e do mais novo para o mais antigo.
+    Backlog: o restante, em ordem de pasta de destino. Com capacidade por
+    ciclo definida, o backlog tem garantida uma fração dela e usa as vagas
+    que o prioritário deixar livres; o que não couber fica para o próximo ciclo.
+    """
+
+    def __init__(self, capacidade=0, fracao_backlog=0.25, janela_recentes=3600):
+        self.capacidade = max(0, int(capacidade))  # arquivos por ciclo; 0 = sem limite
+        self.fracao_backlog = min(max(float(fracao_backlog), 0.0), 1.0)
+        self.janela_recentes = janela_recentes
+
+    @classmethod
+    def de_config(cls, config):
+        return cls(
+            config.get('capacidade_ciclo', 0),
+            config.get('fracao_backlog', 0.25),
+            config.get('janela_recentes', 3600),
+        )
+
+    def prioritario(self, item, agora):
+        if item.ano == agora.year and numero_mes(item.mes) == agora.month:
+            return True
+        return item.mtime >= agora.timestamp() - self.janela_recentes
+
+    def agendar(self, itens, agora=None):
+        """Retorna (prioritarios, backlog, adiados)"""
+        agora = agora or datetime.datetime.now()
+        prioritarios, backlog = [], []
+        for item in itens:
+            (prioritarios if self.prioritario(item, agora) else backlog).append(item)
+        prioritarios.sort(key=lambda item: item.mtime, reverse=True)
+
+        if not self.capacidade:
+            return prioritarios, backlog, []
+
+        # Fração positiva garante ao menos uma vaga; fração 0 não reserva nenhuma
+        reservadas = int(self.capacidade * self.fracao_backlog)
+        if self.fracao_backlog and not reservadas:
+            reservadas = 1
+        vagas_backlog = min(len(backlog), reservadas)
+        vagas_prioritario = self.capacidade - vagas_backlog
+        adiados = prioritarios[vagas_prioritario:]
+        prioritarios = prioritarios[:vagas_prioritario]
+        # Vagas não usadas pelo prioritário vão para o backlog
+        vagas_backlog = self.capacidade - len(prioritarios)
+        adiados += backlog[vagas_backlog:]
+        return prioritarios, backlog[:vagas_backlog], adiados
+
+
+def reconciliar(origem, destino_base, mapa=None):
+    """
+    Compara a origem com o destino por PDV/mês, indexando os arquivos pelo
+    nome (chave de acesso) em dicionários. Usa o mesmo roteamento da cópia
+    (extrair_pdv_do_arquivo / MapaDestinos.pasta) e considera todos os shards.
+    Com layout de destino personalizado só as pastas esperadas são lidas e
+    `sobrando` fica vazio: a pasta não diz a que PDV/mês um arquivo extra pertence.
+    Retorna {(pdv, mes): {'origem', 'destino', 'faltando', 'sobrando', 'tamanho_divergente'}}.
+    """
+    mapa = mapa or MapaDestinos(destino_base)
+    ano = extrair_ano_da_origem(origem)
+
+    # Origem agrupada pela pasta de destino esperada
+    esperado = {}
+    pastas_esperadas = {}
+    with os.scandir(origem) as subpastas:
+        for subpasta in subpastas:
+            if not (subpasta.is_dir() and subpasta.name.lower().startswith('mes')):
+                continue
+            mes = subpasta.name.upper()
+            for arquivo, stat in arquivos_xml(subpasta.path).items():
+                pdv = extrair_pdv_do_arquivo(arquivo)
+                esperado.setdefault((pdv, mes), {})[arquivo] = stat.st_size
+                if not mapa.layout.padrao:
+                    pastas_esperadas.setdefault((pdv, mes), set()).update(
+                        mapa.pastas_equivalentes(ano, pdv, mes, arquivo, stat.st_mtime)
+                    )
+
+    # Destino: as pastas esperadas (layout personalizado) ou todas as
+    # pastas PDV-XXX/MES XX do ano, em todos os shards, pela listagem do
+    # destino (pasta ou remoto)
+    encontrado = {}
+    for grupo, pastas in pastas_esperadas.items():
+        for pasta in pastas:
+            encontrado.setdefault(grupo, {}).update({
+                arquivo: tamanho for arquivo, tamanho in mapa.conteudo(pasta)[1].items()
+                if arquivo in esperado[grupo]
+            })
+    for raiz in (mapa.raizes() if mapa.layout.padrao else ()):
+        pasta_ano = os.path.join(raiz, str(ano))
+        for pdv in mapa.conteudo(pasta_ano)[0]:
+            pasta_pdv = os.path.join(pasta_ano, pdv)
+            for mes in mapa.conteudo(pasta_pdv)[0]:
+                encontrado.setdefault((pdv, mes), {}).update({
+                    arquivo: tamanho for arquivo, tamanho in mapa.conteudo(os.path.join(pasta_pdv, mes))[1].items()
+                    if arquivo.lower().endswith('.xml')
+                })
+
+    relatorio = {}
+    for grupo in sorted(set(esperado) | set(encontrado)):
+        origem_grupo = esperado.get(grupo, {})
+        destino_grupo = encontrado.get(grupo, {})
+        relatorio[grupo] = {
+            'origem': len(origem_grupo),
+            'destino': len(destino_grupo),
+            'faltando': sorted(origem_grupo.keys() - destino_grupo.keys()),
+            'sobrando': sorted(destino_grupo.keys() - origem_grupo.keys()),
+            'tamanho_divergente': sorted(
+                arquivo for arquivo in origem_grupo.keys() & destino_grupo.keys()
+                if origem_grupo[arquivo] != destino_grupo[arquivo]
+            ),
+        }
+    return relatorio
+
+
+class CopiadorNotas:
+    """
+    Cópia de uma nota planejada (ItemPlano) da origem para o destino, com a
+    contabilidade que todo caminho de cópia faz: validação, gravação sem
+    sobrescrever (com deduplicação), réplicas, métricas, índice, numeração e
+    o evento de resultado. O ciclo da interface, a verificação direcionada da
+    linha de comando e a carga inicial usam o mesmo copiador; cada um só
+    decide o que fazer com os eventos:
+    `evento(arquivo, status, pdv, mes, erro=None, tamanho=0)`.
+    A gravação passa pelo destino do MapaDestinos (DestinoLocal ou
+    DestinoRemoto), em grupos do tamanho do pool de conexões (no remoto,
+    enviados em paralelo): copiar() devolve as gravadas quando o grupo enche
+    e concluir() grava o que sobrou.
+    """
+
+    def __init__(self, mapa, config=None, evento=None, indice=None, lacunas=None,
+                 replicador=None, metricas=None, inicio_execucao=0):
+        config = config or {}
+        self.mapa = mapa
+        self.evento = evento or (lambda *args, **kwargs: None)
+        self.indice = indice
+        self.lacunas = lacunas
+        self.replicador = replicador
+        self.metricas = metricas
+        # Só notas gravadas depois do início entram na latência ponta a ponta
+        self.inicio_execucao = inicio_execucao
+        self.baixa_prioridade = config.get('baixa_prioridade', False)
+        self.contadores = collections.Counter()
+        self.envios = []
+
+    def _contar(self, nome, quantidade=1):
+        self.contadores[nome] += quantidade
+        if self.metricas:
+            self.metricas.contar(nome, quantidade)
+
+    def ja_existe(self, item, mostrar=True):
+        if mostrar:
+            self.evento(item.arquivo, 'Já existe', item.pdv, item.mes)
+        if self.lacunas:
+            self.lacunas.registrar(item.arquivo, verificar_duplicado=False)
+
+    def _validar(self, item, validacao):
+        """(metadados, dados) da nota, com os bytes lidos uma única vez, ou None se reprovada"""
+        valido, motivo, metadados, dados = validacao or ler_e_validar(item.caminho_arquivo)
+        if not valido:
+            self.evento(item.arquivo, status_da_validacao(motivo), item.pdv, item.mes, motivo)
+            return None
+        return metadados, dados
+
+    def _copiado(self, item, metadados, dados, gravado_em, duracao):
+        if self.replicador:
+            # A origem é lida uma única vez; os mesmos bytes vão para as réplicas
+            self.replicador.enfileirar(self.mapa.relativo(item.destino_final), item.destino_final, dados)
+        if self.metricas:
+            self.metricas.registrar(item.pdv, 'copia', duracao)
+            if gravado_em >= self.inicio_execucao:
+                self.metricas.registrar(item.pdv, 'ponta_a_ponta', time.time() - gravado_em)
+        self._contar('copiados')
+        self._contar('bytes_copiados', len(dados))
+        if self.indice and metadados:
+            self.indice.registrar(metadados, item.arquivo, item.destino_final, dados)
+        self.evento(item.arquivo, 'Copiado', item.pdv, item.mes, tamanho=len(dados))
+        if self.lacunas and self.lacunas.registrar(item.arquivo):
+            self.evento(item.arquivo, 'Numeração duplicada', item.pdv, item.mes)
+
+    def copiar(self, item, validacao=None, mostrar_ja_existe=True):
+        """
+        Copia uma nota (a validação pode ter sido feita antes, em lote, com
+        validar_em_lote(com_dados=True)): os bytes validados são os gravados.
+        Retorna a lista das notas gravadas nesta chamada.
+        """
+        try:
+            validada = self._validar(item, validacao)
+            if validada is None:
+                return []
+            metadados, dados = validada
+            gravado_em = os.path.getmtime(item.caminho_arquivo)
+        except Exception as e:
+            self.evento(item.arquivo, f'Erro: {e}', item.pdv, item.mes)
+            return []
+        self.envios.append((item, metadados, dados, gravado_em, mostrar_ja_existe))
+        if len(self.envios) >= self.mapa.conexoes * 2:
+            return self.concluir()
+        return []
+
+    def concluir(self):
+        """Grava o grupo pendente; retorna as notas gravadas"""
+        if not self.envios:
+            return []
+        envios, self.envios = self.envios, []
+        inicio = time.perf_counter()
+        with prioridade_reduzida(self.baixa_prioridade):
+            resultados = self.mapa.enviar_lote([
+                (item.destino_final, dados, gravado_em, item.caminho_arquivo) for item, _, dados, gravado_em, _ in envios
+            ])
+        por_arquivo = (time.perf_counter() - inicio) / len(envios)
+        gravados = []
+        for (item, metadados, dados, gravado_em, mostrar_ja_existe), resultado in zip(envios, resultados):
+            if isinstance(resultado, FileExistsError):
+                # Outro caminho (carga inicial, outro nó) gravou antes
+                self.ja_existe(item, mostrar_ja_existe)
+            elif isinstance(resultado, Exception):
+                self.evento(item.arquivo, f'Erro: {resultado}', item.pdv, item.mes)
+            else:
+                if resultado:
+                    # Conteúdo idêntico já armazenado: só um novo hardlink
+                    self._contar('deduplicados')
+                    self._contar('bytes_economizados', len(dados))
+                self._copiado(item, metadados, dados, gravado_em, por_arquivo)
+                gravados.append(item)
+        return gravados
+
+
+def sincronizar_alvo(origem, destino_base, alvo, config=None, indice=None, lacunas=None,
+                     replicador=None, resumo=None, metricas=None):
+    """
+    Verificação direcionada fora da interface: planeja só o recorte (`alvo`),
+    valida em lote e copia pelo CopiadorNotas, como o ciclo da interface.
+    Com `resumo` (ResumoDiario), os resultados vão para o log de operações e
+    o resumo diário: cópias, erros e inválidos com uma linha cada, o resto
+    agregado por PDV/mês.
+    Retorna um Counter por status.
+    """
+    config = config or {}
+    mapa = MapaDestinos.de_config(destino_base, config)
+    resultado = collections.Counter()
+    eventos = AgregadorEventos()
+
+    def evento(arquivo, status, pdv, mes, erro=None, tamanho=0):
+        resultado['Erro' if status.startswith('Erro') else status] += 1
+        if eventos.registrar(pdv, mes, status):
+            if status != 'Copiado':
+                print(f'{arquivo}: {status}' + (f' - {erro}' if erro else ''))
+            if resumo:
+                registrar_operacao(arquivo, status, erro, tamanho=tamanho, resumo=resumo)
+
+    copiador = CopiadorNotas(mapa, config, evento, indice, lacunas, replicador, metricas)
+    itens = [item for itens_pasta in planejar_ciclo(origem, destino_base, mapa, alvo=alvo).values()
+             for item in itens_pasta]
+    for item in itens:
+        if item.existe:
+            copiador.ja_existe(item)
+    pendentes = [item for item in itens if not item.existe]
+    validacoes = validar_em_lote([item.caminho_arquivo for item in pendentes],
+                                 baixa_prioridade=config.get('baixa_prioridade', False), com_dados=True)
+    for item in pendentes:
+        copiador.copiar(item, validacoes[item.caminho_arquivo])
+    copiador.concluir()
+    if resumo:
+        for pdv, mes, status, quantidade in eventos.fechar_ciclo()[0]:
+            registrar_operacao(f'{pdv}/{mes} ({quantidade} arquivos)', status, quantidade=quantidade, resumo=resumo)
+    return resultado
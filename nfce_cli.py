@@ -0,0 +1,610 @@
+"""
+Linha de comando (verificador_nfce.py com argumentos): consultas ao índice,
+reconciliação, lacunas, carga inicial, integridade e manutenção do destino
+"""
+import os
+import json
+import datetime
+import shutil
+import time
+import argparse
+import collections
+import itertools
+import filecmp
+import tempfile
+
+from nfce_carga import CARGA_LOTE, enumerar_origem, executar_carga_inicial
+from nfce_ciclo import AlvoVerificacao, planejar_ciclo, reconciliar, sincronizar_alvo
+from nfce_destinos import destino_eh_remoto, gravar_nota, listar_nomes, MapaDestinos, situacao_blobs
+from nfce_historico import ResumoDiario
+from nfce_indice import IndiceNotas
+from nfce_integridade import INTEGRIDADE_FILE, VerificacaoIntegridade
+from nfce_layout import extrair_pdv_do_arquivo, LayoutDestino, montar_caminho_destino, normalizar_pdv
+from nfce_limites import reduzir_prioridade_thread
+from nfce_metricas import formatar_bytes, formatar_segundos, METRICAS_FILE
+from nfce_numeracao import DetectorLacunas
+from nfce_replicacao import Replicador
+from nfce_validacao import chave_do_nome, validar_em_lote
+
+
+CONFIG_FILE = 'config.json'
+
+
+def carregar_config():
+    """Lê o config.json para uso fora da interface (linha de comando)"""
+    if not os.path.exists(CONFIG_FILE):
+        return {}
+    try:
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f'Erro ao carregar configuração: {e}')
+        return {}
+
+
+def _data_cli(texto):
+    """Aceita DD/MM/AAAA ou AAAA-MM-DD e devolve AAAA-MM-DD"""
+    for formato in ('%d/%m/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(texto, formato).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f'Data inválida: {texto}')
+
+
+def _valor_cli(texto):
+    try:
+        return float(texto.replace('.', '').replace(',', '.') if ',' in texto else texto)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Valor inválido: {texto}')
+
+
+def cli_consultar(args):
+    indice = IndiceNotas()
+    notas = indice.consultar(
+        pdv=args.pdv, data=args.data, data_final=args.data_final, cnpj=args.cnpj,
+        valor_minimo=args.valor_min, valor_maximo=args.valor_max, limite=args.limite
+    )
+    for nota in notas:
+        valor = f"{nota['valor_total']:.2f}" if nota['valor_total'] is not None else '-'
+        print(f"{nota['data_emissao'] or '-'} | {nota['pdv']} | série {nota['serie']} | "
+              f"nº {nota['numero']} | R$ {valor} | cStat {nota['cstat']} | {nota['caminho']}")
+    print(f'{len(notas)} nota(s) encontrada(s)')
+    indice.fechar()
+    return 0
+
+
+def cli_indexar(args):
+    """Indexa os XMLs que já estão no destino (notas copiadas antes do índice existir)"""
+    destino = args.destino or carregar_config().get('destino')
+    if not destino:
+        print('Pasta de destino não configurada')
+        return 1
+    mapa = MapaDestinos.de_config(destino, carregar_config())
+    caminhos = [os.path.join(pasta, arquivo) for pasta, arquivos in mapa.percorrer() for arquivo in sorted(arquivos)]
+    indice = IndiceNotas()
+    indexados = 0
+    # Lidos pelo destino (pasta ou remoto) e validados no pool, em lotes para limitar a memória
+    for inicio in range(0, len(caminhos), CARGA_LOTE):
+        dados = {}
+        for caminho in caminhos[inicio:inicio + CARGA_LOTE]:
+            try:
+                dados[caminho] = mapa.ler(caminho)
+            except OSError as e:
+                print(f'Erro ao ler {caminho}: {e}')
+        for caminho, (valido, _, metadados) in validar_em_lote(dados, dados=dados).items():
+            if valido and metadados:
+                indice.registrar(metadados, os.path.basename(caminho), caminho, dados[caminho])
+                indexados += 1
+    indice.fechar()
+    print(f'{indexados} de {len(caminhos)} arquivo(s) indexado(s)')
+    return 0
+
+
+def cli_reconciliar(args):
+    config = carregar_config()
+    origem = args.origem or config.get('origem')
+    destino = args.destino or config.get('destino')
+    if not origem or not destino:
+        print('Pastas de origem e destino não configuradas')
+        return 1
+    inicio = time.perf_counter()
+    relatorio = reconciliar(origem, destino, MapaDestinos.de_config(destino, config))
+    divergencias = 0
+    for (pdv, mes), grupo in relatorio.items():
+        problemas = len(grupo['faltando']) + len(grupo['sobrando']) + len(grupo['tamanho_divergente'])
+        divergencias += problemas
+        situacao = 'OK' if not problemas else 'DIVERGENTE'
+        print(f"{pdv}/{mes}: origem {grupo['origem']} | destino {grupo['destino']} | "
+              f"faltando {len(grupo['faltando'])} | sobrando {len(grupo['sobrando'])} | "
+              f"tamanho divergente {len(grupo['tamanho_divergente'])} | {situacao}")
+        if args.detalhes:
+            for rotulo in ('faltando', 'sobrando', 'tamanho_divergente'):
+                for arquivo in grupo[rotulo]:
+                    print(f'    {rotulo}: {arquivo}')
+    print(f'{divergencias} divergência(s) em {len(relatorio)} pasta(s) PDV/mês '
+          f'({time.perf_counter() - inicio:.1f}s)')
+    return 1 if divergencias else 0
+
+
+def cli_lacunas(args):
+    if args.varrer:
+        destino = args.destino or carregar_config().get('destino')
+        if not destino:
+            print('Pasta de destino não configurada')
+            return 1
+        # Reconstrói a numeração a partir dos nomes no destino (cada arquivo uma vez)
+        detector = DetectorLacunas(carregar=False)
+        for _, arquivos in MapaDestinos.de_config(destino, carregar_config()).percorrer():
+            for arquivo in arquivos:
+                detector.registrar(arquivo)
+    else:
+        detector = DetectorLacunas()
+    total = 0
+    for (pdv, serie), grupo in detector.lacunas().items():
+        if args.pdv and pdv != args.pdv:
+            continue
+        faltando = sum(fim - inicio + 1 for inicio, fim in grupo['faltando'])
+        explicadas = sum(fim - inicio + 1 for inicio, fim in grupo['explicadas'])
+        total += faltando + len(grupo['duplicados'])
+        print(f'{pdv} série {serie:03d}: {faltando} faltando | {explicadas} inutilizada(s) | '
+              f'{len(grupo["duplicados"])} duplicada(s)')
+        for inicio, fim in grupo['faltando']:
+            print(f'    faltando: {inicio}' + (f' a {fim}' if fim != inicio else ''))
+        for numero in grupo['duplicados']:
+            print(f'    duplicada: {numero}')
+    detector.salvar()
+    return 1 if total else 0
+
+
+def cli_planejar(args):
+    """Dry-run: mostra o que o próximo ciclo copiaria, sem copiar nada"""
+    config = carregar_config()
+    origem = args.origem or config.get('origem')
+    destino = args.destino or config.get('destino')
+    if not origem or not destino:
+        print('Pastas de origem e destino não configuradas')
+        return 1
+    plano = planejar_ciclo(origem, destino, MapaDestinos.de_config(destino, config))
+    total_arquivos = total_bytes = 0
+    for pasta_destino, itens in plano.items():
+        pendentes = [item for item in itens if not item.existe]
+        if not pendentes and not args.todos:
+            continue
+        tamanho = sum(item.tamanho for item in pendentes)
+        total_arquivos += len(pendentes)
+        total_bytes += tamanho
+        print(f'{pasta_destino}: {len(pendentes)} a copiar ({formatar_bytes(tamanho)}) | '
+              f'{len(itens) - len(pendentes)} já existente(s)')
+    print(f'Total: {total_arquivos} arquivo(s), {formatar_bytes(total_bytes)} em {len(plano)} pasta(s) de destino')
+    return 0
+
+
+def cli_metricas(args):
+    """Mostra as métricas exportadas pelo aplicativo em execução"""
+    if not os.path.exists(METRICAS_FILE):
+        print('Nenhuma métrica exportada ainda')
+        return 1
+    with open(METRICAS_FILE, 'r', encoding='utf-8') as f:
+        dados = json.load(f)
+    print(f"Gerado em {dados['gerado_em']} (janela de {dados['janela_segundos'] // 60} min)")
+    for nome, valor in sorted(dados['contadores'].items()):
+        print(f'{nome}: {valor}')
+    for pdv, etapas in dados['latencias'].items():
+        for etapa, p in etapas.items():
+            print(f"{pdv} | {etapa} | n={p['n']} | p50 {formatar_segundos(p['p50'])} | "
+                  f"p95 {formatar_segundos(p['p95'])} | p99 {formatar_segundos(p['p99'])}")
+    return 0
+
+
+def rebalancear_shards(mapa, executar=False, indice=None):
+    """
+    Move as pastas ANO/PDV-XXX que estão fora do shard calculado pelo mapa
+    (ex.: depois de acrescentar um shard). Nunca sobrescreve: se o arquivo já
+    existir no shard certo com o mesmo conteúdo (comparado byte a byte), a
+    cópia extra é removida; com conteúdo diferente, fica onde está e é
+    contada como conflito.
+    Sem `executar` apenas conta o que seria movido.
+    Só para destinos em pasta: destino remoto levanta ValueError.
+    Retorna {'arquivos', 'bytes', 'conflitos'}.
+    """
+    if mapa.remoto:
+        raise ValueError('Rebalanceamento requer destino em pasta (destino remoto não tem shards)')
+    resultado = collections.Counter()
+    for raiz in mapa.raizes():
+        if not os.path.isdir(raiz):
+            continue
+        with os.scandir(raiz) as entradas:
+            anos = sorted(e.name for e in entradas if e.is_dir() and e.name.isdigit())
+        for pasta_ano in anos:
+            caminho_ano = os.path.join(raiz, pasta_ano)
+            with os.scandir(caminho_ano) as entradas:
+                pdvs = sorted(e.name for e in entradas if e.is_dir())
+            for pdv in pdvs:
+                raiz_certa = mapa.raiz(int(pasta_ano), pdv)
+                if os.path.normcase(os.path.abspath(raiz_certa)) == os.path.normcase(os.path.abspath(raiz)):
+                    continue
+                for pasta, _, arquivos in os.walk(os.path.join(caminho_ano, pdv)):
+                    relativo = os.path.relpath(pasta, raiz)
+                    pasta_certa = os.path.join(raiz_certa, relativo)
+                    if executar and arquivos:
+                        os.makedirs(pasta_certa, exist_ok=True)
+                    for arquivo in sorted(arquivos):
+                        origem_arquivo = os.path.join(pasta, arquivo)
+                        destino_arquivo = os.path.join(pasta_certa, arquivo)
+                        tamanho = os.path.getsize(origem_arquivo)
+                        if os.path.exists(destino_arquivo):
+                            if not filecmp.cmp(origem_arquivo, destino_arquivo, shallow=False):
+                                resultado['conflitos'] += 1
+                                continue
+                            if executar:
+                                os.remove(origem_arquivo)
+                        elif executar:
+                            shutil.move(origem_arquivo, destino_arquivo)
+                            if indice:
+                                indice.mover(chave_do_nome(arquivo), destino_arquivo)
+                        resultado['arquivos'] += 1
+                        resultado['bytes'] += tamanho
+                if executar:
+                    # Remove as pastas que ficaram vazias no shard antigo
+                    for pasta, _, _ in sorted(os.walk(os.path.join(caminho_ano, pdv)), reverse=True):
+                        try:
+                            os.rmdir(pasta)
+                        except OSError:
+                            pass
+    if indice:
+        indice.confirmar()
+    return resultado
+
+
+def cli_rebalancear(args):
+    config = carregar_config()
+    destino = args.destino or config.get('destino')
+    if not destino:
+        print('Pasta de destino não configurada')
+        return 1
+    if destino_eh_remoto(destino):
+        print('Rebalanceamento requer destino em pasta (destino remoto não tem shards)')
+        return 1
+    mapa = MapaDestinos.de_config(destino, config)
+    if len(mapa.bases) < 2:
+        print('Nenhum shard adicional configurado (shards_destino no config.json)')
+        return 0
+    if not mapa.layout.padrao:
+        print(f'Rebalanceamento só suporta o layout padrão {LayoutDestino.PADRAO} '
+              f'(layout_destino atual: {mapa.layout.template})')
+        return 1
+    indice = IndiceNotas() if args.executar else None
+    resultado = rebalancear_shards(mapa, args.executar, indice)
+    if indice:
+        indice.fechar()
+    acao = 'movido(s)' if args.executar else 'a mover (use --executar para mover)'
+    print(f"{resultado['arquivos']} arquivo(s) {acao}, {formatar_bytes(resultado['bytes'])}, "
+          f"{resultado['conflitos']} conflito(s)")
+    return 1 if resultado['conflitos'] else 0
+
+
+def cli_replicar(args):
+    """Copia para uma réplica tudo o que o destino principal tem e ela não (ex.: réplica nova)"""
+    config = carregar_config()
+    destino = args.destino or config.get('destino')
+    if not destino:
+        print('Pasta de destino não configurada')
+        return 1
+    mapa = MapaDestinos.de_config(destino, config)
+    copiados = 0
+    for pasta, arquivos in mapa.percorrer():
+        pasta_replica = os.path.join(args.replica, 'NFCE', mapa.relativo(pasta))
+        existentes = listar_nomes(pasta_replica)
+        pendentes = sorted(arquivo for arquivo in arquivos if arquivo not in existentes)
+        if pendentes:
+            os.makedirs(pasta_replica, exist_ok=True)
+        for arquivo in pendentes:
+            caminho = os.path.join(pasta, arquivo)
+            # As datas do original só existem no destino em pasta
+            gravar_nota(os.path.join(pasta_replica, arquivo), mapa.ler(caminho), None if mapa.remoto else caminho)
+            copiados += 1
+    print(f'{copiados} arquivo(s) copiado(s) para a réplica {args.replica}')
+    return 0
+
+
+def cli_carga(args):
+    """Carga inicial pela linha de comando, com progresso e retomada pelo checkpoint"""
+    config = carregar_config()
+    destino = args.destino or config.get('destino')
+    if not destino:
+        print('Pasta de destino não configurada')
+        return 1
+    if not os.path.isdir(args.origem):
+        print(f'Pasta de origem não encontrada: {args.origem}')
+        return 1
+
+    def informar(processados, total, taxa, eta):
+        restante = formatar_segundos(eta) if eta >= 0 else '-'
+        print(f'{processados}/{total} | {taxa:.0f} arq/s | restam {restante}')
+
+    indice = IndiceNotas()
+    try:
+        estado = executar_carga_inicial(
+            args.origem, destino, config, progresso=informar, indice=indice,
+            lote=args.lote, reiniciar=args.reiniciar
+        )
+    except KeyboardInterrupt:
+        print('Interrompida: execute de novo para continuar do último lote')
+        return 1
+    finally:
+        indice.fechar()
+    print(f"{estado['copiados']} copiado(s), {estado['existentes']} já existente(s), "
+          f"{estado['invalidos']} inválido(s), {estado['erros']} erro(s)")
+    if estado['falhas']:
+        print(f"{len(estado['falhas'])} nota(s) com erro: execute de novo para tentar outra vez")
+    if estado['copiados']:
+        print("Para atualizar a numeração: python verificador_nfce.py lacunas --varrer")
+    return 0
+
+
+def cli_deduplicacao(args):
+    """Relatório da deduplicação por conteúdo (razão e bytes economizados)"""
+    config = carregar_config()
+    destino = args.destino or config.get('destino')
+    if not destino:
+        print('Pasta de destino não configurada')
+        return 1
+    if destino_eh_remoto(destino):
+        print('Deduplicação requer destino em pasta (destino remoto não guarda blobs)')
+        return 1
+    situacao = situacao_blobs(MapaDestinos.de_config(destino, config).pastas_blobs(), args.limpar)
+    if not situacao['blobs'] and not situacao['orfaos']:
+        print('Nenhum blob encontrado (ative "deduplicar" no config.json)')
+        return 0
+    razao = situacao['bytes_logicos'] / situacao['bytes_fisicos'] if situacao['bytes_fisicos'] else 0
+    print(f"{situacao['referencias']} arquivo(s) em {situacao['blobs']} blob(s) únicos")
+    print(f"Tamanho lógico {formatar_bytes(situacao['bytes_logicos'])} | "
+          f"em disco {formatar_bytes(situacao['bytes_fisicos'])} | razão {razao:.2f}:1")
+    print(f"Economizado: {formatar_bytes(situacao['bytes_economizados'])}")
+    if situacao['orfaos']:
+        acao = 'removido(s)' if args.limpar else 'sem referência (use --limpar para remover)'
+        print(f"{situacao['orfaos']} blob(s) {acao}")
+    return 0
+
+
+def cli_integridade(args):
+    """Verificação de integridade do destino, retomando de onde a última parou"""
+    config = carregar_config()
+    destino = args.destino or config.get('destino')
+    if not destino:
+        print('Pasta de destino não configurada')
+        return 1
+    if args.reiniciar and os.path.exists(INTEGRIDADE_FILE):
+        os.remove(INTEGRIDADE_FILE)
+    reduzir_prioridade_thread()
+    indice = IndiceNotas()
+    verificacao = VerificacaoIntegridade(
+        MapaDestinos.de_config(destino, config), indice,
+        args.origem or config.get('origem'), config.get('replicas_destino', [])
+    )
+    fatia = verificacao.executar_fatia(args.orcamento, reparar=args.reparar)
+    indice.fechar()
+    for problema in fatia['problemas']:
+        print(f"{problema['caminho']}: {problema['motivo']}" + (' (reparado)' if problema['reparado'] else ''))
+    situacao = ('passagem concluída' if fatia['passagem_concluida']
+                else 'interrompida (continua de onde parou na próxima execução)')
+    print(f"{fatia['verificados']} arquivo(s) verificado(s), {len(fatia['problemas'])} problema(s), {situacao}")
+    return 1 if any(not problema['reparado'] for problema in fatia['problemas']) else 0
+
+
+def medir_layout(layout, amostra, repeticoes=1):
+    """
+    Custo por arquivo (µs) de montar e garantir a pasta de destino, para uma
+    amostra de (arquivo, ano, mes, mtime): o caminho fixo de antes
+    (montar_caminho_destino + os.makedirs a cada arquivo) contra o layout
+    compilado com o cache de pastas. As pastas são criadas em uma pasta temporária.
+    """
+    total = len(amostra) * repeticoes
+    resultado = {}
+    with tempfile.TemporaryDirectory() as raiz:
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            for arquivo, ano, mes, mtime in amostra:
+                montar_caminho_destino(raiz, ano, extrair_pdv_do_arquivo(arquivo), mes)
+        resultado['caminho_fixo'] = (time.perf_counter() - inicio) / total * 1e6
+
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            for arquivo, ano, mes, mtime in amostra:
+                layout.construir(raiz, ano, extrair_pdv_do_arquivo(arquivo), mes, arquivo, mtime)
+        resultado['layout'] = (time.perf_counter() - inicio) / total * 1e6
+
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            for arquivo, ano, mes, mtime in amostra:
+                os.makedirs(montar_caminho_destino(raiz, ano, extrair_pdv_do_arquivo(arquivo), mes), exist_ok=True)
+        resultado['caminho_fixo_makedirs'] = (time.perf_counter() - inicio) / total * 1e6
+
+        layout = LayoutDestino(layout.template)  # cache de pastas vazio, só para a medição
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            for arquivo, ano, mes, mtime in amostra:
+                layout.garantir(layout.construir(raiz, ano, extrair_pdv_do_arquivo(arquivo), mes, arquivo, mtime))
+        resultado['layout_garantir'] = (time.perf_counter() - inicio) / total * 1e6
+        resultado['pastas'] = len(layout.pastas_criadas)
+    return resultado
+
+
+def cli_layout(args):
+    """Valida o layout de destino, mostra exemplos e mede o custo por arquivo"""
+    config = carregar_config()
+    try:
+        layout = LayoutDestino(args.template or config.get('layout_destino') or LayoutDestino.PADRAO)
+    except ValueError as e:
+        print(e)
+        return 1
+    origem = args.origem or config.get('origem')
+    amostra = []
+    if origem and os.path.isdir(origem):
+        for _, arquivo, _, ano, mes, _, mtime in itertools.islice(enumerar_origem(origem), args.arquivos):
+            amostra.append((arquivo, ano, mes, mtime))
+    if not amostra:
+        # Sem origem: nomes sintéticos de 10 PDVs, como os da loja
+        agora = time.time()
+        amostra = [
+            (f'3525100277565200012365{pdv:03d}{numero:09d}1{numero:08d}0-NFCe.xml', 2025, 'MES 10', agora)
+            for numero in range(1, args.arquivos // 10 + 1) for pdv in range(31, 41)
+        ]
+    print(f'Layout: {layout.template}')
+    raiz = os.path.join(args.destino or config.get('destino') or '.', 'NFCE')
+    for arquivo, ano, mes, mtime in amostra[:3]:
+        print(f'  {arquivo} -> {layout.construir(raiz, ano, extrair_pdv_do_arquivo(arquivo), mes, arquivo, mtime)}')
+    if args.benchmark:
+        medida = medir_layout(layout, amostra, args.repeticoes)
+        print(f'{len(amostra)} arquivo(s) x {args.repeticoes}, {medida["pastas"]} pasta(s):')
+        print(f'  montar caminho: fixo {medida["caminho_fixo"]:.2f} µs/arquivo | '
+              f'layout {medida["layout"]:.2f} µs/arquivo')
+        print(f'  montar e criar pasta: makedirs a cada arquivo {medida["caminho_fixo_makedirs"]:.2f} µs/arquivo | '
+              f'layout com cache {medida["layout_garantir"]:.2f} µs/arquivo')
+    return 0
+
+
+def cli_resumo(args):
+    """Notas por dia e PDV a partir dos contadores agregados (sem ler o log)"""
+    resumo = ResumoDiario()
+    hoje = datetime.date.today()
+    data_inicial = args.data or hoje.replace(day=1).isoformat()
+    data_final = args.data_final or (args.data if args.data else hoje.isoformat())
+    if args.reconstruir:
+        resumo.contadores.clear()
+        resumo.reconstruir()
+        resumo.salvar()
+    linhas = resumo.consultar(data_inicial, data_final, args.pdv)
+    for (dia, pdv), por_status in linhas.items():
+        contagens = ' | '.join(f'{status} {valores[0]}' for status, valores in sorted(por_status.items()))
+        copiado = por_status.get('Copiado', [0, 0])[1]
+        print(f'{dia} | {pdv} | {contagens} | {formatar_bytes(copiado)} copiados')
+    print(f'{len(linhas)} linha(s) de {data_inicial} a {data_final}')
+    return 0
+
+
+def cli_sincronizar(args):
+    """Verificação direcionada de um PDV, mês e/ou padrão de arquivo"""
+    config = carregar_config()
+    origem = args.origem or config.get('origem')
+    destino = args.destino or config.get('destino')
+    if not origem or not destino:
+        print('Pastas de origem e destino não configuradas')
+        return 1
+    if not (args.pdv or args.mes or args.padrao):
+        print('Informe --pdv, --mes e/ou --padrao')
+        return 1
+    alvo = AlvoVerificacao(args.pdv, args.mes, args.padrao)
+    indice = IndiceNotas()
+    lacunas = DetectorLacunas()
+    resumo = ResumoDiario()
+    replicador = Replicador(config.get('replicas_destino', []), baixa_prioridade=config.get('baixa_prioridade', False))
+    try:
+        resultado = sincronizar_alvo(origem, destino, alvo, config, indice, lacunas, replicador, resumo)
+    finally:
+        indice.fechar()
+        lacunas.salvar()
+        resumo.salvar()
+        # O que não replicou até aqui fica em REPLICACAO_FILE para o monitoramento
+        replicador.encerrar()
+    print(f"{alvo.descricao()}: " + ' | '.join(f'{status} {n}' for status, n in sorted(resultado.items())))
+    return 1 if resultado['Erro'] else 0
+
+
+def executar_cli(argv):
+    parser = argparse.ArgumentParser(prog='verificador_nfce', description='Verificador NFC-e - linha de comando')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    consultar = subparsers.add_parser('consultar', help='Consulta o índice de notas copiadas')
+    consultar.add_argument('--pdv', type=normalizar_pdv, help='Ex.: 031 ou PDV-031')
+    consultar.add_argument('--data', type=_data_cli, help='Data de emissão (DD/MM/AAAA)')
+    consultar.add_argument('--data-final', type=_data_cli, help='Fim do período, junto com --data')
+    consultar.add_argument('--cnpj')
+    consultar.add_argument('--valor-min', type=_valor_cli)
+    consultar.add_argument('--valor-max', type=_valor_cli)
+    consultar.add_argument('--limite', type=int)
+    consultar.set_defaults(funcao=cli_consultar)
+
+    indexar = subparsers.add_parser('indexar', help='Indexa os XMLs já existentes no destino')
+    indexar.add_argument('--destino', help='Padrão: destino do config.json')
+    indexar.set_defaults(funcao=cli_indexar)
+
+    reconciliar_parser = subparsers.add_parser('reconciliar', help='Compara origem e destino por PDV/mês')
+    reconciliar_parser.add_argument('--origem', help='Padrão: origem do config.json')
+    reconciliar_parser.add_argument('--destino', help='Padrão: destino do config.json')
+    reconciliar_parser.add_argument('--detalhes', action='store_true', help='Lista cada arquivo divergente')
+    reconciliar_parser.set_defaults(funcao=cli_reconciliar)
+
+    lacunas = subparsers.add_parser('lacunas', help='Lacunas e duplicidades na numeração por PDV/série')
+    lacunas.add_argument('--pdv', type=normalizar_pdv)
+    lacunas.add_argument('--varrer', action='store_true', help='Reconstrói a numeração a partir do destino')
+    lacunas.add_argument('--destino', help='Padrão: destino do config.json')
+    lacunas.set_defaults(funcao=cli_lacunas)
+
+    planejar = subparsers.add_parser('planejar', help='Dry-run: mostra o plano de cópia do ciclo sem copiar')
+    planejar.add_argument('--origem', help='Padrão: origem do config.json')
+    planejar.add_argument('--destino', help='Padrão: destino do config.json')
+    planejar.add_argument('--todos', action='store_true', help='Inclui pastas sem nada a copiar')
+    planejar.set_defaults(funcao=cli_planejar)
+
+    rebalancear = subparsers.add_parser('rebalancear', help='Move os dados para o shard correto após mudar os shards')
+    rebalancear.add_argument('--destino', help='Padrão: destino do config.json')
+    rebalancear.add_argument('--executar', action='store_true', help='Move de fato (sem isso só mostra)')
+    rebalancear.set_defaults(funcao=cli_rebalancear)
+
+    replicar = subparsers.add_parser('replicar', help='Completa uma réplica com o que falta do destino principal')
+    replicar.add_argument('replica', help='Pasta da réplica')
+    replicar.add_argument('--destino', help='Padrão: destino do config.json')
+    replicar.set_defaults(funcao=cli_replicar)
+
+    sincronizar = subparsers.add_parser('sincronizar', help='Verifica e copia só um PDV, mês e/ou padrão de arquivo')
+    sincronizar.add_argument('--pdv', type=normalizar_pdv, help='Ex.: 031 ou PDV-031')
+    sincronizar.add_argument('--mes', type=int, choices=range(1, 13), metavar='1-12')
+    sincronizar.add_argument('--padrao', help='Padrão do nome do arquivo, ex.: "*3525100277*"')
+    sincronizar.add_argument('--origem', help='Padrão: origem do config.json')
+    sincronizar.add_argument('--destino', help='Padrão: destino do config.json')
+    sincronizar.set_defaults(funcao=cli_sincronizar)
+
+    carga = subparsers.add_parser('carga', help='Carga inicial de uma pasta com arquivos antigos (retomável)')
+    carga.add_argument('origem', help='Pasta de um ano (com Mes XX) ou com várias pastas Ano XXXX')
+    carga.add_argument('--destino', help='Padrão: destino do config.json')
+    carga.add_argument('--lote', type=int, default=CARGA_LOTE, help='Arquivos por lote/checkpoint')
+    carga.add_argument('--reiniciar', action='store_true', help='Ignora o checkpoint e começa do início')
+    carga.set_defaults(funcao=cli_carga)
+
+    deduplicacao = subparsers.add_parser('deduplicacao', help='Razão de deduplicação e bytes economizados')
+    deduplicacao.add_argument('--destino', help='Padrão: destino do config.json')
+    deduplicacao.add_argument('--limpar', action='store_true', help='Remove blobs sem nenhum arquivo apontando')
+    deduplicacao.set_defaults(funcao=cli_deduplicacao)
+
+    integridade = subparsers.add_parser('integridade', help='Revalida o destino contra os hashes registrados e a origem')
+    integridade.add_argument('--destino', help='Padrão: destino do config.json')
+    integridade.add_argument('--origem', help='Padrão: origem do config.json')
+    integridade.add_argument('--orcamento', type=float, default=0,
+                             help='Segundos de verificação nesta execução (padrão: a passagem inteira)')
+    integridade.add_argument('--reparar', action='store_true', help='Regrava a partir da origem ou de uma réplica')
+    integridade.add_argument('--reiniciar', action='store_true', help='Começa uma passagem nova do início')
+    integridade.set_defaults(funcao=cli_integridade)
+
+    layout = subparsers.add_parser('layout', help='Valida o layout_destino e mede o custo por arquivo')
+    layout.add_argument('--template', help='Ex.: "{cnpj}/{ano}/{mes_num}/{dia}" (padrão: layout_destino do config.json)')
+    layout.add_argument('--origem', help='Amostra de arquivos (padrão: origem do config.json)')
+    layout.add_argument('--destino', help='Só para os exemplos de caminho')
+    layout.add_argument('--benchmark', action='store_true', help='Mede montar e criar a pasta por arquivo')
+    layout.add_argument('--arquivos', type=int, default=20000, help='Tamanho da amostra')
+    layout.add_argument('--repeticoes', type=int, default=5)
+    layout.set_defaults(funcao=cli_layout)
+
+    resumo = subparsers.add_parser('resumo', help='Operações por dia, PDV e status (padrão: mês atual)')
+    resumo.add_argument('--data', type=_data_cli, help='Início do período (DD/MM/AAAA)')
+    resumo.add_argument('--data-final', type=_data_cli, help='Fim do período')
+    resumo.add_argument('--pdv', type=normalizar_pdv)
+    resumo.add_argument('--reconstruir', action='store_true', help='Recalcula a partir do log.txt')
+    resumo.set_defaults(funcao=cli_resumo)
+
+    metricas = subparsers.add_parser('metricas', help='Mostra as métricas de latência exportadas')
+    metricas.set_defaults(funcao=cli_metricas)
+
+    args = parser.parse_args(argv)
+    return args.funcao(args)
@@ -0,0 +1,173 @@
+"""
+Coordenação entre máquinas que gravam no mesmo destino (leases por ano/PDV/mês)
+"""
+import os
+import json
+import datetime
+import threading
+import time
+import platform
+
+from nfce_destinos import destino_eh_remoto
+
+
+# Arquivos de coordenação entre máquinas que compartilham o destino
+COORDENACAO_PASTA = '.nfce_coordenacao'
+
+
+class CoordenadorNos:
+    """
+    Coordena várias máquinas rodando o app contra o mesmo destino, sem
+    serviço externo: arquivos de lease em destino/.nfce_coordenacao.
+    - Cada nó grava seu batimento (no_<nome>.json, contador) numa thread
+      própria, a cada ttl/4 segundos: um ciclo longo não deixa o lease vencer.
+    - O trabalho é reivindicado por ano/PDV/mês: quem cria primeiro o arquivo
+      <ano>_<PDV>_<MES>.lease (criação exclusiva) fica com ele enquanto estiver vivo.
+    - Um nó é considerado parado quando seu batimento não muda por `ttl`
+      segundos, medidos no relógio de quem observa (sem depender de relógios
+      sincronizados). Aí o lease é tomado: renomear é atômico, só um vence, e
+      quem renomeou confere que tirou mesmo o lease do nó parado (e não o
+      que outro nó acabou de criar) antes de apagá-lo.
+    Com um nó parado, os demais assumem o trabalho dele (hot standby); com
+    todos ativos, o trabalho fica dividido por PDV/mês sem cópias duplicadas.
+    """
+
+    def __init__(self, destino_base, no=None, ttl=60):
+        if destino_eh_remoto(destino_base):
+            raise ValueError('Coordenação entre máquinas requer destino em pasta (os leases são arquivos no destino)')
+        self.pasta = os.path.join(destino_base, COORDENACAO_PASTA)
+        self.destino_base = destino_base
+        self.no = no or platform.node() or 'no'
+        self.ttl = ttl
+        self.batidas = 0
+        self.observados = {}  # no -> (última batida vista, quando mudou no relógio local)
+        self.minhas = set()
+        os.makedirs(self.pasta, exist_ok=True)
+        self.parar = threading.Event()
+        self.batimento()
+        self.thread = threading.Thread(target=self._bater, daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def de_config(cls, destino_base, config):
+        ttl = max(config.get('coordenacao_ttl', 60), 3 * config.get('intervalo', 10))
+        return cls(destino_base, config.get('nome_no'), ttl)
+
+    def _arquivo_lease(self, ano, pdv, mes):
+        return os.path.join(self.pasta, f'{ano}_{pdv}_{mes}.lease')
+
+    def _ler(self, caminho):
+        try:
+            with open(caminho, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _bater(self):
+        while not self.parar.wait(max(self.ttl / 4, 1)):
+            self.batimento()
+
+    def batimento(self):
+        """Sinal de vida do nó"""
+        self.batidas += 1
+        caminho = os.path.join(self.pasta, f'no_{self.no}.json')
+        try:
+            temporario = f'{caminho}.tmp'
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump({'no': self.no, 'pid': os.getpid(), 'batida': self.batidas,
+                           'leases': len(self.minhas)}, f)
+            os.replace(temporario, caminho)
+        except OSError as e:
+            print(f'Erro ao gravar batimento do nó: {e}')
+
+    def vivo(self, no):
+        if no == self.no:
+            return True
+        dados = self._ler(os.path.join(self.pasta, f'no_{no}.json'))
+        if dados is None:
+            return False
+        agora = time.monotonic()
+        batida, visto_em = self.observados.get(no, (None, agora))
+        if dados.get('batida') != batida:
+            self.observados[no] = (dados.get('batida'), agora)
+            # Primeira observação: ainda não dá para saber, aguarda o ttl
+            return True
+        return agora - visto_em < self.ttl
+
+    def reivindicar(self, ano, pdv, mes):
+        """True se este nó pode trabalhar no ano/PDV/mês (lease dele ou tomado agora)"""
+        caminho = self._arquivo_lease(ano, pdv, mes)
+        for _ in range(2):
+            try:
+                with open(caminho, 'x', encoding='utf-8') as f:
+                    json.dump({'no': self.no, 'desde': datetime.datetime.now().isoformat(timespec='seconds')}, f)
+                self.minhas.add(caminho)
+                return True
+            except FileExistsError:
+                pass
+            dados = self._ler(caminho)
+            if dados is None:
+                continue  # lease sendo criado ou tomado neste instante
+            dono = dados.get('no')
+            if dono == self.no:
+                self.minhas.add(caminho)
+                return True
+            if self.vivo(dono):
+                self.minhas.discard(caminho)
+                return False
+            # Dono parado: tirar o lease do caminho (atômico) e criar o nosso
+            antigo = f'{caminho}.{self.no}.antigo'
+            try:
+                os.replace(caminho, antigo)
+            except FileNotFoundError:
+                continue  # outro nó tomou antes; tentar de novo ler quem ficou
+            except OSError as e:
+                print(f'Erro ao assumir lease {caminho}: {e}')
+                return False
+            retirado = self._ler(antigo)
+            for _ in range(3):
+                if retirado is not None:
+                    break
+                time.sleep(0.05)  # lease novo ainda sendo escrito por quem o criou
+                retirado = self._ler(antigo)
+            if retirado != dados:
+                # Outro nó tomou o lease entre a leitura e o rename: o arquivo
+                # retirado é o lease novo dele, que volta para o lugar
+                self._devolver(caminho, antigo, retirado)
+                return False
+            try:
+                os.remove(antigo)
+            except OSError as e:
+                print(f'Erro ao assumir lease {caminho}: {e}')
+                return False
+        return False
+
+    def _devolver(self, caminho, antigo, dados):
+        try:
+            if dados is not None:
+                with open(caminho, 'x', encoding='utf-8') as f:
+                    json.dump(dados, f)
+        except FileExistsError:
+            pass  # já há um lease novo no lugar; o dono retirado perde no próximo ciclo
+        except OSError as e:
+            print(f'Erro ao devolver lease {caminho}: {e}')
+        try:
+            os.remove(antigo)
+        except OSError:
+            pass
+
+    def encerrar(self):
+        """Libera os leases deste nó para que os outros assumam sem esperar o ttl"""
+        self.parar.set()
+        for caminho in list(self.minhas):
+            dados = self._ler(caminho)
+            if dados and dados.get('no') == self.no:
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+        self.minhas.clear()
+        try:
+            os.remove(os.path.join(self.pasta, f'no_{self.no}.json'))
+        except OSError:
+            pass
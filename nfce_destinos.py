@@ -0,0 +1,789 @@
+"""
+Destinos das notas: pasta local ou remoto (HTTP, S3), shards por PDV/ano,
+gravação sem sobrescrever, deduplicação por conteúdo e o spool local usado
+enquanto o destino está fora
+"""
+import os
+import json
+import shutil
+import threading
+import time
+import hashlib
+import collections
+import errno
+import concurrent.futures
+import requests
+import urllib.parse
+
+# Destino em armazenamento de objetos (S3 e compatíveis) é opcional: requer boto3
+try:
+    import boto3
+    import botocore.config
+    import botocore.exceptions
+except ImportError:
+    boto3 = None
+
+from nfce_layout import LayoutDestino
+
+
+# Spool local usado enquanto o destino (compartilhamento de rede) está fora
+SPOOL_PASTA = 'spool_nfce'
+SPOOL_MAXIMO = 5000  # notas; `spool_maximo` no config.json, 0 = sem limite
+# Blobs da deduplicação por conteúdo, ao lado da pasta NFCE de cada destino
+BLOBS_PASTA = '.nfce_blobs'
+
+
+class MapaDestinos:
+    """
+    Resolve em qual raiz de destino fica cada (ano, PDV).
+    Sem shards configurados tudo vai para destino/NFCE, como sempre.
+    Com `shards_destino` no config.json, a pasta de destino da interface é o
+    shard 0 e as pastas da lista são os seguintes. A escolha usa a tabela
+    explícita `tabela_shards` ("ANO/PDV-XXX" ou "PDV-XXX" -> índice) e, fora
+    dela, hash de rendezvous: ao acrescentar um shard só os (ano, PDV) que
+    passam a pertencer a ele mudam de lugar.
+    """
+
+    def __init__(self, destino_base, shards=None, tabela=None, layout=None, remoto=None, deduplicar=False):
+        bases = [destino_base] + [shard for shard in (shards or []) if shard and shard != destino_base]
+        self.bases = bases
+        self.tabela = tabela or {}
+        self.layout = layout or LayoutDestino.compilar()
+        self.remoto = remoto
+        # Um destino por base, todos com a mesma interface (listar, gravar, enviar_lote, disponivel)
+        self.destinos = [remoto] if remoto else [DestinoLocal(base, self.layout, deduplicar) for base in bases]
+        self.conexoes = max(destino.conexoes for destino in self.destinos)
+        self._cache = {}
+
+    @classmethod
+    def de_config(cls, destino_base, config):
+        # Destino remoto (endereço http(s):// ou s3://) não tem shards
+        remoto = DestinoRemoto.de_config(destino_base, config)
+        return cls(destino_base, None if remoto else config.get('shards_destino'), config.get('tabela_shards'),
+                   LayoutDestino.compilar(config.get('layout_destino')), remoto, config.get('deduplicar', False))
+
+    def raizes(self):
+        """Todas as raízes NFCE, para buscas e varreduras"""
+        return [os.path.join(base, 'NFCE') for base in self.bases]
+
+    def indice_shard(self, ano, pdv):
+        chave = f'{ano}/{pdv}'
+        indice = self._cache.get(chave)
+        if indice is None:
+            indice = self.tabela.get(chave, self.tabela.get(pdv))
+            if indice is None or not 0 <= int(indice) < len(self.bases):
+                indice = max(range(len(self.bases)), key=lambda i: self._peso(chave, i))
+            indice = self._cache[chave] = int(indice)
+        return indice
+
+    @staticmethod
+    def _peso(chave, indice):
+        # Hash de verdade: o CRC32 é linear e PDVs consecutivos caíam todos no mesmo shard
+        return hashlib.blake2b(f'{chave}|{indice}'.encode(), digest_size=8).digest()
+
+    def raiz(self, ano, pdv):
+        return os.path.join(self.bases[self.indice_shard(ano, pdv)], 'NFCE')
+
+    def pasta(self, ano, pdv, mes, arquivo=None, mtime=None):
+        return self.layout.construir(self.raiz(ano, pdv), ano, pdv, mes, arquivo, mtime)
+
+    def pastas_equivalentes(self, ano, pdv, mes, arquivo=None, mtime=None):
+        """A mesma pasta de destino em todos os shards (dados ainda não rebalanceados)"""
+        return [self.layout.construir(raiz, ano, pdv, mes, arquivo, mtime) for raiz in self.raizes()]
+
+    def _na_raiz(self, caminho):
+        """(destino, caminho abaixo da raiz NFCE) da base que contém `caminho`, ou None"""
+        for raiz, destino in zip(self.raizes(), self.destinos):
+            if caminho == raiz:
+                return destino, ''
+            if caminho.startswith(raiz + os.sep):
+                return destino, caminho[len(raiz) + 1:]
+        return None
+
+    def _destino(self, caminho):
+        return self._na_raiz(caminho) or (self.destinos[0], os.path.basename(caminho))
+
+    def listar(self, pasta):
+        """Nomes já gravados numa pasta de destino; no destino remoto, uma listagem pelo prefixo da pasta"""
+        destino, relativo = self._destino(pasta)
+        return destino.listar(relativo)
+
+    def conteudo(self, pasta):
+        """(subpastas, {arquivo: tamanho}) de uma pasta de destino, numa listagem só"""
+        destino, relativo = self._destino(pasta)
+        return destino.conteudo(relativo)
+
+    def ler(self, caminho):
+        """Bytes de uma nota gravada (FileNotFoundError se não existe)"""
+        destino, relativo = self._destino(caminho)
+        return destino.ler(relativo)
+
+    def existe(self, caminho):
+        na_raiz = self._na_raiz(caminho)
+        if na_raiz is None:
+            return os.path.exists(caminho)  # registrado fora destas raízes (ex.: destino anterior)
+        destino, relativo = na_raiz
+        return destino.existe(relativo)
+
+    def percorrer(self):
+        """
+        (pasta, {arquivo XML: tamanho}) de cada pasta com XMLs abaixo das
+        raízes NFCE, em ordem de caminho, pela listagem do destino (no remoto,
+        uma por pasta): as varreduras da linha de comando valem para os dois
+        """
+        pendentes = list(reversed(self.raizes()))
+        while pendentes:
+            pasta = pendentes.pop()
+            subpastas, arquivos = self.conteudo(pasta)
+            xmls = {nome: tamanho for nome, tamanho in arquivos.items() if nome.lower().endswith('.xml')}
+            if xmls:
+                yield pasta, xmls
+            pendentes.extend(os.path.join(pasta, nome) for nome in sorted(subpastas, reverse=True))
+
+    def gravar(self, destino_final, dados, mtime=None, origem=None):
+        """Grava uma nota sem sobrescrever (FileExistsError se já existe); True se foi deduplicada"""
+        destino, relativo = self._destino(destino_final)
+        return destino.gravar(relativo, dados, mtime, origem)
+
+    def enviar_lote(self, envios):
+        """
+        Grava [(destino_final, dados, mtime, origem), ...], cada um no destino
+        da sua base (no remoto, em paralelo). Retorna, na mesma ordem, o
+        resultado de cada gravação ou a exceção.
+        """
+        por_destino = {}
+        for posicao, (destino_final, *resto) in enumerate(envios):
+            destino, relativo = self._destino(destino_final)
+            por_destino.setdefault(destino, []).append((posicao, (relativo, *resto)))
+        resultados = [None] * len(envios)
+        for destino, grupo in por_destino.items():
+            for (posicao, _), resultado in zip(grupo, destino.enviar_lote([envio for _, envio in grupo])):
+                resultados[posicao] = resultado
+        return resultados
+
+    def relativo(self, destino_final):
+        """Caminho abaixo da raiz NFCE (o mesmo nas réplicas e no spool)"""
+        return self._destino(destino_final)[1]
+
+    def pastas_blobs(self):
+        return [os.path.join(base, BLOBS_PASTA) for base in self.bases]
+
+
+def listar_nomes(pasta):
+    try:
+        return set(os.listdir(pasta))
+    except FileNotFoundError:
+        return set()
+
+
+def _remover_parcial(caminho, tentativas=3):
+    """
+    Remove o arquivo parcial de uma gravação interrompida. Insiste algumas
+    vezes: num compartilhamento instável a remoção também pode falhar, e um
+    parcial esquecido passaria por 'Já existe' nos ciclos seguintes.
+    """
+    for tentativa in range(tentativas):
+        try:
+            os.remove(caminho)
+            return
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            if tentativa == tentativas - 1:
+                print(f'Erro ao remover arquivo parcial {caminho}: {e}')
+            else:
+                time.sleep(0.1 * (tentativa + 1))
+
+
+# Pastas de destino sem hardlink: ali a nota é gravada direto no nome final
+_PASTAS_SEM_HARDLINK = set()
+# Erros de os.link que indicam volume sem hardlink (os demais são falhas de rede/disco)
+_ERROS_SEM_HARDLINK = {errno.EPERM, errno.EXDEV, errno.EMLINK, errno.EINVAL, errno.ENOSYS,
+                       errno.ENOTSUP, errno.EOPNOTSUPP}
+
+
+def _gravar_exclusivo(caminho, dados, caminho_origem=None):
+    """Cria o arquivo com 'xb' (FileExistsError se existir); falha no meio remove o parcial"""
+    with open(caminho, 'xb') as f:
+        try:
+            f.write(dados)
+        except BaseException:
+            f.close()
+            _remover_parcial(caminho)
+            raise
+    if caminho_origem:
+        shutil.copystat(caminho_origem, caminho)
+
+
+def gravar_nota(destino_final, dados, caminho_origem=None, pasta_blobs=None):
+    """
+    Grava os bytes da nota sem nunca sobrescrever e sem deixar parcial no
+    nome final: grava num temporário na mesma pasta (com as datas do
+    original, como o shutil.copy2) e publica com os.link, que falha com
+    FileExistsError se o destino já existir. Onde não há hardlink (ex.:
+    alguns compartilhamentos), grava direto no nome final com 'xb' e
+    remove o parcial se a gravação falhar no meio.
+    Com `pasta_blobs`, grava por conteúdo (gravar_deduplicado) e retorna True
+    quando o conteúdo já existia; sem ela retorna sempre False.
+    """
+    if pasta_blobs:
+        return gravar_deduplicado(destino_final, dados, pasta_blobs, caminho_origem)
+    pasta = os.path.dirname(destino_final)
+    if pasta in _PASTAS_SEM_HARDLINK:
+        _gravar_exclusivo(destino_final, dados, caminho_origem)
+        return False
+    # Nome único: um temporário esquecido (ex.: remoção que falhou) nunca é confundido
+    # com a nota já existente na próxima tentativa
+    temporario = f'{destino_final}.{os.getpid()}.{os.urandom(6).hex()}.tmp'
+    try:
+        _gravar_exclusivo(temporario, dados, caminho_origem)
+        try:
+            os.link(temporario, destino_final)
+        except FileExistsError:
+            raise
+        except OSError as e:
+            if e.errno not in _ERROS_SEM_HARDLINK:
+                raise
+            _PASTAS_SEM_HARDLINK.add(pasta)
+            _gravar_exclusivo(destino_final, dados, caminho_origem)
+    finally:
+        _remover_parcial(temporario)
+    return False
+
+
+# Pastas de blobs em volumes sem hardlink: ali a deduplicação fica desligada
+_BLOBS_SEM_HARDLINK = set()
+
+
+def gravar_deduplicado(destino_final, dados, pasta_blobs, caminho_origem=None):
+    """
+    Armazenamento por conteúdo: um blob por SHA-256 em pasta_blobs
+    (ab/abcdef....xml) e o caminho visível NFCE/ANO/PDV-XXX/MES XX como
+    hardlink para ele, então XMLs idênticos ocupam o disco uma única vez.
+    Retorna True se o blob já existia (bytes economizados). Onde não há
+    hardlink (ex.: FAT32, alguns compartilhamentos) grava uma cópia normal e
+    não guarda blob nenhum: sem link, ele pareceria órfão e `--limpar` o apagaria.
+    """
+    if pasta_blobs in _BLOBS_SEM_HARDLINK:
+        gravar_nota(destino_final, dados, caminho_origem)
+        return False
+    digest = hashlib.sha256(dados).hexdigest()
+    pasta = os.path.join(pasta_blobs, digest[:2])
+    blob = os.path.join(pasta, digest + '.xml')
+    reaproveitado = os.path.exists(blob)
+    if not reaproveitado:
+        os.makedirs(pasta, exist_ok=True)
+        try:
+            gravar_nota(blob, dados, caminho_origem)
+        except FileExistsError:
+            reaproveitado = True  # gravado em paralelo (ex.: carga inicial)
+    try:
+        os.link(blob, destino_final)
+    except FileExistsError:
+        raise
+    except OSError:
+        _BLOBS_SEM_HARDLINK.add(pasta_blobs)
+        if not reaproveitado:
+            _remover_parcial(blob)
+        gravar_nota(destino_final, dados, caminho_origem)
+        return False
+    return reaproveitado
+
+
+def situacao_blobs(pastas_blobs, limpar_orfaos=False):
+    """
+    Percorre os blobs e calcula a deduplicação a partir do número de links:
+    cada blob tem 1 link próprio + 1 por caminho visível. Blobs sem nenhum
+    caminho (ex.: após rebalancear shards) são órfãos e podem ser removidos.
+    """
+    situacao = collections.Counter()
+    for pasta_blobs in pastas_blobs:
+        for pasta, _, arquivos in os.walk(pasta_blobs):
+            for arquivo in arquivos:
+                caminho = os.path.join(pasta, arquivo)
+                stat = os.stat(caminho)  # DirEntry.stat não traz st_nlink no Windows
+                referencias = stat.st_nlink - 1
+                if referencias <= 0:
+                    situacao['orfaos'] += 1
+                    if limpar_orfaos:
+                        os.remove(caminho)
+                    continue
+                situacao['blobs'] += 1
+                situacao['referencias'] += referencias
+                situacao['bytes_fisicos'] += stat.st_size
+                situacao['bytes_logicos'] += stat.st_size * referencias
+    situacao['bytes_economizados'] = situacao['bytes_logicos'] - situacao['bytes_fisicos']
+    return situacao
+
+
+PREFIXOS_REMOTOS = ('http://', 'https://', 's3://')
+
+
+def destino_eh_remoto(destino_base):
+    return destino_base.lower().startswith(PREFIXOS_REMOTOS)
+
+
+class DestinoLocal:
+    """
+    Destino numa pasta (disco local ou compartilhamento de rede), com a
+    mesma interface do DestinoRemoto: listar, conteudo, ler, existe e gravar
+    por caminho abaixo da raiz NFCE, enviar_lote e disponivel. Grava com gravar_nota, sem
+    sobrescrever e com as datas do original (com `deduplicar`, por conteúdo
+    nos blobs do mesmo volume), criando cada pasta uma única vez pelo cache
+    do layout. O lote é gravado em sequência: num disco, paralelismo só
+    disputa a mesma fila de I/O.
+    """
+    conexoes = 1
+    ARQUIVO_SONDA = '.nfce_sonda'
+
+    def __init__(self, base, layout=None, deduplicar=False):
+        self.base = base
+        self.raiz = os.path.join(base, 'NFCE')
+        self.layout = layout or LayoutDestino.compilar()
+        self.pasta_blobs = os.path.join(base, BLOBS_PASTA) if deduplicar else None
+
+    def listar(self, relativo_pasta):
+        return listar_nomes(os.path.join(self.raiz, relativo_pasta))
+
+    def conteudo(self, relativo_pasta):
+        pastas, arquivos = set(), {}
+        try:
+            with os.scandir(os.path.join(self.raiz, relativo_pasta)) as entradas:
+                for entrada in entradas:
+                    if entrada.is_dir():
+                        pastas.add(entrada.name)
+                    elif entrada.is_file():
+                        arquivos[entrada.name] = entrada.stat().st_size
+        except FileNotFoundError:
+            pass
+        return pastas, arquivos
+
+    def ler(self, relativo):
+        with open(os.path.join(self.raiz, relativo), 'rb') as f:
+            return f.read()
+
+    def existe(self, relativo):
+        return os.path.exists(os.path.join(self.raiz, relativo))
+
+    def gravar(self, relativo, dados, mtime=None, origem=None):
+        """True quando o conteúdo já estava nos blobs (só um novo hardlink)"""
+        caminho = os.path.join(self.raiz, relativo)
+        self.layout.garantir(os.path.dirname(caminho))
+        return gravar_nota(caminho, dados, origem, self.pasta_blobs)
+
+    def enviar_lote(self, envios):
+        resultados = []
+        for envio in envios:
+            try:
+                resultados.append(self.gravar(*envio))
+            except Exception as e:
+                resultados.append(e)
+        return resultados
+
+    def disponivel(self):
+        """Grava e apaga um arquivo pequeno na base; retorna (disponivel, motivo)"""
+        try:
+            os.makedirs(self.base, exist_ok=True)  # destino novo; num compartilhamento fora do ar falha
+            caminho = os.path.join(self.base, self.ARQUIVO_SONDA)
+            with open(caminho, 'w', encoding='utf-8') as f:
+                f.write(str(os.getpid()))
+            os.remove(caminho)
+            return True, ''
+        except OSError as e:
+            return False, str(e)
+
+
+class FalhaTransitoria(OSError):
+    """Falha do destino remoto que vale repetir: conexão, tempo esgotado, HTTP 5xx/429"""
+
+
+class DestinoRemoto:
+    """
+    Destino fora do sistema de arquivos (servidor HTTP ou armazenamento de
+    objetos), escolhido pelo endereço na pasta de destino. Cada nota vira um
+    objeto com chave NFCE/<caminho do layout>, a mesma estrutura das pastas.
+    As subclasses implementam _listar, _conteudo, _ler, _existe, _enviar e
+    _sondar; aqui ficam as
+    tentativas com espera crescente e o envio concorrente, num pool de
+    `conexoes` threads que reaproveitam as conexões abertas do cliente.
+    Nunca sobrescreve: _enviar levanta FileExistsError se o objeto já existe.
+    Uma instância por endereço e opções, reaproveitada entre os ciclos.
+    """
+    _instancias = {}
+
+    def __init__(self, endereco, conexoes=8, tentativas=3, timeout=30):
+        self.endereco = endereco.rstrip('/')
+        self.conexoes = max(1, conexoes)
+        self.tentativas = max(1, tentativas)
+        self.timeout = timeout
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.conexoes, thread_name_prefix='destino_remoto')
+
+    @staticmethod
+    def de_config(destino_base, config):
+        """
+        Destino remoto do endereço, com as opções de `destino_remoto` no
+        config.json, ou None quando o destino é uma pasta
+        """
+        if not destino_base or not destino_eh_remoto(destino_base):
+            return None
+        opcoes = config.get('destino_remoto', {})
+        chave = (destino_base, json.dumps(opcoes, sort_keys=True))
+        remoto = DestinoRemoto._instancias.get(chave)
+        if remoto is None:
+            classe = DestinoS3 if destino_base.lower().startswith('s3://') else DestinoHTTP
+            remoto = DestinoRemoto._instancias[chave] = classe(destino_base, **opcoes)
+        return remoto
+
+    @staticmethod
+    def chave(relativo):
+        return '/'.join(filter(None, ('NFCE', relativo.replace(os.sep, '/').strip('/'))))
+
+    def _repetir(self, operacao, *args):
+        for tentativa in range(self.tentativas):
+            try:
+                return operacao(*args)
+            except FalhaTransitoria:
+                if tentativa == self.tentativas - 1:
+                    raise
+                time.sleep(0.2 * 2 ** tentativa)
+
+    def listar(self, relativo_pasta):
+        """Nomes dos objetos de uma pasta: uma listagem por prefixo em vez de uma consulta por nota"""
+        return self._repetir(self._listar, self.chave(relativo_pasta) + '/')
+
+    def conteudo(self, relativo_pasta):
+        """(subpastas, {objeto: tamanho}) de uma pasta, numa listagem pelo prefixo"""
+        return self._repetir(self._conteudo, self.chave(relativo_pasta) + '/')
+
+    def ler(self, relativo):
+        """Bytes do objeto; FileNotFoundError se ele não existe"""
+        return self._repetir(self._ler, self.chave(relativo))
+
+    def existe(self, relativo):
+        return self._repetir(self._existe, self.chave(relativo))
+
+    def gravar(self, relativo, dados, mtime=None, origem=None):
+        """A data do original vai em `mtime`; `origem` é só da interface comum com o DestinoLocal"""
+        self._repetir(self._enviar, self.chave(relativo), dados, mtime)
+
+    def enviar_lote(self, envios):
+        """
+        Envia [(relativo, dados, mtime, origem), ...] em paralelo. Retorna, na
+        mesma ordem, None para cada envio gravado ou a exceção
+        (FileExistsError quando o objeto já existia).
+        """
+        futuros = [self.executor.submit(self.gravar, *envio) for envio in envios]
+        return [futuro.exception() for futuro in futuros]
+
+    def disponivel(self):
+        """Retorna (disponivel, motivo)"""
+        try:
+            self._repetir(self._sondar)
+            return True, ''
+        except Exception as e:
+            return False, str(e)
+
+
+class DestinoHTTP(DestinoRemoto):
+    """
+    Servidor HTTP de arquivo (ex.: o de teste em tests/conftest.py), com o protocolo:
+    - GET <endereço>/<pasta>/ -> lista JSON com os nomes (404 = pasta vazia);
+      com ?detalhes=1, {"pastas": [...], "arquivos": {nome: tamanho}}
+    - GET/HEAD <endereço>/<chave> -> conteúdo da nota (404 = não existe)
+    - PUT <endereço>/<chave> com If-None-Match: * -> 201, ou 412 se já existe
+    - X-Mtime leva a data de modificação do original
+    Uma Session com pool do tamanho de `conexoes` mantém as conexões abertas
+    (keep-alive); `token` vai como Authorization: Bearer.
+    """
+
+    def __init__(self, endereco, conexoes=8, tentativas=3, timeout=30, token=None, **_):
+        super().__init__(endereco, conexoes, tentativas, timeout)
+        self.sessao = requests.Session()
+        adaptador = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.conexoes)
+        self.sessao.mount('http://', adaptador)
+        self.sessao.mount('https://', adaptador)
+        if token:
+            self.sessao.headers['Authorization'] = f'Bearer {token}'
+
+    def _requisitar(self, metodo, chave, **kwargs):
+        url = f'{self.endereco}/{urllib.parse.quote(chave)}'
+        try:
+            resposta = self.sessao.request(metodo, url, timeout=self.timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise FalhaTransitoria(f'{metodo} {chave}: {e}')
+        if resposta.status_code >= 500 or resposta.status_code == 429:
+            raise FalhaTransitoria(f'{metodo} {chave}: HTTP {resposta.status_code}')
+        if resposta.status_code in (401, 403):
+            raise PermissionError(f'{metodo} {chave}: acesso negado (HTTP {resposta.status_code})')
+        return resposta
+
+    def _listar(self, prefixo):
+        resposta = self._requisitar('GET', prefixo)
+        if resposta.status_code == 404:
+            return set()
+        if resposta.status_code != 200:
+            raise OSError(f'Listagem de {prefixo}: HTTP {resposta.status_code}')
+        return set(resposta.json())
+
+    def _conteudo(self, prefixo):
+        resposta = self._requisitar('GET', prefixo, params={'detalhes': '1'})
+        if resposta.status_code == 404:
+            return set(), {}
+        if resposta.status_code != 200:
+            raise OSError(f'Listagem de {prefixo}: HTTP {resposta.status_code}')
+        corpo = resposta.json()
+        return set(corpo['pastas']), dict(corpo['arquivos'])
+
+    def _ler(self, chave):
+        resposta = self._requisitar('GET', chave)
+        if resposta.status_code == 404:
+            raise FileNotFoundError(errno.ENOENT, 'Ausente no destino', chave)
+        if resposta.status_code != 200:
+            raise OSError(f'Leitura de {chave}: HTTP {resposta.status_code}')
+        return resposta.content
+
+    def _existe(self, chave):
+        resposta = self._requisitar('HEAD', chave)
+        if resposta.status_code not in (200, 404):
+            raise OSError(f'Consulta de {chave}: HTTP {resposta.status_code}')
+        return resposta.status_code == 200
+
+    def _enviar(self, chave, dados, mtime):
+        cabecalhos = {'If-None-Match': '*', 'Content-Type': 'application/xml'}
+        if mtime:
+            cabecalhos['X-Mtime'] = str(mtime)
+        resposta = self._requisitar('PUT', chave, data=dados, headers=cabecalhos)
+        if resposta.status_code == 412:
+            raise FileExistsError(errno.EEXIST, 'Já existe no destino', chave)
+        if resposta.status_code not in (200, 201, 204):
+            raise OSError(f'Envio de {chave}: HTTP {resposta.status_code}')
+
+    def _sondar(self):
+        self._requisitar('GET', 'NFCE/')
+
+
+class DestinoS3(DestinoRemoto):
+    """
+    Bucket S3 ou compatível (MinIO, Ceph...), endereço s3://bucket/prefixo.
+    Credenciais pelo padrão do boto3 (variáveis de ambiente, ~/.aws);
+    `s3_endpoint` aponta para um serviço compatível. O cliente é um só,
+    compartilhado entre as threads com pool de `conexoes` conexões, e a
+    gravação usa If-None-Match: * (PreconditionFailed = já existe).
+    """
+
+    def __init__(self, endereco, conexoes=8, tentativas=3, timeout=30, s3_endpoint=None, **_):
+        if boto3 is None:
+            raise RuntimeError('Destino S3 requer o pacote boto3 (pip install boto3)')
+        super().__init__(endereco, conexoes, tentativas, timeout)
+        self.bucket, _, prefixo = self.endereco[len('s3://'):].partition('/')
+        self.prefixo = prefixo.strip('/')
+        # As tentativas ficam com _repetir, iguais para os dois tipos de destino
+        self.cliente = boto3.client('s3', endpoint_url=s3_endpoint, config=botocore.config.Config(
+            max_pool_connections=self.conexoes, connect_timeout=timeout, read_timeout=timeout,
+            retries={'max_attempts': 1}
+        ))
+
+    def _chamar(self, operacao, **kwargs):
+        try:
+            return getattr(self.cliente, operacao)(**kwargs)
+        except botocore.exceptions.ClientError as e:
+            codigo = e.response.get('Error', {}).get('Code', '')
+            status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+            if codigo == 'PreconditionFailed':
+                raise FileExistsError(errno.EEXIST, 'Já existe no destino', kwargs.get('Key'))
+            if codigo in ('NoSuchKey', 'NotFound', '404'):
+                raise FileNotFoundError(errno.ENOENT, 'Ausente no destino', kwargs.get('Key'))
+            if status >= 500 or codigo in ('SlowDown', 'RequestTimeout', 'ConditionalRequestConflict'):
+                raise FalhaTransitoria(f'{operacao}: {e}')
+            raise OSError(f'{operacao}: {e}')
+        except botocore.exceptions.BotoCoreError as e:
+            raise FalhaTransitoria(f'{operacao}: {e}')
+
+    def _objeto(self, chave):
+        return f'{self.prefixo}/{chave}' if self.prefixo else chave
+
+    def _listar(self, prefixo):
+        nomes = set()
+        argumentos = {'Bucket': self.bucket, 'Prefix': self._objeto(prefixo), 'Delimiter': '/'}
+        while True:
+            pagina = self._chamar('list_objects_v2', **argumentos)
+            nomes.update(objeto['Key'].rsplit('/', 1)[-1] for objeto in pagina.get('Contents', []))
+            if not pagina.get('IsTruncated'):
+                return nomes
+            argumentos['ContinuationToken'] = pagina['NextContinuationToken']
+
+    def _conteudo(self, prefixo):
+        pastas, arquivos = set(), {}
+        argumentos = {'Bucket': self.bucket, 'Prefix': self._objeto(prefixo), 'Delimiter': '/'}
+        while True:
+            pagina = self._chamar('list_objects_v2', **argumentos)
+            pastas.update(item['Prefix'].rstrip('/').rsplit('/', 1)[-1] for item in pagina.get('CommonPrefixes', []))
+            arquivos.update((objeto['Key'].rsplit('/', 1)[-1], objeto['Size']) for objeto in pagina.get('Contents', []))
+            if not pagina.get('IsTruncated'):
+                return pastas, arquivos
+            argumentos['ContinuationToken'] = pagina['NextContinuationToken']
+
+    def _ler(self, chave):
+        return self._chamar('get_object', Bucket=self.bucket, Key=self._objeto(chave))['Body'].read()
+
+    def _existe(self, chave):
+        try:
+            self._chamar('head_object', Bucket=self.bucket, Key=self._objeto(chave))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _enviar(self, chave, dados, mtime):
+        self._chamar('put_object', Bucket=self.bucket, Key=self._objeto(chave), Body=dados, IfNoneMatch='*',
+                     ContentType='application/xml', Metadata={'mtime': str(mtime)} if mtime else {})
+
+    def _sondar(self):
+        self._chamar('head_bucket', Bucket=self.bucket)
+
+
+class SondaDestino:
+    """
+    Teste rápido de saúde do destino, feito uma vez por ciclo: o disponivel()
+    de cada destino (pasta: grava e apaga um arquivo pequeno; remoto: consulta
+    o serviço), numa thread com tempo limite. Um
+    compartilhamento que caiu costuma travar cada acesso por dezenas de
+    segundos; com a sonda o ciclo decide em poucos segundos e não arquivo
+    a arquivo. Enquanto uma sonda anterior continuar travada, o destino
+    segue indisponível sem abrir outra thread.
+    """
+    def __init__(self, tempo_limite=3):
+        self.tempo_limite = tempo_limite
+        self.thread = None
+        self.resultado = None
+
+    def _sondar(self, destinos):
+        for destino in destinos:
+            disponivel, motivo = destino.disponivel()
+            if not disponivel:
+                self.resultado = (False, motivo)
+                return
+        self.resultado = (True, '')
+
+    def verificar(self, destinos):
+        """Retorna (disponivel, motivo) de todos os destinos (DestinoLocal/DestinoRemoto)"""
+        if self.thread and self.thread.is_alive():
+            return False, 'sem resposta do destino'
+        self.resultado = None
+        self.thread = threading.Thread(target=self._sondar, args=(destinos,), daemon=True)
+        self.thread.start()
+        self.thread.join(self.tempo_limite)
+        if self.resultado is None:
+            return False, f'sem resposta do destino em {self.tempo_limite}s'
+        return self.resultado
+
+
+class SpoolLocal:
+    """
+    Área local onde as notas já validadas esperam enquanto o destino está
+    fora do ar. Cada nota vira um arquivo na pasta do spool e uma linha no
+    diário (diario.jsonl), na ordem em que chegou. Na volta do destino o
+    spool é esvaziado em paralelo entre pastas de destino, mas em ordem
+    dentro de cada pasta, e sempre com gravar_nota (sem sobrescrever).
+    """
+    DIARIO = 'diario.jsonl'
+
+    def __init__(self, pasta=SPOOL_PASTA):
+        self.pasta = pasta
+        self.diario = os.path.join(pasta, self.DIARIO)
+        self.lock = threading.Lock()
+        self.pendentes = []
+        self.sequencia = 0
+        os.makedirs(pasta, exist_ok=True)
+        if os.path.exists(self.diario):
+            with open(self.diario, 'r', encoding='utf-8') as f:
+                for linha in f:
+                    try:
+                        entrada = json.loads(linha)
+                    except ValueError:
+                        continue  # última linha incompleta (queda durante a gravação)
+                    if os.path.exists(os.path.join(pasta, entrada['spool'])):
+                        self.pendentes.append(entrada)
+            if self.pendentes:
+                self.sequencia = max(entrada['seq'] for entrada in self.pendentes)
+        self.destinos = {entrada['destino'] for entrada in self.pendentes}
+
+    def __len__(self):
+        return len(self.pendentes)
+
+    def contem(self, destino_final):
+        return destino_final in self.destinos
+
+    def cabe(self, item, agendador, agora, maximo=SPOOL_MAXIMO, reservadas=0):
+        """
+        Se a nota do plano pode entrar no spool: só o trabalho prioritário do
+        agendador (mês corrente ou modificado há pouco) e até `maximo` notas
+        (0 = sem limite), contando as `reservadas` do lote em montagem. O que
+        já está no spool sempre cabe.
+        """
+        if self.contem(item.destino_final):
+            return True
+        if maximo and len(self.pendentes) + reservadas >= maximo:
+            return False
+        return agendador.prioritario(item, agora)
+
+    def guardar(self, destino_final, dados, caminho_origem, **dados_entrada):
+        """Guarda a nota no spool e registra no diário (dados_entrada: relativo, pdv, mes...)"""
+        with self.lock:
+            self.sequencia += 1
+            entrada = dict(dados_entrada, seq=self.sequencia, destino=destino_final,
+                           spool=f'{self.sequencia:08d}_{os.path.basename(destino_final)}')
+            gravar_nota(os.path.join(self.pasta, entrada['spool']), dados, caminho_origem)
+            with open(self.diario, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entrada, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.pendentes.append(entrada)
+            self.destinos.add(destino_final)
+
+    def drenar(self, gravar, max_threads=8):
+        """
+        Grava tudo no destino com `gravar(entrada, caminho_no_spool)`.
+        Pastas diferentes em paralelo; dentro da mesma pasta em ordem, parando
+        na primeira falha para não furar a fila. Retorna (gravadas, ja_existiam, falhas).
+        """
+        with self.lock:
+            por_pasta = {}
+            for entrada in self.pendentes:
+                por_pasta.setdefault(os.path.dirname(entrada['destino']), []).append(entrada)
+
+        def drenar_pasta(entradas):
+            gravadas, existentes = [], []
+            for entrada in entradas:
+                try:
+                    gravar(entrada, os.path.join(self.pasta, entrada['spool']))
+                    gravadas.append(entrada)
+                except FileExistsError:
+                    existentes.append(entrada)  # já estava no destino (ex.: outro nó)
+                except Exception as e:
+                    print(f"Erro ao esvaziar spool para {entrada['destino']}: {e}")
+                    return gravadas, existentes, 1
+            return gravadas, existentes, 0
+
+        gravadas, existentes, falhas = [], [], 0
+        if por_pasta:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_threads, len(por_pasta))) as executor:
+                for g, e, f in executor.map(drenar_pasta, por_pasta.values()):
+                    gravadas += g
+                    existentes += e
+                    falhas += f
+
+        concluidas = {entrada['seq'] for entrada in gravadas + existentes}
+        with self.lock:
+            for entrada in gravadas + existentes:
+                try:
+                    os.remove(os.path.join(self.pasta, entrada['spool']))
+                except OSError:
+                    pass
+            self.pendentes = [entrada for entrada in self.pendentes if entrada['seq'] not in concluidas]
+            self.destinos = {entrada['destino'] for entrada in self.pendentes}
+            temporario = self.diario + '.tmp'
+            with open(temporario, 'w', encoding='utf-8') as f:
+                for entrada in self.pendentes:
+                    f.write(json.dumps(entrada, ensure_ascii=False) + '\n')
+            os.replace(temporario, self.diario)
+        return gravadas, existentes, falhas
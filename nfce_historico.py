@@ -0,0 +1,242 @@
+"""
+Histórico de operações (log.txt): registro, leitura com filtros, exportação
+em streaming, resumo diário e agregação dos eventos de cada ciclo
+"""
+import os
+import json
+import datetime
+import threading
+import re
+import csv
+import collections
+
+# Exportação em formato colunar (Parquet) é opcional: requer pyarrow
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from nfce_layout import extrair_pdv_do_arquivo
+
+
+LOG_FILE = 'log.txt'
+RESUMO_FILE = 'resumo_nfce.json'
+
+
+class AgregadorEventos:
+    """
+    Agrega os resultados por arquivo de um ciclo em contagens por (PDV, mês,
+    status). Cópias, erros, XMLs inválidos e duplicidades continuam com uma
+    linha por arquivo; os demais (ex.: 'Já existe', um por arquivo do destino
+    na primeira verificação) viram uma linha de resumo por PDV/mês no fim do ciclo.
+    """
+    DETALHADOS = ('Copiado', 'XML Inválido', 'Numeração duplicada')
+
+    def __init__(self):
+        self.contagens = collections.Counter()
+
+    @classmethod
+    def detalhar(cls, status):
+        return status in cls.DETALHADOS or status.startswith('Erro')
+
+    def registrar(self, pdv, mes, status):
+        """Conta o evento e retorna True se ele deve ter linha própria"""
+        detalhar = self.detalhar(status)
+        self.contagens[(pdv, mes, 'Erro' if status.startswith('Erro') else status)] += 1
+        return detalhar
+
+    def fechar_ciclo(self):
+        """Retorna (resumos, totais) e zera para o próximo ciclo.
+        resumos: [(pdv, mes, status, quantidade)] só dos status agregados;
+        totais: {status: quantidade} de todos os eventos do ciclo."""
+        resumos = [
+            (pdv, mes, status, quantidade)
+            for (pdv, mes, status), quantidade in sorted(self.contagens.items())
+            if not self.detalhar(status)
+        ]
+        totais = collections.Counter()
+        for (_, _, status), quantidade in self.contagens.items():
+            totais[status] += quantidade
+        self.contagens.clear()
+        return resumos, totais
+
+
+COLUNAS_HISTORICO = ('data', 'hora', 'pdv', 'arquivo', 'status', 'erro')
+
+
+def ler_historico(caminho=LOG_FILE, data_inicial=None, data_final=None, status=None, pdv=None):
+    """
+    Lê o log linha a linha (sem carregar o arquivo inteiro) aplicando os filtros.
+    Datas são datetime.date; status 'Erro' inclui as variações 'Erro: ...'.
+    Gera (linha, bytes_lidos) para permitir acompanhar o progresso.
+    """
+    lidos = 0
+    with open(caminho, 'rb') as f:
+        for bruta in f:
+            lidos += len(bruta)
+            partes = bruta.decode('utf-8', errors='replace').rstrip('\r\n').split(' | ')
+            if len(partes) < 3:
+                continue
+            try:
+                data_h, hora_h = partes[0].split(' ')
+                data = datetime.date(int(data_h[6:10]), int(data_h[3:5]), int(data_h[0:2]))
+            except ValueError:
+                continue
+            if data_inicial and data < data_inicial:
+                continue
+            if data_final and data > data_final:
+                continue
+            status_h = partes[2]
+            if status and status != 'Todos':
+                if status == 'Erro' and not status_h.startswith('Erro'):
+                    continue
+                if status != 'Erro' and status_h != status:
+                    continue
+            if partes[1].startswith('PDV-'):
+                pdv_h = partes[1][:7]  # linha de resumo: "PDV-031/MES 10 (1520 arquivos)"
+            else:
+                pdv_h = extrair_pdv_do_arquivo(partes[1])
+            if pdv and pdv_h != pdv:
+                continue
+            erro = ' | '.join(partes[3:])
+            yield (data.isoformat(), hora_h, pdv_h, partes[1], status_h, erro), lidos
+
+
+class ResumoDiario:
+    """
+    Contadores agregados por dia x PDV x status (quantidade e bytes),
+    atualizados a cada operação registrada no log. O painel de resumo e o
+    comando `resumo` leem daqui em tempo constante, sem varrer o log.txt
+    (que, além disso, é truncado ao passar de 1MB).
+    Persistido em RESUMO_FILE como {"AAAA-MM-DD|PDV-XXX|status": [quantidade, bytes]}.
+    """
+    STATUS = ('Copiado', 'Já existe', 'Erro', 'XML Inválido', 'Numeração duplicada', 'Lacuna na numeração')
+
+    def __init__(self, caminho=RESUMO_FILE, log=LOG_FILE):
+        self.caminho = caminho
+        self.lock = threading.Lock()
+        self.contadores = {}
+        self.alterado = False
+        if os.path.exists(caminho):
+            try:
+                with open(caminho, 'r', encoding='utf-8') as f:
+                    dados = json.load(f)
+                self.contadores = {tuple(chave.split('|')): valores for chave, valores in dados.items()}
+            except Exception as e:
+                print(f'Erro ao carregar resumo do histórico: {e}')
+        elif log and os.path.exists(log):
+            # Primeira execução com resumo: aproveita o que ainda está no log
+            self.reconstruir(log)
+
+    def registrar(self, data, pdv, status, quantidade=1, tamanho=0):
+        """data: datetime.date ou AAAA-MM-DD"""
+        chave = (str(data), pdv, 'Erro' if status.startswith('Erro') else status)
+        with self.lock:
+            valores = self.contadores.setdefault(chave, [0, 0])
+            valores[0] += quantidade
+            valores[1] += tamanho
+            self.alterado = True
+
+    def reconstruir(self, log=LOG_FILE):
+        for (data, _, pdv, arquivo, status, _), _ in ler_historico(log):
+            quantidade = re.search(r'\((\d+) arquivos\)$', arquivo)
+            self.registrar(data, pdv, status, int(quantidade.group(1)) if quantidade else 1)
+
+    def consultar(self, data_inicial, data_final, pdv=None):
+        """{(data, pdv): {status: [quantidade, bytes]}} no período (datas AAAA-MM-DD)"""
+        resultado = {}
+        with self.lock:
+            for (data, pdv_c, status), valores in self.contadores.items():
+                if data_inicial <= data <= data_final and (not pdv or pdv_c == pdv):
+                    resultado.setdefault((data, pdv_c), {})[status] = list(valores)
+        return dict(sorted(resultado.items()))
+
+    def salvar(self):
+        with self.lock:
+            if not self.alterado:
+                return
+            dados = {'|'.join(chave): valores for chave, valores in self.contadores.items()}
+            self.alterado = False
+        try:
+            temporario = self.caminho + '.tmp'
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(dados, f, separators=(',', ':'))
+            os.replace(temporario, self.caminho)
+        except Exception as e:
+            print(f'Erro ao salvar resumo do histórico: {e}')
+
+
+def exportar_historico(destino, formato='csv', progresso=None, lote=10000, **filtros):
+    """
+    Exporta o histórico filtrado direto para CSV ou Parquet, em streaming.
+    `progresso` recebe a porcentagem lida do log. Retorna o número de linhas.
+    """
+    total_bytes = max(os.path.getsize(LOG_FILE), 1) if os.path.exists(LOG_FILE) else 1
+    ultimo_percentual = -1
+    linhas = 0
+
+    def informar(lidos):
+        nonlocal ultimo_percentual
+        percentual = lidos * 100 // total_bytes
+        if progresso and percentual != ultimo_percentual:
+            ultimo_percentual = percentual
+            progresso(percentual)
+
+    registros = ler_historico(**filtros) if os.path.exists(LOG_FILE) else iter(())
+
+    if formato == 'parquet':
+        if pyarrow is None:
+            raise RuntimeError('Exportação Parquet requer o pacote pyarrow (pip install pyarrow)')
+        esquema = pyarrow.schema([(coluna, pyarrow.string()) for coluna in COLUNAS_HISTORICO])
+        buffer = []
+        with pyarrow.parquet.ParquetWriter(destino, esquema) as escritor:
+            for linha, lidos in registros:
+                buffer.append(linha)
+                linhas += 1
+                if len(buffer) >= lote:
+                    escritor.write_table(pyarrow.Table.from_pylist(
+                        [dict(zip(COLUNAS_HISTORICO, l)) for l in buffer], schema=esquema))
+                    buffer = []
+                    informar(lidos)
+            if buffer:
+                escritor.write_table(pyarrow.Table.from_pylist(
+                    [dict(zip(COLUNAS_HISTORICO, l)) for l in buffer], schema=esquema))
+    else:
+        # utf-8-sig para o Excel reconhecer a acentuação
+        with open(destino, 'w', newline='', encoding='utf-8-sig') as f:
+            escritor = csv.writer(f, delimiter=';')
+            escritor.writerow(COLUNAS_HISTORICO)
+            for linha, lidos in registros:
+                escritor.writerow(linha)
+                linhas += 1
+                if linhas % lote == 0:
+                    informar(lidos)
+    if progresso:
+        progresso(100)
+    return linhas
+
+
+def registrar_operacao(arquivo, status, erro=None, quantidade=1, tamanho=0, resumo=None, momento=None):
+    """
+    Uma linha no log de operações (o histórico) e a contagem no resumo
+    diário. O log é zerado ao passar de 1MB.
+    """
+    momento = momento or datetime.datetime.now()
+    try:
+        if resumo:
+            pdv = arquivo[:7] if arquivo.startswith('PDV-') else extrair_pdv_do_arquivo(arquivo)
+            resumo.registrar(momento.strftime('%Y-%m-%d'), pdv, status, quantidade, tamanho)
+        
+        # Limitar o tamanho do log a 1MB
+        if os.path.exists(LOG_FILE) and os.path.getsize(LOG_FILE) > 1024 * 1024:
+            with open(LOG_FILE, 'w', encoding='utf-8') as f:
+                f.write('')  # Limpa o log
+        
+        with open(LOG_FILE, 'a', encoding='utf-8') as f:
+            linha = f"{momento.strftime('%d/%m/%Y %H:%M:%S')} | {arquivo} | {status}"
+            if erro:
+                linha += f' | {erro}'
+            f.write(linha + '\n')
+    except Exception as e:
+        print(f'Erro ao registrar log: {e}')
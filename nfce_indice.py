@@ -0,0 +1,138 @@
+"""
+Índice SQLite dos metadados das notas copiadas (chave, emissão, valor, PDV, série, número)
+"""
+import threading
+import sqlite3
+import hashlib
+
+
+INDICE_FILE = 'indice_nfce.db'
+
+
+class IndiceNotas:
+    """
+    Índice local (SQLite) com os metadados das notas copiadas, para consultar
+    por PDV, data, CNPJ ou valor sem reabrir os XMLs. Guarda também o SHA-256
+    de cada nota gravada (tabela hashes), usado na verificação de integridade.
+    """
+    COLUNAS = (
+        'chave', 'tipo', 'cnpj', 'data_emissao', 'data', 'valor_total', 'pdv',
+        'serie', 'numero', 'numero_final', 'cstat', 'arquivo', 'caminho'
+    )
+    # Confirma a transação a cada N inserções (e sempre ao fim de cada ciclo)
+    LOTE_COMMIT = 500
+
+    def __init__(self, caminho=INDICE_FILE):
+        self.lock = threading.Lock()
+        self.pendentes = 0
+        self.conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self.conexao.execute('PRAGMA journal_mode=WAL')
+        self.conexao.execute('PRAGMA synchronous=NORMAL')
+        self.conexao.execute(
+            'CREATE TABLE IF NOT EXISTS notas ('
+            'chave TEXT PRIMARY KEY, tipo TEXT, cnpj TEXT, data_emissao TEXT, '
+            'data TEXT, valor_total REAL, pdv TEXT, serie INTEGER, numero INTEGER, '
+            'numero_final INTEGER, cstat TEXT, arquivo TEXT, caminho TEXT)'
+        )
+        self.conexao.execute('CREATE INDEX IF NOT EXISTS idx_pdv_data_valor ON notas (pdv, data, valor_total)')
+        self.conexao.execute('CREATE INDEX IF NOT EXISTS idx_data ON notas (data)')
+        self.conexao.execute('CREATE INDEX IF NOT EXISTS idx_cnpj_data ON notas (cnpj, data)')
+        self.conexao.execute('CREATE TABLE IF NOT EXISTS hashes (chave TEXT PRIMARY KEY, sha256 TEXT)')
+        self.conexao.commit()
+
+    def registrar(self, metadados, arquivo, caminho, dados=None):
+        """Com `dados` (os bytes gravados), registra também o SHA-256 da nota"""
+        if not metadados.get('chave'):
+            return
+        sha256 = hashlib.sha256(dados).hexdigest() if dados is not None else None
+        data_emissao = metadados.get('data_emissao') or ''
+        linha = dict(metadados)
+        # dhEmi vem com fuso (2025-10-03T10:00:00-03:00): guardar a hora local
+        linha['data_emissao'] = data_emissao[:19] or None
+        linha['data'] = data_emissao[:10] or None
+        linha['arquivo'] = arquivo
+        linha['caminho'] = caminho
+        valores = [linha.get(coluna) for coluna in self.COLUNAS]
+        with self.lock:
+            self.conexao.execute(
+                f'INSERT OR REPLACE INTO notas ({", ".join(self.COLUNAS)}) '
+                f'VALUES ({", ".join("?" * len(self.COLUNAS))})',
+                valores
+            )
+            if sha256:
+                self.conexao.execute('INSERT OR REPLACE INTO hashes (chave, sha256) VALUES (?, ?)',
+                                     (metadados['chave'], sha256))
+            self._contar_escrita()
+
+    def _contar_escrita(self):
+        """Chamado com o lock: conta uma escrita e confirma a cada LOTE_COMMIT"""
+        self.pendentes += 1
+        if self.pendentes >= self.LOTE_COMMIT:
+            self.conexao.commit()
+            self.pendentes = 0
+
+    def registrar_hash(self, chave, sha256):
+        with self.lock:
+            self.conexao.execute('INSERT OR REPLACE INTO hashes (chave, sha256) VALUES (?, ?)', (chave, sha256))
+            self._contar_escrita()
+
+    def hash_registrado(self, chave):
+        with self.lock:
+            linha = self.conexao.execute('SELECT sha256 FROM hashes WHERE chave = ?', (chave,)).fetchone()
+        return linha[0] if linha else None
+
+    def caminhos(self, apos='', limite=500):
+        """(chave, caminho) em ordem de chave a partir de `apos`, para percorrer o índice em fatias"""
+        with self.lock:
+            return self.conexao.execute(
+                'SELECT chave, caminho FROM notas WHERE chave > ? ORDER BY chave LIMIT ?', (apos, limite)
+            ).fetchall()
+
+    def mover(self, chave, caminho):
+        """Atualiza o caminho de uma nota movida de lugar (ex.: rebalanceamento de shards)"""
+        with self.lock:
+            self.conexao.execute('UPDATE notas SET caminho = ? WHERE chave = ?', (caminho, chave))
+            self._contar_escrita()
+
+    def confirmar(self):
+        with self.lock:
+            if self.pendentes:
+                self.conexao.commit()
+                self.pendentes = 0
+
+    def consultar(self, pdv=None, data=None, data_final=None, cnpj=None,
+                  valor_minimo=None, valor_maximo=None, limite=None):
+        """Datas no formato AAAA-MM-DD; com apenas `data` filtra um único dia"""
+        condicoes = []
+        parametros = []
+        if pdv:
+            condicoes.append('pdv = ?')
+            parametros.append(pdv)
+        if data and data_final:
+            condicoes.append('data BETWEEN ? AND ?')
+            parametros.extend([data, data_final])
+        elif data:
+            condicoes.append('data = ?')
+            parametros.append(data)
+        if cnpj:
+            condicoes.append('cnpj = ?')
+            parametros.append(cnpj)
+        if valor_minimo is not None:
+            condicoes.append('valor_total >= ?')
+            parametros.append(valor_minimo)
+        if valor_maximo is not None:
+            condicoes.append('valor_total <= ?')
+            parametros.append(valor_maximo)
+        sql = f'SELECT {", ".join(self.COLUNAS)} FROM notas'
+        if condicoes:
+            sql += ' WHERE ' + ' AND '.join(condicoes)
+        sql += ' ORDER BY data_emissao'
+        if limite:
+            sql += f' LIMIT {int(limite)}'
+        with self.lock:
+            cursor = self.conexao.execute(sql, parametros)
+            return [dict(zip(self.COLUNAS, linha)) for linha in cursor.fetchall()]
+
+    def fechar(self):
+        self.confirmar()
+        self.conexao.close()
@@ -0,0 +1,264 @@
+"""
+Verificação de integridade contínua do destino em fatias retomáveis
+"""
+import os
+import json
+import datetime
+import shutil
+import time
+import hashlib
+
+from nfce_layout import campos_chave, extrair_ano_da_origem
+from nfce_validacao import chave_do_nome, validar_nfce
+
+
+INTEGRIDADE_FILE = 'integridade_nfce.json'
+
+
+def _percorrer_xml(mapa, raiz, apos=None, partes=()):
+    """
+    XMLs abaixo de `raiz` em ordem estável de caminho, gerando (partes, caminho),
+    pela listagem do destino do `mapa` (pasta ou remoto).
+    Com `apos` (tupla de partes) retoma depois dele sem entrar nas pastas já percorridas.
+    """
+    pastas, arquivos = mapa.conteudo(os.path.join(raiz, *partes))
+    for nome in sorted(pastas | arquivos.keys()):
+        atual = partes + (nome,)
+        if apos and atual < apos[:len(atual)]:
+            continue
+        if nome in pastas:
+            yield from _percorrer_xml(mapa, raiz, apos if apos and atual == apos[:len(atual)] else None, atual)
+        elif nome.lower().endswith('.xml') and not (apos and atual <= apos):
+            yield atual, os.path.join(raiz, *atual)
+
+
+class VerificacaoIntegridade:
+    """
+    Verificação de integridade (scrub) do destino em fatias curtas, com
+    orçamento de tempo, para rodar nos intervalos ociosos do monitoramento.
+    Cada passagem tem duas fases:
+    - destino: percorre as raízes NFCE em ordem estável, revalida cada XML e
+      compara o SHA-256 com o registrado no índice (sem registro, compara com
+      a origem e passa a registrar);
+    - indice: confere se as notas do índice ainda existem no destino
+      (exclusão manual, quarentena do antivírus).
+    Com `reparar`, arquivos ausentes ou corrompidos são regravados a partir
+    de uma cópia boa da origem ou de uma réplica (XML válido e, havendo, com o
+    hash registrado). Arquivo válido mas diferente da origem, sem hash
+    registrado, só é relatado: não dá para saber qual dos dois é o certo.
+    Listagem e leitura passam pelo destino do mapa; no destino remoto, que
+    nunca sobrescreve, o reparo só repõe notas ausentes.
+    O ponto de parada fica em INTEGRIDADE_FILE e a próxima fatia continua dali.
+    """
+    MAXIMO_PROBLEMAS = 200
+
+    def __init__(self, mapa, indice=None, origem=None, replicas=None, caminho=INTEGRIDADE_FILE):
+        self.mapa = mapa
+        self.indice = indice
+        self.origem = origem
+        self.replicas = replicas or []
+        self.caminho = caminho
+        self.estado = {
+            'fase': 'destino', 'cursor': None, 'passagens': 0, 'inicio_passagem': None,
+            'verificados': 0, 'reparados': 0, 'divergentes': 0, 'problemas': [],
+            'ultima_passagem': None, 'resumo_ultima_passagem': None,
+        }
+        self._meses_origem = None
+        if os.path.exists(caminho):
+            try:
+                with open(caminho, 'r', encoding='utf-8') as f:
+                    self.estado.update(json.load(f))
+            except Exception as e:
+                print(f'Erro ao carregar estado da verificação de integridade: {e}')
+
+    def salvar(self):
+        try:
+            temporario = self.caminho + '.tmp'
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(self.estado, f, ensure_ascii=False, indent=2)
+            os.replace(temporario, self.caminho)
+        except Exception as e:
+            print(f'Erro ao salvar estado da verificação de integridade: {e}')
+
+    def executar_fatia(self, orcamento=2.0, parar=None, reparar=False):
+        """
+        Verifica até esgotar `orcamento` segundos (0: até o fim da passagem) ou
+        `parar()` ser verdadeiro. Retorna {'verificados', 'problemas', 'passagem_concluida'}.
+        """
+        inicio = time.monotonic()
+        fatia = {'verificados': 0, 'problemas': [], 'passagem_concluida': False}
+
+        def esgotado():
+            return (parar and parar()) or (orcamento and time.monotonic() - inicio >= orcamento)
+
+        if not self.estado['inicio_passagem']:
+            self.estado['inicio_passagem'] = datetime.datetime.now().isoformat(timespec='seconds')
+        self._meses_origem = None  # pastas de mês novas desde a fatia anterior
+        try:
+            while not esgotado():
+                if self.estado['fase'] == 'destino':
+                    if self._fatia_destino(esgotado, fatia, reparar):
+                        self.estado['fase'], self.estado['cursor'] = 'indice', None
+                elif self._fatia_indice(esgotado, fatia, reparar):
+                    resumo = {campo: self.estado[campo] for campo in ('verificados', 'reparados', 'divergentes')}
+                    self.estado.update(
+                        fase='destino', cursor=None, inicio_passagem=None, passagens=self.estado['passagens'] + 1,
+                        ultima_passagem=datetime.datetime.now().isoformat(timespec='seconds'),
+                        resumo_ultima_passagem=resumo, verificados=0, reparados=0, divergentes=0,
+                    )
+                    fatia['passagem_concluida'] = True
+                    break
+        finally:
+            if self.indice:
+                self.indice.confirmar()
+            self.salvar()
+        return fatia
+
+    def _fatia_destino(self, esgotado, fatia, reparar):
+        """True quando todas as raízes foram percorridas"""
+        indice_raiz, apos = self.estado['cursor'] or (0, None)
+        raizes = self.mapa.raizes()
+        for i in range(indice_raiz, len(raizes)):
+            for partes, caminho in _percorrer_xml(self.mapa, raizes[i], tuple(apos) if apos and i == indice_raiz else None):
+                if esgotado():
+                    return False
+                self._verificar_arquivo(caminho, fatia, reparar)
+                self.estado['cursor'] = [i, list(partes)]
+        return True
+
+    def _fatia_indice(self, esgotado, fatia, reparar):
+        """True quando todas as notas do índice foram conferidas"""
+        if not self.indice:
+            return True
+        while not esgotado():
+            linhas = self.indice.caminhos(self.estado['cursor'] or '')
+            if not linhas:
+                return True
+            for chave, caminho in linhas:
+                if esgotado():
+                    return False
+                if caminho and not self.mapa.existe(caminho):
+                    self._problema(caminho, 'Ausente no destino', fatia, reparar, self.indice.hash_registrado(chave))
+                self.estado['cursor'] = chave
+        return False
+
+    def _verificar_arquivo(self, caminho, fatia, reparar):
+        arquivo = os.path.basename(caminho)
+        chave = chave_do_nome(arquivo)
+        fatia['verificados'] += 1
+        self.estado['verificados'] += 1
+        try:
+            dados = self.mapa.ler(caminho)
+        except OSError as e:
+            self._problema(caminho, f'Ilegível: {e}', fatia, reparar)
+            return
+        registrado = self.indice.hash_registrado(chave) if self.indice and chave else None
+        valido, motivo, _ = validar_nfce(caminho, dados)
+        if not valido:
+            self._problema(caminho, f'XML inválido: {motivo}', fatia, reparar, registrado)
+            return
+        digest = hashlib.sha256(dados).hexdigest()
+        if registrado:
+            if digest != registrado:
+                self._problema(caminho, 'Conteúdo diferente do registrado', fatia, reparar, registrado)
+            return
+        caminho_origem = self._na_origem(caminho)
+        if caminho_origem:
+            try:
+                with open(caminho_origem, 'rb') as f:
+                    if f.read() != dados:
+                        self._problema(caminho, 'Diferente da origem', fatia, False)
+                        return
+            except OSError:
+                pass
+        if self.indice and chave:
+            self.indice.registrar_hash(chave, digest)
+
+    def _problema(self, caminho, motivo, fatia, reparar, registrado=None):
+        reparado = False
+        if reparar:
+            try:
+                reparado = self._reparar(caminho, registrado)
+            except Exception as e:
+                motivo = f'{motivo} (reparo falhou: {e})'
+        problema = {
+            'caminho': caminho, 'arquivo': os.path.basename(caminho), 'motivo': motivo,
+            'reparado': reparado, 'em': datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        fatia['problemas'].append(problema)
+        self.estado['problemas'] = (self.estado['problemas'] + [problema])[-self.MAXIMO_PROBLEMAS:]
+        self.estado['reparados' if reparado else 'divergentes'] += 1
+
+    def _pastas_mes_origem(self):
+        """{(ano, 'MES XX'): pasta} da origem; só as pastas, sem listar os arquivos"""
+        if self._meses_origem is None:
+            self._meses_origem = {}
+            if self.origem and os.path.isdir(self.origem):
+                with os.scandir(self.origem) as entradas:
+                    subpastas = [(e.name, e.path) for e in entradas if e.is_dir()]
+                if any(nome.lower().startswith('mes') for nome, _ in subpastas):
+                    anos = [self.origem]
+                else:
+                    anos = [caminho for nome, caminho in subpastas if nome.lower().startswith('ano')]
+                for caminho_ano in anos:
+                    ano = str(extrair_ano_da_origem(caminho_ano))
+                    with os.scandir(caminho_ano) as entradas:
+                        for e in entradas:
+                            if e.is_dir() and e.name.lower().startswith('mes'):
+                                self._meses_origem[(ano, e.name.upper())] = e.path
+        return self._meses_origem
+
+    def _na_origem(self, caminho):
+        """
+        O mesmo arquivo na origem, ou None. Procura direto nas pastas de mês
+        candidatas (as do caminho no destino e a da emissão, pela chave),
+        sem percorrer a origem inteira.
+        """
+        arquivo = os.path.basename(caminho)
+        partes = os.path.normpath(self.mapa.relativo(caminho)).split(os.sep)
+        campos = campos_chave(arquivo)
+        anos = [parte for parte in partes if len(parte) == 4 and parte.isdigit()] + [campos['ano_emissao']]
+        meses = [parte.upper() for parte in partes if parte.lower().startswith('mes')]
+        meses.append(f"MES {campos['mes_emissao']}")
+        pastas = self._pastas_mes_origem()
+        for ano in dict.fromkeys(anos):
+            for mes in dict.fromkeys(meses):
+                pasta = pastas.get((ano, mes))
+                if pasta and os.path.exists(os.path.join(pasta, arquivo)):
+                    return os.path.join(pasta, arquivo)
+        return None
+
+    def _reparar(self, caminho, registrado=None):
+        """Regrava `caminho` com a primeira cópia boa (origem, depois réplicas). True se reparou"""
+        arquivo = os.path.basename(caminho)
+        relativo = self.mapa.relativo(caminho)
+        candidatos = [self._na_origem(caminho)] + [os.path.join(base, 'NFCE', relativo) for base in self.replicas]
+        for candidato in candidatos:
+            if not candidato:
+                continue
+            try:
+                with open(candidato, 'rb') as f:
+                    dados = f.read()
+            except OSError:
+                continue
+            digest = hashlib.sha256(dados).hexdigest()
+            if (registrado and digest != registrado) or not validar_nfce(candidato, dados)[0]:
+                continue
+            if self.mapa.remoto:
+                # O destino remoto nunca sobrescreve: só repõe o que está ausente
+                try:
+                    self.mapa.gravar(caminho, dados, os.path.getmtime(candidato), candidato)
+                except FileExistsError:
+                    raise OSError('o destino remoto não sobrescreve objetos; substitua a nota no serviço')
+            else:
+                # Troca atômica: quem estiver lendo vê o arquivo antigo ou o novo inteiro
+                os.makedirs(os.path.dirname(caminho), exist_ok=True)
+                temporario = caminho + '.reparo'
+                with open(temporario, 'wb') as f:
+                    f.write(dados)
+                shutil.copystat(candidato, temporario)
+                os.replace(temporario, caminho)
+            if self.indice and not registrado and chave_do_nome(arquivo):
+                self.indice.registrar_hash(chave_do_nome(arquivo), digest)
+            return True
+        return False
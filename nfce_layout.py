@@ -0,0 +1,190 @@
+"""
+Onde cada nota fica no destino: PDV e ano a partir dos nomes, e o template de pastas (layout_destino)
+"""
+import os
+import datetime
+import threading
+import re
+import string
+
+
+def extrair_pdv_do_arquivo(nome_arquivo):
+    """
+    Extrai o número do PDV baseado no tipo de arquivo.
+    Detecta automaticamente se é NFCe ou InutNFCe e extrai das posições corretas.
+    """
+    try:
+        # Remover extensão .xml se existir
+        nome_sem_ext = nome_arquivo.replace('.xml', '')
+        
+        # Verificar se é arquivo de inutilização (InutNFCe)
+        if 'InutNFCe' in nome_arquivo:
+            # Para InutNFCe: posições 21-23 (ex: 35252434286900018265031000001542000001542-InutNFCe.xml)
+            if len(nome_sem_ext) >= 23:
+                return f"PDV-{nome_sem_ext[20:23]}"  # Posições 21-23 (0-indexed)
+            return "PDV-000"
+        
+        # Para NFCe normal: posições 23-25 (ex: 35250802775652000123650310000000901564004651-NFCe.xml)
+        if 'NFCe' in nome_arquivo:
+            if len(nome_sem_ext) >= 25:
+                return f"PDV-{nome_sem_ext[22:25]}"  # Posições 23-25 (0-indexed)
+            return "PDV-000"
+        
+        # Para outros tipos de arquivo, tentar detectar automaticamente
+        # Padrão: procurar por 3 dígitos após uma sequência de números
+        match = re.search(r'\d{3}(?=\d{11,})', nome_sem_ext)
+        if match:
+            return f"PDV-{match.group()}"
+        return "PDV-000"
+                
+    except Exception as e:
+        print(f"Erro ao extrair PDV do arquivo {nome_arquivo}: {e}")
+        return "PDV-000"
+
+
+def extrair_ano_da_origem(origem):
+    partes = origem.split(os.sep)
+    for parte in partes:
+        if parte.lower().startswith('ano'):
+            try:
+                return int(parte.split()[-1])
+            except:
+                pass
+    return datetime.datetime.now().year
+
+
+def normalizar_pdv(texto):
+    """Aceita 31, 031, PDV031 ou PDV-031 e devolve PDV-031"""
+    numero = texto.upper().replace('PDV-', '').replace('PDV', '').strip()
+    return f'PDV-{numero.zfill(3)}'
+
+
+def montar_caminho_destino(raiz, ano, pdv, mes):
+    """Estrutura de destino NFCE/ANO/PDV-XXX/MES XX (sem criar as pastas)"""
+    return os.path.join(raiz, str(ano), pdv, mes)
+
+
+def campos_chave(nome_arquivo):
+    """
+    Campos da chave de acesso no nome do arquivo. NFC-e (44 dígitos):
+    UF, AAMM, CNPJ, modelo, série, número. InutNFCe (41): UF, AA, CNPJ,
+    modelo, série, número inicial. Nome fora do padrão: 'desconhecido'.
+    """
+    digitos = nome_arquivo.split('-')[0]
+    if not digitos.isdigit():
+        return dict.fromkeys(LayoutDestino.CAMPOS_CHAVE, 'desconhecido')
+    if 'InutNFCe' in nome_arquivo and len(digitos) >= 32:
+        return {
+            'uf': digitos[0:2], 'ano_emissao': '20' + digitos[2:4], 'mes_emissao': 'desconhecido',
+            'cnpj': digitos[4:18], 'modelo': digitos[18:20], 'serie': digitos[20:23],
+            'numero': digitos[23:32],
+        }
+    if len(digitos) >= 34:
+        return {
+            'uf': digitos[0:2], 'ano_emissao': '20' + digitos[2:4], 'mes_emissao': digitos[4:6],
+            'cnpj': digitos[6:20], 'modelo': digitos[20:22], 'serie': digitos[22:25],
+            'numero': digitos[25:34],
+        }
+    return dict.fromkeys(LayoutDestino.CAMPOS_CHAVE, 'desconhecido')
+
+
+class LayoutDestino:
+    """
+    Estrutura das pastas abaixo de NFCE, configurável com `layout_destino`
+    no config.json. O padrão '{ano}/{pdv}/{mes}' é o NFCE/ANO/PDV-XXX/MES XX
+    de sempre. Campos (todos texto, menos `ano`):
+      ano, mes (MES 10), mes_num (10), pdv (PDV-031), tipo (NFCe ou InutNFCe);
+      da chave de acesso: uf, cnpj, modelo, serie, numero, ano_emissao, mes_emissao;
+      da data de gravação do arquivo: dia (05) e data (2025-10-05).
+    Aceita a formatação do str.format, ex.: '{cnpj}/{ano}/{mes_num}/{dia}'.
+    O template é validado uma única vez e separado em segmentos; cada
+    construir só calcula os campos que o template usa e formata os segmentos
+    com str.format_map. Cada layout guarda as pastas que já criou, para não
+    repetir os.makedirs a cada arquivo.
+    """
+
+    PADRAO = '{ano}/{pdv}/{mes}'
+    CAMPOS_CHAVE = ('uf', 'cnpj', 'modelo', 'serie', 'numero', 'ano_emissao', 'mes_emissao')
+    CAMPOS = ('ano', 'mes', 'pdv', 'mes_num', 'tipo', 'dia', 'data') + CAMPOS_CHAVE
+    _compilados = {}
+    _trava_compilados = threading.Lock()
+
+    def __init__(self, template=PADRAO):
+        self.template = template
+        self.campos = set()
+        self.segmentos = self._validar(template)
+        self._usa_chave = bool(self.campos & set(self.CAMPOS_CHAVE))
+        self._usa_data = bool(self.campos & {'dia', 'data'})
+        try:
+            self.construir('', 2025, 'PDV-001', 'MES 01', '35250102775652000123650010000000011000000010-NFCe.xml', 0)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f'Formato inválido no layout de destino: {template} ({e})')
+        # Só o layout padrão tem a forma ANO/PDV-XXX/... que o rebalanceamento percorre
+        self.padrao = '/'.join(self.segmentos) == self.PADRAO
+        self.pastas_criadas = set()
+        self._trava = threading.Lock()
+
+    @classmethod
+    def compilar(cls, template=None):
+        """Layout validado (e com o cache de pastas) compartilhado por template"""
+        template = template or cls.PADRAO
+        with cls._trava_compilados:
+            layout = cls._compilados.get(template)
+            if layout is None:
+                layout = cls._compilados[template] = cls(template)
+        return layout
+
+    def _validar(self, template):
+        segmentos = [segmento for segmento in template.replace('\\', '/').split('/') if segmento]
+        if not segmentos:
+            raise ValueError('Layout de destino vazio')
+        for segmento in segmentos:
+            if segmento in ('.', '..'):
+                raise ValueError(f'Segmento inválido no layout de destino: {segmento}')
+            for _, campo, formato, conversao in string.Formatter().parse(segmento):
+                if campo is None:
+                    continue
+                if campo not in self.CAMPOS:
+                    raise ValueError(f'Campo desconhecido no layout de destino: {{{campo}}} '
+                                     f'(use {", ".join(sorted(self.CAMPOS))})')
+                if conversao and conversao not in 'rsa':
+                    raise ValueError(f'Conversão desconhecida no layout de destino: {{{campo}!{conversao}}} '
+                                     f'(use !r, !s ou !a)')
+                if '{' in (formato or ''):
+                    raise ValueError(f'Formato inválido no layout de destino: {formato}')
+                self.campos.add(campo)
+        return segmentos
+
+    def construir(self, raiz, ano, pdv, mes, arquivo=None, mtime=None):
+        """Pasta de destino da nota (sem criar)"""
+        valores = {'ano': ano, 'pdv': pdv, 'mes': mes}
+        if self._usa_chave:
+            valores.update(campos_chave(arquivo))
+        if 'mes_num' in self.campos:
+            valores['mes_num'] = format(numero_mes(mes), '02d')
+        if 'tipo' in self.campos:
+            valores['tipo'] = 'InutNFCe' if 'InutNFCe' in arquivo else 'NFCe'
+        if self._usa_data:
+            gravado = datetime.date.fromtimestamp(mtime) if mtime else datetime.date.today()
+            valores['dia'] = format(gravado.day, '02d')
+            valores['data'] = gravado.isoformat()
+        return os.path.join(raiz, *(segmento.format_map(valores) for segmento in self.segmentos))
+
+    def garantir(self, pasta):
+        """Cria a pasta uma única vez enquanto o cache valer"""
+        if pasta in self.pastas_criadas:
+            return pasta
+        os.makedirs(pasta, exist_ok=True)
+        with self._trava:
+            self.pastas_criadas.add(pasta)
+        return pasta
+
+    def esquecer(self):
+        """Descarta o cache (ex.: pastas apagadas no destino por fora)"""
+        with self._trava:
+            self.pastas_criadas.clear()
+
+
+def numero_mes(mes):
+    match = re.search(r'\d+', mes)
+    return int(match.group()) if match else 0
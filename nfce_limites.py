@@ -0,0 +1,161 @@
+"""
+Limites de I/O (token bucket) e prioridade reduzida das threads de trabalho
+"""
+import sys
+import os
+import datetime
+import threading
+import time
+import contextlib
+import platform
+
+
+# Prioridade de background no Windows: reduz CPU e I/O da thread atual
+THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+THREAD_MODE_BACKGROUND_END = 0x00020000
+# ioprio_set no Linux x86_64: classe IDLE (3) só usa o disco quando ele está ocioso
+SYS_IOPRIO_SET = 251
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+
+
+def reduzir_prioridade_thread():
+    """
+    Coloca a thread atual em baixa prioridade de CPU e disco, para não
+    disputar com o PDV rodando na mesma máquina. Usado nas threads e
+    processos de trabalho (nunca na thread da interface).
+    """
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN)
+        else:
+            tid = threading.get_native_id()
+            os.setpriority(os.PRIO_PROCESS, tid, 19)
+            if sys.platform.startswith('linux') and platform.machine() == 'x86_64':
+                import ctypes
+                libc = ctypes.CDLL(None, use_errno=True)
+                libc.syscall(SYS_IOPRIO_SET, IOPRIO_WHO_PROCESS, tid, IOPRIO_CLASS_IDLE << 13)
+    except Exception as e:
+        print(f'Não foi possível reduzir a prioridade: {e}')
+
+
+@contextlib.contextmanager
+def prioridade_reduzida(ativo=True):
+    """
+    Reduz temporariamente a prioridade da thread atual (só no Windows, onde o
+    modo background pode ser desfeito; em outros sistemas não faz nada).
+    """
+    if not ativo or sys.platform != 'win32':
+        yield
+        return
+    import ctypes
+    kernel32 = ctypes.windll.kernel32
+    kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN)
+    try:
+        yield
+    finally:
+        kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_END)
+
+
+def _minimo_limite(*limites):
+    """Menor limite positivo; 0 significa sem limite"""
+    positivos = [limite for limite in limites if limite and limite > 0]
+    return min(positivos) if positivos else 0
+
+
+class LimitadorTaxa:
+    """
+    Token bucket de bytes/s e arquivos/s para as cópias.
+    - tentar_consumir: não bloqueia; usado na thread da interface, onde o que
+      não couber fica para o próximo ciclo.
+    - consumir: espera pelos tokens; usado nas threads de trabalho.
+    Os baldes acumulam até `rajada` segundos de taxa e podem ficar negativos
+    (um arquivo maior que o balde passa e a dívida é paga depois), garantindo
+    a média configurada.
+    Com `horario_comercial` configurado, enquanto a loja está aberta vale o
+    menor entre o limite normal e o limite do perfil.
+    """
+
+    def __init__(self, bytes_por_segundo=0, arquivos_por_segundo=0, horario_comercial=None, rajada=10):
+        self.lock = threading.Lock()
+        self.bytes_por_segundo = bytes_por_segundo
+        self.arquivos_por_segundo = arquivos_por_segundo
+        self.horario_comercial = horario_comercial or {}
+        self.rajada = rajada
+        self.tokens_bytes = 0.0
+        self.tokens_arquivos = 0.0
+        self.ultimo = time.monotonic() - rajada  # começa com o balde cheio
+
+    @classmethod
+    def de_config(cls, config, prefixo=''):
+        """Limites de `limite_kb_s`/`limite_arquivos_s`; `prefixo` escolhe outro par (ex.: 'carga_')"""
+        return cls(
+            config.get(f'{prefixo}limite_kb_s', 0) * 1024,
+            config.get(f'{prefixo}limite_arquivos_s', 0),
+            config.get('horario_comercial'),
+            config.get('intervalo', 10),
+        )
+
+    def ajustar(self, bytes_por_segundo=None, arquivos_por_segundo=None, rajada=None):
+        with self.lock:
+            if bytes_por_segundo is not None:
+                self.bytes_por_segundo = bytes_por_segundo
+            if arquivos_por_segundo is not None:
+                self.arquivos_por_segundo = arquivos_por_segundo
+            if rajada is not None:
+                self.rajada = rajada
+
+    def loja_aberta(self, agora=None):
+        perfil = self.horario_comercial
+        if not perfil:
+            return False
+        agora = agora or datetime.datetime.now()
+        if agora.weekday() not in perfil.get('dias_semana', range(7)):
+            return False
+        hora = agora.strftime('%H:%M')
+        inicio, fim = perfil.get('inicio', '00:00'), perfil.get('fim', '23:59')
+        if inicio <= fim:
+            return inicio <= hora < fim
+        return hora >= inicio or hora < fim  # expediente que passa da meia-noite
+
+    def taxas(self):
+        """(bytes/s, arquivos/s) em vigor agora; 0 = sem limite"""
+        if self.loja_aberta():
+            perfil = self.horario_comercial
+            return (
+                _minimo_limite(self.bytes_por_segundo, perfil.get('kb_por_segundo', 0) * 1024),
+                _minimo_limite(self.arquivos_por_segundo, perfil.get('arquivos_por_segundo', 0)),
+            )
+        return self.bytes_por_segundo, self.arquivos_por_segundo
+
+    def _reabastecer(self, taxa_bytes, taxa_arquivos):
+        agora = time.monotonic()
+        decorrido = agora - self.ultimo
+        self.ultimo = agora
+        if taxa_bytes:
+            self.tokens_bytes = min(self.tokens_bytes + decorrido * taxa_bytes, taxa_bytes * self.rajada)
+        if taxa_arquivos:
+            self.tokens_arquivos = min(self.tokens_arquivos + decorrido * taxa_arquivos, taxa_arquivos * self.rajada)
+
+    def tentar_consumir(self, tamanho):
+        """Retorna True e desconta os tokens se houver saldo; False caso contrário"""
+        taxa_bytes, taxa_arquivos = self.taxas()
+        with self.lock:
+            self._reabastecer(taxa_bytes, taxa_arquivos)
+            if (taxa_bytes and self.tokens_bytes <= 0) or (taxa_arquivos and self.tokens_arquivos < 1):
+                return False
+            if taxa_bytes:
+                self.tokens_bytes -= tamanho
+            if taxa_arquivos:
+                self.tokens_arquivos -= 1
+            return True
+
+    def consumir(self, tamanho, parar=None):
+        """Espera até haver saldo. `parar` (callable) permite desistir da espera"""
+        while not self.tentar_consumir(tamanho):
+            if parar and parar():
+                return False
+            time.sleep(0.05)
+        return True
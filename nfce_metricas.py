@@ -0,0 +1,128 @@
+"""
+Métricas de latência por PDV e etapa (histogramas com percentis) e formatação de tempos e tamanhos
+"""
+import os
+import json
+import datetime
+import threading
+import time
+import collections
+import bisect
+
+
+METRICAS_FILE = 'metricas_nfce.json'
+
+
+def formatar_bytes(quantidade):
+    for unidade in ('B', 'KB', 'MB', 'GB'):
+        if quantidade < 1024 or unidade == 'GB':
+            return f'{quantidade:.0f} {unidade}' if unidade == 'B' else f'{quantidade:.1f} {unidade}'
+        quantidade /= 1024
+
+
+class HistogramaLatencia:
+    """
+    Histograma de latências com baldes logarítmicos (de 1 ms a ~1 semana,
+    passo de 25%) em janela deslizante: a janela é dividida em fatias e as
+    fatias mais antigas são descartadas. Memória constante, qualquer volume.
+    """
+    LIMITES = [0.001 * 1.25 ** i for i in range(92)]  # 1 ms até ~7,6 dias
+
+    def __init__(self, janela=3600, fatias=12):
+        self.duracao_fatia = janela / fatias
+        self.fatias_maximas = fatias
+        self.fatias = collections.deque()  # [inicio, contagens]
+
+    def _descartar_antigas(self, agora):
+        while self.fatias and self.fatias[0][0] <= agora - self.duracao_fatia * self.fatias_maximas:
+            self.fatias.popleft()
+
+    def registrar(self, segundos, agora=None):
+        agora = time.time() if agora is None else agora
+        self._descartar_antigas(agora)
+        if not self.fatias or agora - self.fatias[-1][0] >= self.duracao_fatia:
+            self.fatias.append([agora, [0] * (len(self.LIMITES) + 1)])
+        self.fatias[-1][1][bisect.bisect_left(self.LIMITES, max(segundos, 0))] += 1
+
+    def percentis(self, quantis=(0.5, 0.95, 0.99), agora=None):
+        """Retorna (quantidade, [limite superior do balde de cada quantil])"""
+        self._descartar_antigas(time.time() if agora is None else agora)
+        contagens = [sum(coluna) for coluna in zip(*(fatia[1] for fatia in self.fatias))]
+        total = sum(contagens)
+        if not total:
+            return 0, [None] * len(quantis)
+        resultado = []
+        for quantil in quantis:
+            alvo = quantil * total
+            acumulado = 0
+            for indice, contagem in enumerate(contagens):
+                acumulado += contagem
+                if acumulado >= alvo:
+                    break
+            resultado.append(self.LIMITES[min(indice, len(self.LIMITES) - 1)])
+        return total, resultado
+
+
+class MetricasLatencia:
+    """
+    Latências por PDV e etapa:
+    - descoberta: da gravação no PDV (mtime) até o arquivo entrar no plano do ciclo
+    - validacao: tempo de validação por arquivo (rateado quando feita em lote)
+    - copia: duração da cópia
+    - ponta_a_ponta: da gravação no PDV até a cópia concluída
+    """
+    ETAPAS = ('ponta_a_ponta', 'descoberta', 'validacao', 'copia')
+
+    def __init__(self, janela=3600):
+        self.janela = janela
+        self.lock = threading.Lock()
+        self.histogramas = {}
+        self.contadores = collections.Counter()
+
+    def registrar(self, pdv, etapa, segundos):
+        with self.lock:
+            histograma = self.histogramas.get((pdv, etapa))
+            if histograma is None:
+                histograma = self.histogramas[(pdv, etapa)] = HistogramaLatencia(self.janela)
+            histograma.registrar(segundos)
+
+    def contar(self, nome, quantidade=1):
+        with self.lock:
+            self.contadores[nome] += quantidade
+
+    def resumo(self):
+        """{pdv: {etapa: {'n', 'p50', 'p95', 'p99'}}}"""
+        resultado = {}
+        with self.lock:
+            for (pdv, etapa), histograma in sorted(self.histogramas.items()):
+                total, (p50, p95, p99) = histograma.percentis()
+                if total:
+                    resultado.setdefault(pdv, {})[etapa] = {'n': total, 'p50': p50, 'p95': p95, 'p99': p99}
+        return resultado
+
+    def exportar(self, caminho=METRICAS_FILE):
+        dados = {
+            'gerado_em': datetime.datetime.now().isoformat(timespec='seconds'),
+            'janela_segundos': self.janela,
+            'contadores': dict(self.contadores),
+            'latencias': self.resumo(),
+        }
+        try:
+            temporario = caminho + '.tmp'
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(dados, f, ensure_ascii=False, indent=2)
+            os.replace(temporario, caminho)
+        except Exception as e:
+            print(f'Erro ao exportar métricas: {e}')
+
+
+def formatar_segundos(segundos):
+    if segundos is None:
+        return '-'
+    if segundos < 1:
+        return f'{segundos * 1000:.0f} ms'
+    if segundos < 120:
+        return f'{segundos:.1f} s'
+    if segundos < 7200:
+        return f'{segundos / 60:.1f} min'
+    return f'{segundos / 3600:.1f} h'
@@ -0,0 +1,327 @@
+"""
+Numeração das notas por PDV/série: lacunas e duplicidades, e as marcas do ciclo rápido
+"""
+import os
+import json
+import threading
+import base64
+import zlib
+import bisect
+
+from nfce_layout import extrair_pdv_do_arquivo
+from nfce_validacao import chave_do_nome
+
+
+LACUNAS_FILE = 'lacunas_nfce.json'
+MARCAS_FILE = 'marcas_nfce.json'
+
+
+class MarcasNumeracao:
+    """
+    High-water mark por (ano, mês, PDV, série): a maior numeração de NFC-e
+    até a qual todos os arquivos vistos já estão no destino. Como a numeração
+    cresce sempre, no ciclo rápido só os arquivos acima da marca são
+    candidatos (decididos pelo nome, sem stat nem listagem do destino).
+    Arquivos fora de ordem (ex.: contingência enviada depois) são pegos na
+    varredura completa periódica. InutNFCe e nomes fora do padrão são sempre
+    candidatos. Persistido em MARCAS_FILE.
+    """
+
+    def __init__(self, caminho=MARCAS_FILE):
+        self.caminho = caminho
+        self.marcas = {}
+        self.alterado = False
+        if os.path.exists(caminho):
+            try:
+                with open(caminho, 'r', encoding='utf-8') as f:
+                    self.marcas = json.load(f)
+            except Exception as e:
+                print(f'Erro ao carregar marcas de numeração: {e}')
+
+    @staticmethod
+    def _chave(ano, mes, nome_arquivo):
+        numeracao = decodificar_numeracao(nome_arquivo)
+        if numeracao is None or numeracao[4] != 'NFCe':
+            return None, None
+        pdv, serie, numero, _, _ = numeracao
+        return f'{ano}|{mes}|{pdv}|{serie}', numero
+
+    def conhecido(self, ano, mes, nome_arquivo):
+        """True se o arquivo está abaixo da marca (já resolvido em ciclo anterior)"""
+        chave, numero = self._chave(ano, mes, nome_arquivo)
+        return chave is not None and numero <= self.marcas.get(chave, -1)
+
+    def atualizar(self, itens, resolvidos):
+        """
+        Avança as marcas com o resultado do ciclo. `itens`: candidatos do ciclo;
+        `resolvidos`: nomes que ao fim do ciclo estão no destino. A marca para
+        logo abaixo do menor candidato não resolvido (adiado, inválido, com
+        erro), para que ele continue sendo candidato no próximo ciclo.
+        Sem nenhum resolvido na chave (ex.: só candidatos adiados, destino
+        fora do ar) a marca anterior fica como piso: o ciclo não viu nada
+        abaixo dela que justifique voltar.
+        """
+        faixas = {}
+        for item in itens:
+            chave, numero = self._chave(item.ano, item.mes, item.arquivo)
+            if chave is None:
+                continue
+            maior_resolvido, menor_pendente = faixas.get(chave, (-1, None))
+            if item.arquivo in resolvidos:
+                maior_resolvido = max(maior_resolvido, numero)
+            elif menor_pendente is None or numero < menor_pendente:
+                menor_pendente = numero
+            faixas[chave] = (maior_resolvido, menor_pendente)
+        for chave, (maior_resolvido, menor_pendente) in faixas.items():
+            marca = maior_resolvido if menor_pendente is None else min(maior_resolvido, menor_pendente - 1)
+            if maior_resolvido < 0:
+                marca = max(self.marcas.get(chave, -1), marca)
+            if marca != self.marcas.get(chave, -1):
+                self.marcas[chave] = marca
+                self.alterado = True
+
+    def salvar(self):
+        if not self.alterado:
+            return
+        try:
+            temporario = self.caminho + '.tmp'
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(self.marcas, f, separators=(',', ':'))
+            os.replace(temporario, self.caminho)
+            self.alterado = False
+        except Exception as e:
+            print(f'Erro ao salvar marcas de numeração: {e}')
+
+
+def decodificar_numeracao(nome_arquivo):
+    """
+    Extrai (pdv, serie, numero_inicial, numero_final, tipo) do nome do arquivo.
+    - NFCe: chave de 44 dígitos, série nas posições 23-25 e nNF nas 26-34
+    - InutNFCe: ID de 41 dígitos, série 21-23, nNFIni 24-32 e nNFFin 33-41
+    Retorna None se o nome não seguir nenhum dos padrões.
+    """
+    chave = chave_do_nome(nome_arquivo)
+    if not chave:
+        return None
+    if 'InutNFCe' in nome_arquivo and len(chave) >= 41:
+        serie, inicial, final = int(chave[20:23]), int(chave[23:32]), int(chave[32:41])
+        return extrair_pdv_do_arquivo(nome_arquivo), serie, min(inicial, final), max(inicial, final), 'InutNFCe'
+    if 'NFCe' in nome_arquivo and len(chave) >= 44:
+        serie, numero = int(chave[22:25]), int(chave[25:34])
+        return extrair_pdv_do_arquivo(nome_arquivo), serie, numero, numero, 'NFCe'
+    return None
+
+
+def _subtrair_intervalos(inicio, fim, intervalos):
+    """Divide [inicio, fim] em partes fora e dentro dos intervalos (ordenados e sem sobreposição)"""
+    fora, dentro = [], []
+    atual = inicio
+    for ini, fin in intervalos:
+        if fin < atual or ini > fim:
+            continue
+        if ini > atual:
+            fora.append((atual, ini - 1))
+        dentro.append((max(ini, atual), min(fin, fim)))
+        atual = fin + 1
+        if atual > fim:
+            break
+    if atual <= fim:
+        fora.append((atual, fim))
+    return fora, dentro
+
+
+class _SequenciaNumeracao:
+    """
+    Números vistos de um (PDV, série) como intervalos contíguos (inicios[i]..fins[i]),
+    ordenados e mesclados. Numeração em sequência ocupa um único intervalo; a
+    memória cresce com o número de lacunas, não com a faixa de números (um nNF
+    corrompido como 999999999 custa um intervalo a mais, não um bitmap enorme).
+    """
+    __slots__ = ('inicios', 'fins', 'duplicados', 'inutilizadas', 'reportadas')
+
+    def __init__(self):
+        self.inicios = []
+        self.fins = []
+        self.duplicados = set()
+        self.inutilizadas = []  # intervalos (ini, fin) ordenados e mesclados
+        self.reportadas = set()  # lacunas já informadas ao usuário
+
+    @property
+    def minimo(self):
+        return self.inicios[0] if self.inicios else None
+
+    @property
+    def maximo(self):
+        return self.fins[-1] if self.fins else None
+
+    def marcar(self, numero):
+        """Marca o número e retorna True se ele já estava marcado"""
+        i = bisect.bisect_right(self.inicios, numero) - 1
+        if i >= 0 and numero <= self.fins[i]:
+            return True
+        junta_anterior = i >= 0 and self.fins[i] == numero - 1
+        junta_seguinte = i + 1 < len(self.inicios) and self.inicios[i + 1] == numero + 1
+        if junta_anterior and junta_seguinte:
+            self.fins[i] = self.fins[i + 1]
+            del self.inicios[i + 1], self.fins[i + 1]
+        elif junta_anterior:
+            self.fins[i] = numero
+        elif junta_seguinte:
+            self.inicios[i + 1] = numero
+        else:
+            self.inicios.insert(i + 1, numero)
+            self.fins.insert(i + 1, numero)
+        return False
+
+    def inutilizar(self, inicial, final):
+        intervalos = sorted(self.inutilizadas + [(inicial, final)])
+        mesclados = []
+        for ini, fin in intervalos:
+            if mesclados and ini <= mesclados[-1][1] + 1:
+                mesclados[-1] = (mesclados[-1][0], max(mesclados[-1][1], fin))
+            else:
+                mesclados.append((ini, fin))
+        self.inutilizadas = mesclados
+
+    def faltantes(self):
+        """Intervalos de números ausentes entre o menor e o maior número visto"""
+        return [(fim + 1, inicio - 1) for fim, inicio in zip(self.fins, self.inicios[1:])]
+
+    def para_dict(self):
+        return {
+            'vistos': [[inicio, fim] for inicio, fim in zip(self.inicios, self.fins)],
+            'duplicados': sorted(self.duplicados),
+            'inutilizadas': self.inutilizadas,
+            'reportadas': sorted(self.reportadas),
+        }
+
+    @classmethod
+    def de_dict(cls, dados):
+        sequencia = cls()
+        if 'bits' in dados:
+            # Formato antigo (bitmap a partir de `base`): converte em intervalos
+            bits = zlib.decompress(base64.b64decode(dados['bits']))
+            for posicao, byte in enumerate(bits):
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        sequencia.marcar(dados['base'] + posicao * 8 + bit)
+        for inicio, fim in dados.get('vistos', []):
+            sequencia.inicios.append(inicio)
+            sequencia.fins.append(fim)
+        sequencia.duplicados = set(dados.get('duplicados', []))
+        sequencia.inutilizadas = [tuple(i) for i in dados.get('inutilizadas', [])]
+        sequencia.reportadas = set(tuple(r) for r in dados.get('reportadas', []))
+        return sequencia
+
+
+class DetectorLacunas:
+    """
+    Detecta lacunas e duplicidades na numeração das NFC-e por (PDV, série).
+    A numeração de cada série fica em intervalos de números vistos (uma
+    sequência sem buracos é um intervalo só), persistidos em LACUNAS_FILE.
+    Faixas de InutNFCe contam como lacunas explicadas.
+    """
+
+    def __init__(self, caminho=LACUNAS_FILE, carregar=True):
+        self.caminho = caminho
+        self.lock = threading.Lock()
+        self.sequencias = {}
+        self.alterado = False
+        if carregar and os.path.exists(caminho):
+            try:
+                with open(caminho, 'r', encoding='utf-8') as f:
+                    dados = json.load(f)
+                for chave, sequencia in dados.items():
+                    pdv, serie = chave.split('|')
+                    self.sequencias[(pdv, int(serie))] = _SequenciaNumeracao.de_dict(sequencia)
+            except Exception as e:
+                print(f'Erro ao carregar numeração: {e}')
+
+    def registrar(self, nome_arquivo, verificar_duplicado=True):
+        """
+        Registra a numeração de um arquivo. Retorna True se o número já
+        tinha sido visto por outro arquivo (duplicidade).
+        Arquivos que já estavam no destino devem ser registrados com
+        verificar_duplicado=False, pois reaparecem a cada ciclo.
+        """
+        numeracao = decodificar_numeracao(nome_arquivo)
+        if numeracao is None:
+            return False
+        pdv, serie, inicial, final, tipo = numeracao
+        with self.lock:
+            sequencia = self.sequencias.get((pdv, serie))
+            if sequencia is None:
+                sequencia = self.sequencias[(pdv, serie)] = _SequenciaNumeracao()
+            self.alterado = True
+            if tipo == 'InutNFCe':
+                sequencia.inutilizar(inicial, final)
+                return False
+            duplicado = sequencia.marcar(inicial)
+            if duplicado and verificar_duplicado:
+                sequencia.duplicados.add(inicial)
+                return True
+            return False
+
+    def lacunas(self):
+        """Retorna {(pdv, serie): {'faltando': [...], 'explicadas': [...], 'duplicados': [...]}}"""
+        relatorio = {}
+        with self.lock:
+            for chave, sequencia in sorted(self.sequencias.items()):
+                faltando, explicadas = [], []
+                for inicio, fim in sequencia.faltantes():
+                    fora, dentro = _subtrair_intervalos(inicio, fim, sequencia.inutilizadas)
+                    faltando.extend(fora)
+                    explicadas.extend(dentro)
+                relatorio[chave] = {
+                    'faltando': faltando,
+                    'explicadas': explicadas,
+                    'duplicados': sorted(sequencia.duplicados),
+                }
+        return relatorio
+
+    def novas_lacunas(self, pendentes=()):
+        """
+        Lacunas sem inutilização que ainda não foram informadas: [(pdv, serie, inicio, fim)].
+        `pendentes`: nomes de arquivos que existem na origem mas ainda não foram
+        copiados (ex.: adiados pela capacidade do ciclo); seus números não são lacuna.
+        """
+        na_origem = {}
+        for nome in pendentes:
+            numeracao = decodificar_numeracao(nome)
+            if numeracao and numeracao[4] == 'NFCe':
+                na_origem.setdefault(numeracao[:2], []).append((numeracao[2], numeracao[2]))
+        novas = []
+        for (pdv, serie), grupo in self.lacunas().items():
+            faltando = abertas = grupo['faltando']
+            if (pdv, serie) in na_origem:
+                numeros = sorted(set(na_origem[(pdv, serie)]))
+                faltando = [parte for inicio, fim in faltando for parte in _subtrair_intervalos(inicio, fim, numeros)[0]]
+            with self.lock:
+                sequencia = self.sequencias[(pdv, serie)]
+                # Lacunas fechadas saem do registro; o que sobrou de uma lacuna
+                # informada (fechada em parte) não é informado de novo
+                reportadas = sorted(r for r in sequencia.reportadas if _subtrair_intervalos(*r, abertas)[1])
+                if len(reportadas) != len(sequencia.reportadas):
+                    sequencia.reportadas = set(reportadas)
+                    self.alterado = True
+                for intervalo in faltando:
+                    if any(inicio <= intervalo[0] and intervalo[1] <= fim for inicio, fim in reportadas):
+                        continue
+                    sequencia.reportadas.add(intervalo)
+                    novas.append((pdv, serie) + intervalo)
+                    self.alterado = True
+        return novas
+
+    def salvar(self):
+        with self.lock:
+            if not self.alterado:
+                return
+            dados = {f'{pdv}|{serie}': sequencia.para_dict() for (pdv, serie), sequencia in self.sequencias.items()}
+            self.alterado = False
+        try:
+            temporario = self.caminho + '.tmp'
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(dados, f)
+            os.replace(temporario, self.caminho)
+        except Exception as e:
+            print(f'Erro ao salvar numeração: {e}')
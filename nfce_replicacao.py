@@ -0,0 +1,169 @@
+"""
+Réplicas do destino (ex.: disco de backup), cada uma com sua fila e no seu ritmo
+"""
+import os
+import json
+import threading
+import time
+import collections
+
+from nfce_destinos import gravar_nota
+from nfce_limites import reduzir_prioridade_thread
+
+
+REPLICACAO_FILE = 'replicacao_nfce.json'
+
+
+class _Replica:
+    """Fila e estado de replicação de um destino adicional, com thread própria"""
+    # Acima disso a fila guarda só o caminho e relê o arquivo do destino principal
+    LIMITE_EM_MEMORIA = 1000
+    ESPERA_OFFLINE = 30  # segundos entre tentativas com o destino indisponível
+
+    def __init__(self, base, limitador=None, baixa_prioridade=False):
+        self.base = base
+        self.limitador = limitador
+        self.baixa_prioridade = baixa_prioridade
+        self.fila = collections.deque()  # (relativo, caminho_primario, dados)
+        self.condicao = threading.Condition()
+        self.online = True
+        self.ultimo_erro = ''
+        self.ultima_copia = None
+        self.replicados = 0
+        # Notas da réplica com conteúdo diferente do principal (guarda só as últimas)
+        self.divergencias = 0
+        self.divergentes = collections.deque(maxlen=100)
+        self.parar = False
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def enfileirar(self, relativo, caminho_primario, dados=None):
+        with self.condicao:
+            if len(self.fila) >= self.LIMITE_EM_MEMORIA:
+                dados = None
+            self.fila.append((relativo, caminho_primario, dados))
+            self.condicao.notify()
+
+    def _loop(self):
+        if self.baixa_prioridade:
+            reduzir_prioridade_thread()
+        while True:
+            with self.condicao:
+                while not self.fila and not self.parar:
+                    self.condicao.wait()
+                if self.parar:
+                    return
+                relativo, caminho_primario, dados = self.fila[0]
+            if self.limitador:
+                try:
+                    tamanho = len(dados) if dados is not None else os.path.getsize(caminho_primario)
+                except OSError:
+                    tamanho = 0
+                if not self.limitador.consumir(tamanho, lambda: self.parar):
+                    return
+            try:
+                destino = os.path.join(self.base, 'NFCE', relativo)
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                if dados is None:
+                    with open(caminho_primario, 'rb') as f:
+                        dados = f.read()
+                try:
+                    gravar_nota(destino, dados, caminho_primario)
+                    self.replicados += 1
+                except FileExistsError:
+                    # Já replicado (ex.: retomada após reinício). gravar_nota não deixa
+                    # parcial, então conteúdo diferente é outra nota com o mesmo
+                    # nome: fica como está e é informada como divergência
+                    with open(destino, 'rb') as f:
+                        if f.read() != dados:
+                            self.divergencias += 1
+                            self.divergentes.append(relativo)
+                            self.ultimo_erro = f'{relativo} diverge do destino principal'
+                            print(f'Réplica {self.base}: {self.ultimo_erro}')
+                with self.condicao:
+                    self.fila.popleft()
+                self.online = True
+                self.ultima_copia = time.time()
+            except FileNotFoundError as e:
+                # Some do principal antes de replicar: não há o que copiar
+                if not os.path.exists(caminho_primario):
+                    with self.condicao:
+                        self.fila.popleft()
+                    continue
+                self._falhou(e)
+            except Exception as e:
+                # Qualquer falha só adia a réplica: a thread nunca morre
+                self._falhou(e)
+
+    def _falhou(self, erro):
+        self.online = False
+        self.ultimo_erro = str(erro)
+        # Destino lento ou fora do ar: espera sem bloquear o principal
+        with self.condicao:
+            self.condicao.wait(self.ESPERA_OFFLINE)
+
+    def encerrar(self):
+        with self.condicao:
+            self.parar = True
+            self.condicao.notify()
+
+
+class Replicador:
+    """
+    Replica as notas gravadas no destino principal para os destinos de
+    `replicas_destino`, cada um com fila e thread próprias: uma réplica lenta
+    ou fora do ar apenas acumula atraso e alcança o principal quando volta.
+    As pendências são salvas em REPLICACAO_FILE para sobreviver a reinícios.
+    """
+
+    def __init__(self, destinos, estado_arquivo=REPLICACAO_FILE, limitador=None, baixa_prioridade=False):
+        self.estado_arquivo = estado_arquivo
+        self.replicas = {
+            destino: _Replica(destino, limitador, baixa_prioridade) for destino in destinos if destino
+        }
+        if os.path.exists(estado_arquivo):
+            try:
+                with open(estado_arquivo, 'r', encoding='utf-8') as f:
+                    pendencias = json.load(f)
+                for destino, itens in pendencias.items():
+                    if destino in self.replicas:
+                        for relativo, caminho_primario in itens:
+                            self.replicas[destino].enfileirar(relativo, caminho_primario)
+            except Exception as e:
+                print(f'Erro ao carregar pendências de replicação: {e}')
+
+    def enfileirar(self, relativo, caminho_primario, dados=None):
+        for replica in self.replicas.values():
+            replica.enfileirar(relativo, caminho_primario, dados)
+
+    def situacao(self):
+        return {
+            destino: {
+                'pendentes': len(replica.fila),
+                'online': replica.online,
+                'ultimo_erro': replica.ultimo_erro,
+                'ultima_copia': replica.ultima_copia,
+                'replicados': replica.replicados,
+                'divergencias': replica.divergencias,
+                'divergentes': list(replica.divergentes),
+            }
+            for destino, replica in self.replicas.items()
+        }
+
+    def salvar(self):
+        pendencias = {}
+        for destino, replica in self.replicas.items():
+            with replica.condicao:
+                pendencias[destino] = [[relativo, primario] for relativo, primario, _ in replica.fila]
+        if not any(pendencias.values()) and not os.path.exists(self.estado_arquivo):
+            return
+        try:
+            with open(self.estado_arquivo, 'w', encoding='utf-8') as f:
+                json.dump(pendencias, f)
+        except Exception as e:
+            print(f'Erro ao salvar pendências de replicação: {e}')
+
+    def encerrar(self):
+        self.salvar()
+        for replica in self.replicas.values():
+            replica.encerrar()
@@ -0,0 +1,204 @@
+"""
+Validação semântica dos XML de NFC-e e de inutilização, com pool de processos para lotes
+"""
+import os
+import xml.etree.ElementTree as ET
+import re
+import concurrent.futures
+
+from nfce_limites import reduzir_prioridade_thread
+
+
+# Validação semântica: status da SEFAZ aceitos para cada tipo de documento
+CSTAT_AUTORIZADOS = ('100', '150')  # Autorizado / Autorizado fora de prazo
+CSTAT_INUTILIZACAO_HOMOLOGADA = '102'
+MODELO_NFCE = '65'
+
+# Abaixo deste número de arquivos a validação roda na própria thread,
+# evitando o custo de subir o pool de processos
+VALIDACAO_LOTE_MINIMO = 200
+VALIDACAO_CHUNK_MAXIMO = 256
+
+
+def _nome_local(tag):
+    """Remove o namespace ({http://www.portalfiscal.inf.br/nfe}) de uma tag"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _filho(elemento, nome):
+    """Retorna o primeiro filho direto com o nome local informado"""
+    if elemento is None:
+        return None
+    for filho in elemento:
+        if _nome_local(filho.tag) == nome:
+            return filho
+    return None
+
+
+def _texto_filho(elemento, nome):
+    filho = _filho(elemento, nome)
+    if filho is None or filho.text is None:
+        return None
+    return filho.text.strip()
+
+
+def chave_do_nome(nome_arquivo):
+    """Extrai a sequência numérica inicial do nome (chave de acesso ou ID da inutilização)"""
+    match = re.match(r'\d+', os.path.basename(nome_arquivo))
+    return match.group() if match else None
+
+
+def _inteiro(texto):
+    try:
+        return int(texto)
+    except (TypeError, ValueError):
+        return None
+
+
+def _decimal(texto):
+    try:
+        return float(texto)
+    except (TypeError, ValueError):
+        return None
+
+
+# Motivo de validação quando o arquivo nem pôde ser lido (ex.: queda do
+# compartilhamento): é erro transitório, não XML inválido
+MOTIVO_FALHA_LEITURA = 'Falha ao ler o arquivo'
+
+
+def status_da_validacao(motivo):
+    """Status de uma validação reprovada: 'Erro' se foi falha de leitura, senão 'XML Inválido'"""
+    return 'Erro' if motivo.startswith(MOTIVO_FALHA_LEITURA) else 'XML Inválido'
+
+
+def validar_nfce(caminho_arquivo, dados=None):
+    """
+    Valida o conteúdo fiscal de um XML, além de verificar se é bem formado.
+    - NFCe: a chave do infNFe deve bater com o nome do arquivo e o protNFe
+      deve trazer status de autorização.
+    - InutNFCe: o documento deve ser de fato um pedido de inutilização
+      (xServ INUTILIZAR) com ID igual ao nome do arquivo.
+    Aproveita o mesmo parse para extrair os metadados usados no índice
+    de notas (chave, emissão, valor, PDV, série, número e status).
+    Com `dados`, valida esses bytes em vez de ler o arquivo (o nome ainda vem
+    do caminho). Retorna (valido, motivo, metadados). É uma função de módulo
+    para poder rodar em um ProcessPoolExecutor.
+    """
+    arquivo = os.path.basename(caminho_arquivo)
+    try:
+        raiz = ET.fromstring(dados) if dados is not None else ET.parse(caminho_arquivo).getroot()
+    except OSError as e:
+        return False, f'{MOTIVO_FALHA_LEITURA}: {e}', {}
+    except Exception as e:
+        return False, f'XML mal formado: {e}', {}
+
+    chave_nome = chave_do_nome(arquivo)
+    elementos = {}
+    for elemento in raiz.iter():
+        elementos.setdefault(_nome_local(elemento.tag), elemento)
+
+    if 'InutNFCe' in arquivo:
+        inf_inut = elementos.get('infInut')
+        if inf_inut is None or _texto_filho(inf_inut, 'xServ') != 'INUTILIZAR':
+            return False, 'Documento não é uma inutilização', {}
+        id_inut = inf_inut.get('Id', '')
+        serie = _inteiro(_texto_filho(inf_inut, 'serie'))
+        ret_inf_inut = _filho(elementos.get('retInutNFe'), 'infInut')
+        metadados = {
+            'tipo': 'InutNFCe',
+            'chave': id_inut[2:],
+            'cnpj': _texto_filho(inf_inut, 'CNPJ'),
+            'data_emissao': _texto_filho(ret_inf_inut, 'dhRecbto'),
+            'valor_total': None,
+            'pdv': f'PDV-{serie:03d}' if serie is not None else None,
+            'serie': serie,
+            'numero': _inteiro(_texto_filho(inf_inut, 'nNFIni')),
+            'numero_final': _inteiro(_texto_filho(inf_inut, 'nNFFin')),
+            'cstat': _texto_filho(ret_inf_inut, 'cStat'),
+        }
+        if not id_inut.startswith('ID') or id_inut[2:] != chave_nome:
+            return False, f'ID da inutilização ({id_inut}) não confere com o nome do arquivo', metadados
+        if ret_inf_inut is not None and metadados['cstat'] != CSTAT_INUTILIZACAO_HOMOLOGADA:
+            return False, f'Inutilização não homologada (cStat {metadados["cstat"]})', metadados
+        return True, '', metadados
+
+    if 'NFCe' in arquivo:
+        inf_nfe = elementos.get('infNFe')
+        if inf_nfe is None:
+            return False, 'Documento sem infNFe', {}
+        chave = inf_nfe.get('Id', '')[3:]
+        ide = _filho(inf_nfe, 'ide')
+        inf_prot = _filho(elementos.get('protNFe'), 'infProt')
+        serie = _inteiro(_texto_filho(ide, 'serie'))
+        metadados = {
+            'tipo': 'NFCe',
+            'chave': chave,
+            'cnpj': _texto_filho(_filho(inf_nfe, 'emit'), 'CNPJ'),
+            'data_emissao': _texto_filho(ide, 'dhEmi'),
+            'valor_total': _decimal(_texto_filho(_filho(_filho(inf_nfe, 'total'), 'ICMSTot'), 'vNF')),
+            'pdv': f'PDV-{serie:03d}' if serie is not None else None,
+            'serie': serie,
+            'numero': _inteiro(_texto_filho(ide, 'nNF')),
+            'numero_final': None,
+            'cstat': _texto_filho(inf_prot, 'cStat'),
+        }
+        if len(chave) != 44 or not chave.isdigit():
+            return False, 'Chave de acesso ausente ou inválida no infNFe', metadados
+        if chave_nome and chave != chave_nome:
+            return False, f'Chave {chave} não confere com o nome do arquivo', metadados
+        if chave[20:22] != MODELO_NFCE:
+            return False, f'Modelo {chave[20:22]} não é NFC-e', metadados
+        if inf_prot is None:
+            return False, 'Sem protocolo de autorização (protNFe)', metadados
+        if _texto_filho(inf_prot, 'chNFe') != chave:
+            return False, 'Chave do protocolo não confere com a NFC-e', metadados
+        if metadados['cstat'] not in CSTAT_AUTORIZADOS:
+            return False, f'NFC-e não autorizada (cStat {metadados["cstat"]})', metadados
+        return True, '', metadados
+
+    # Outros XMLs: apenas a verificação de boa formação
+    return True, '', {}
+
+
+def ler_e_validar(caminho_arquivo):
+    """
+    Lê a nota uma única vez e valida esses mesmos bytes, que seguem para o
+    destino e as réplicas sem reler a origem. Retorna (valido, motivo,
+    metadados, dados), com dados None se a leitura falhar.
+    """
+    try:
+        with open(caminho_arquivo, 'rb') as f:
+            dados = f.read()
+    except OSError as e:
+        return False, f'{MOTIVO_FALHA_LEITURA}: {e}', {}, None
+    return (*validar_nfce(caminho_arquivo, dados), dados)
+
+
+def validar_em_lote(caminhos, max_processos=None, baixa_prioridade=False, com_dados=False, dados=None):
+    """
+    Valida vários arquivos distribuindo o parse entre todos os núcleos.
+    O parse é limitado pelo GIL, por isso usa processos e não threads.
+    Com baixa_prioridade, os processos do pool rodam com CPU e I/O reduzidos.
+    Retorna um dicionário caminho -> (valido, motivo, metadados); com
+    `com_dados`, cada resultado traz também os bytes lidos (ler_e_validar).
+    Com `dados` ({caminho: bytes}, ex.: lidos de um destino remoto), valida
+    esses bytes em vez de ler os arquivos.
+    """
+    validar = ler_e_validar if com_dados else validar_nfce
+    caminhos = list(caminhos)
+    conteudos = [[dados[caminho] for caminho in caminhos]] if dados is not None else []
+    if len(caminhos) < VALIDACAO_LOTE_MINIMO:
+        return dict(zip(caminhos, map(validar, caminhos, *conteudos)))
+
+    processos = max_processos or os.cpu_count() or 1
+    # Lotes grandes reduzem o overhead de IPC, mas deixamos ~4 lotes por processo
+    # para equilibrar a carga entre eles
+    chunk = max(1, min(VALIDACAO_CHUNK_MAXIMO, len(caminhos) // (processos * 4)))
+    try:
+        inicializador = reduzir_prioridade_thread if baixa_prioridade else None
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processos, initializer=inicializador) as executor:
+            return dict(zip(caminhos, executor.map(validar, caminhos, *conteudos, chunksize=chunk)))
+    except Exception as e:
+        print(f'Erro no pool de validação, validando sequencialmente: {e}')
+        return dict(zip(caminhos, map(validar, caminhos, *conteudos)))
@@ -0,0 +1,117 @@
+import http.server
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+
+import pytest
+
+# verificador_nfce.py fica na raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def criar_servidor_destino(pasta, porta=0, latencia=(0.0, 0.0), taxa_erros=0.0):
+    """
+    Servidor HTTP mínimo com o protocolo do DestinoHTTP, que guarda as notas
+    numa pasta local sem sobrescrever (criação exclusiva): um destino remoto
+    de teste, sem servidor de verdade. `latencia` (segundos, mínimo e máximo)
+    e `taxa_erros` (respostas 503) simulam uma rede ruim para exercitar as
+    tentativas. Retorna o ThreadingHTTPServer; quem chama roda serve_forever.
+    """
+    raiz = os.path.abspath(pasta)
+    aleatorio = random.Random()
+
+    class Manipulador(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive: o cliente reaproveita as conexões
+
+        def _caminho(self):
+            relativo = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path).strip('/')
+            caminho = os.path.normpath(os.path.join(raiz, relativo))
+            return caminho if caminho.startswith(raiz + os.sep) else None
+
+        def _responder(self, status, corpo=b''):
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def _falhar(self):
+            if latencia[1]:
+                time.sleep(aleatorio.uniform(*latencia))
+            if taxa_erros and aleatorio.random() < taxa_erros:
+                self._responder(503)
+                return True
+            return False
+
+        def do_GET(self):
+            if self._falhar():
+                return
+            caminho = self._caminho()
+            if caminho is None:
+                self._responder(403)
+            elif os.path.isdir(caminho):
+                with os.scandir(caminho) as entradas:
+                    entradas = list(entradas)
+                if urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query).get('detalhes'):
+                    corpo = {'pastas': sorted(e.name for e in entradas if e.is_dir()),
+                             'arquivos': {e.name: e.stat().st_size for e in entradas if e.is_file()}}
+                else:
+                    corpo = sorted(e.name for e in entradas)
+                self._responder(200, json.dumps(corpo).encode())
+            elif os.path.isfile(caminho):
+                with open(caminho, 'rb') as f:
+                    self._responder(200, f.read())
+            else:
+                self._responder(404)
+
+        def do_HEAD(self):
+            if self._falhar():
+                return
+            caminho = self._caminho()
+            self._responder(403 if caminho is None else 200 if os.path.isfile(caminho) else 404)
+
+        def do_PUT(self):
+            dados = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if self._falhar():
+                return
+            caminho = self._caminho()
+            if caminho is None:
+                self._responder(403)
+                return
+            try:
+                os.makedirs(os.path.dirname(caminho), exist_ok=True)
+                with open(caminho, 'xb') as f:
+                    f.write(dados)
+                if self.headers.get('X-Mtime'):
+                    mtime = float(self.headers['X-Mtime'])
+                    os.utime(caminho, (mtime, mtime))
+            except FileExistsError:
+                self._responder(412)
+                return
+            except Exception as e:
+                print(f'Erro ao gravar {caminho}: {e}')
+                self._responder(500)
+                return
+            self._responder(201)
+
+        def log_message(self, *args):
+            pass
+
+    return http.server.ThreadingHTTPServer(('127.0.0.1', porta), Manipulador)
+
+
+@pytest.fixture
+def servidor(tmp_path):
+    """Destino HTTP de teste numa porta livre: (endereço, pasta onde grava)"""
+    pasta = tmp_path / 'servidor'
+    pasta.mkdir()
+    servidor = criar_servidor_destino(str(pasta))
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{servidor.server_address[1]}', pasta
+    servidor.shutdown()
+    servidor.server_close()
+    thread.join()
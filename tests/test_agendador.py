@@ -0,0 +1,56 @@
+import datetime
+
+from nfce_ciclo import AgendadorTrabalho, ItemPlano
+
+AGORA = datetime.datetime(2025, 10, 15, 12, 0)
+
+
+def _item(nome, ano=2025, mes='MES 10', idade=7200):
+    """Item do plano gravado há `idade` segundos"""
+    return ItemPlano(nome, f'/origem/{nome}', ano, mes, 'PDV-031', '/destino', f'/destino/{nome}', 100, False,
+                     AGORA.timestamp() - idade)
+
+
+def _nomes(itens):
+    return [item.arquivo for item in itens]
+
+
+def test_mes_corrente_e_recentes_primeiro():
+    itens = [_item('backlog-1', mes='MES 08'), _item('corrente-antigo', idade=86400), _item('corrente-novo'),
+             _item('recente-de-setembro', mes='MES 09', idade=60), _item('ano-passado', ano=2024)]
+    prioritarios, backlog, adiados = AgendadorTrabalho().agendar(itens, AGORA)
+    # Prioritário do mais novo para o mais antigo; backlog na ordem do plano
+    assert _nomes(prioritarios) == ['recente-de-setembro', 'corrente-novo', 'corrente-antigo']
+    assert _nomes(backlog) == ['backlog-1', 'ano-passado']
+    assert adiados == []
+
+
+def test_capacidade_reserva_fracao_para_o_backlog():
+    itens = [_item(f'corrente-{i}', idade=i) for i in range(10)] + [_item(f'backlog-{i}', mes='MES 01')
+                                                                   for i in range(10)]
+    prioritarios, backlog, adiados = AgendadorTrabalho(capacidade=8, fracao_backlog=0.25).agendar(itens, AGORA)
+    assert _nomes(prioritarios) == [f'corrente-{i}' for i in range(6)]
+    assert _nomes(backlog) == ['backlog-0', 'backlog-1']
+    assert len(adiados) == 12
+
+
+def test_vagas_livres_vao_para_o_backlog():
+    itens = [_item('corrente')] + [_item(f'backlog-{i}', mes='MES 01') for i in range(10)]
+    prioritarios, backlog, adiados = AgendadorTrabalho(capacidade=5, fracao_backlog=0.25).agendar(itens, AGORA)
+    assert _nomes(prioritarios) == ['corrente']
+    assert len(backlog) == 4 and len(adiados) == 6
+
+
+def test_fracao_minima_e_zero():
+    itens = [_item(f'corrente-{i}', idade=i) for i in range(5)] + [_item('backlog', mes='MES 01')]
+    # Fração positiva garante ao menos uma vaga ao backlog
+    prioritarios, backlog, _ = AgendadorTrabalho(capacidade=3, fracao_backlog=0.1).agendar(itens, AGORA)
+    assert len(prioritarios) == 2 and _nomes(backlog) == ['backlog']
+    # Fração 0: o backlog só usa o que sobrar do prioritário
+    prioritarios, backlog, adiados = AgendadorTrabalho(capacidade=3, fracao_backlog=0).agendar(itens, AGORA)
+    assert len(prioritarios) == 3 and backlog == [] and len(adiados) == 3
+
+
+def test_de_config():
+    agendador = AgendadorTrabalho.de_config({'capacidade_ciclo': '50', 'fracao_backlog': 2, 'janela_recentes': 60})
+    assert (agendador.capacidade, agendador.fracao_backlog, agendador.janela_recentes) == (50, 1.0, 60)
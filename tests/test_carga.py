@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+
+import nfce_destinos
+from nfce_carga import carga_pendente, executar_carga_inicial
+
+CNPJ = '02775652000123'
+XML = (
+    '<?xml version="1.0" encoding="UTF-8"?><nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">'
+    '<NFe><infNFe Id="NFe{chave}" versao="4.00"><ide><serie>{serie}</serie><nNF>{numero}</nNF>'
+    '<dhEmi>2025-10-01T10:00:00-03:00</dhEmi></ide><emit><CNPJ>' + CNPJ + '</CNPJ></emit>'
+    '<total><ICMSTot><vNF>157.50</vNF></ICMSTot></total></infNFe></NFe>'
+    '<protNFe versao="4.00"><infProt><chNFe>{chave}</chNFe><cStat>100</cStat></infProt></protNFe></nfeProc>'
+)
+
+
+def _nome(ano, mes, pdv, numero):
+    return f'35{ano % 100}{mes:02d}{CNPJ}65{pdv:03d}{numero:09d}1{numero:08d}0-NFCe.xml'
+
+
+def _origem(tmp_path):
+    """Pasta com dois anos de arquivo, 2 meses por ano e 2 PDVs: 24 notas válidas e 1 inválida"""
+    origem = tmp_path / 'origem'
+    for ano in (2024, 2025):
+        for mes in (1, 2):
+            pasta = origem / f'Ano {ano}' / f'Mes {mes:02d}'
+            pasta.mkdir(parents=True)
+            for pdv in (31, 32):
+                for numero in range(1, 4):
+                    numero += 100 * mes
+                    nome = _nome(ano, mes, pdv, numero)
+                    (pasta / nome).write_text(XML.format(chave=nome[:44], serie=pdv, numero=numero),
+                                              encoding='utf-8')
+    (origem / 'Ano 2025' / 'Mes 02' / f'3525020{"0" * 37}-NFCe.xml').write_text('<lixo', encoding='utf-8')
+    return str(origem)
+
+
+def _notas_no_destino(destino):
+    return sorted(nome for _, _, nomes in os.walk(destino) for nome in nomes if nome.endswith('.xml'))
+
+
+def test_carga_completa(tmp_path):
+    origem, destino, checkpoint = _origem(tmp_path), str(tmp_path / 'destino'), str(tmp_path / 'carga.json')
+    progresso = []
+    estado = executar_carga_inicial(origem, destino, checkpoint=checkpoint, lote=10,
+                                    progresso=lambda *args: progresso.append(args))
+    assert estado['concluida']
+    assert {chave: estado[chave] for chave in ('processados', 'copiados', 'existentes', 'invalidos', 'erros')} == {
+        'processados': 25, 'copiados': 24, 'existentes': 0, 'invalidos': 1, 'erros': 0}
+    assert len(_notas_no_destino(destino)) == 24
+    assert os.path.isdir(os.path.join(destino, 'NFCE', '2024', 'PDV-031', 'MES 01'))
+    # Um progresso por lote, com o total estimado chegando ao real
+    assert [processados for processados, *_ in progresso] == [10, 20, 25]
+    assert progresso[-1][1] == 25
+    assert carga_pendente(checkpoint) is None
+
+
+def test_retoma_do_checkpoint(tmp_path):
+    origem, destino, checkpoint = _origem(tmp_path), str(tmp_path / 'destino'), str(tmp_path / 'carga.json')
+    lotes = []
+    estado = executar_carga_inicial(origem, destino, checkpoint=checkpoint, lote=7,
+                                    progresso=lambda *args: lotes.append(args), parar=lambda: len(lotes) >= 2)
+    assert not estado['concluida'] and estado['processados'] == 14
+    pendente = carga_pendente(checkpoint)
+    assert pendente['cursor'] == estado['cursor'] and pendente['origem'] == origem
+    copiadas = _notas_no_destino(destino)
+    assert len(copiadas) == 14
+
+    # Enquanto isso o monitoramento copiou uma nota que a carga ainda não viu
+    with open(checkpoint, encoding='utf-8') as f:
+        assert json.load(f)['cursor'][:2] == ['Ano 2025', 'Mes 01']
+    nome = _nome(2025, 2, 32, 203)
+    pasta = os.path.join(destino, 'NFCE', '2025', 'PDV-032', 'MES 02')
+    os.makedirs(pasta)
+    shutil.copy2(os.path.join(origem, 'Ano 2025', 'Mes 02', nome), os.path.join(pasta, nome))
+
+    estado = executar_carga_inicial(origem, destino, checkpoint=checkpoint, lote=7)
+    assert estado['concluida']
+    # Nada foi processado duas vezes
+    assert (estado['processados'], estado['copiados'], estado['existentes'], estado['invalidos']) == (25, 23, 1, 1)
+    assert len(_notas_no_destino(destino)) == 24
+
+    # Com a carga concluída, a próxima começa do zero (e só encontra o que já existe)
+    estado = executar_carga_inicial(origem, destino, checkpoint=checkpoint, lote=7)
+    assert (estado['processados'], estado['copiados'], estado['existentes']) == (25, 0, 24)
+
+
+def test_falhas_tentadas_de_novo(tmp_path, monkeypatch):
+    origem, destino, checkpoint = _origem(tmp_path), str(tmp_path / 'destino'), str(tmp_path / 'carga.json')
+    gravar_nota = nfce_destinos.gravar_nota
+
+    def falhar_no_pdv_032(destino_final, *args, **kwargs):
+        if 'PDV-032' in destino_final:
+            raise OSError(5, 'falha simulada')
+        return gravar_nota(destino_final, *args, **kwargs)
+    monkeypatch.setattr(nfce_destinos, 'gravar_nota', falhar_no_pdv_032)
+    estado = executar_carga_inicial(origem, destino, checkpoint=checkpoint, lote=10)
+    # As falhas são tentadas de novo ao fim da enumeração e continuam pendentes
+    assert not estado['concluida']
+    assert (estado['processados'], estado['copiados'], estado['erros'], len(estado['falhas'])) == (25, 12, 12, 12)
+    assert carga_pendente(checkpoint)
+
+    monkeypatch.setattr(nfce_destinos, 'gravar_nota', gravar_nota)
+    estado = executar_carga_inicial(origem, destino, checkpoint=checkpoint, lote=10)
+    assert estado['concluida']
+    assert (estado['processados'], estado['copiados'], estado['erros'], estado['falhas']) == (25, 24, 0, [])
+    assert len(_notas_no_destino(destino)) == 24
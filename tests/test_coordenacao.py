@@ -0,0 +1,94 @@
+import json
+import os
+import time
+
+import pytest
+
+from nfce_coordenacao import COORDENACAO_PASTA, CoordenadorNos
+
+
+@pytest.fixture
+def nos(tmp_path):
+    """Cria nós no mesmo destino e encerra as threads de batimento ao fim"""
+    criados = []
+
+    def criar(nome, ttl=60):
+        no = CoordenadorNos(str(tmp_path), nome, ttl)
+        criados.append(no)
+        return no
+    yield criar
+    for no in criados:
+        no.encerrar()
+
+
+def _dono(tmp_path, grupo='2025_PDV-031_MES 10'):
+    with open(os.path.join(tmp_path, COORDENACAO_PASTA, f'{grupo}.lease'), encoding='utf-8') as f:
+        return json.load(f)['no']
+
+
+def test_trabalho_dividido_entre_nos_ativos(tmp_path, nos):
+    a, b = nos('a'), nos('b')
+    assert a.reivindicar(2025, 'PDV-031', 'MES 10')
+    assert not b.reivindicar(2025, 'PDV-031', 'MES 10')
+    assert b.reivindicar(2025, 'PDV-032', 'MES 10')
+    # O lease continua do dono enquanto ele estiver vivo
+    assert a.reivindicar(2025, 'PDV-031', 'MES 10')
+    assert not a.reivindicar(2025, 'PDV-032', 'MES 10')
+    assert _dono(tmp_path) == 'a'
+
+
+def test_lease_de_no_parado_e_assumido(tmp_path, nos):
+    a, b = nos('a'), nos('b', ttl=0.2)
+    assert a.reivindicar(2025, 'PDV-031', 'MES 10')
+    # O nó "a" trava: o batimento para, mas o lease fica no destino
+    a.parar.set()
+    a.thread.join()
+    # Primeira observação do batimento: ainda não dá para saber se parou
+    assert not b.reivindicar(2025, 'PDV-031', 'MES 10')
+    time.sleep(0.3)
+    assert b.reivindicar(2025, 'PDV-031', 'MES 10')
+    assert _dono(tmp_path) == 'b'
+    assert not [nome for nome in os.listdir(tmp_path / COORDENACAO_PASTA) if nome.endswith('.antigo')]
+
+
+def test_lease_de_no_sem_batimento_e_assumido_na_hora(tmp_path, nos):
+    a, b = nos('a'), nos('b')
+    assert a.reivindicar(2025, 'PDV-031', 'MES 10')
+    a.parar.set()
+    os.remove(tmp_path / COORDENACAO_PASTA / 'no_a.json')
+    assert b.reivindicar(2025, 'PDV-031', 'MES 10')
+
+
+def test_encerrar_libera_os_leases(tmp_path, nos):
+    a, b = nos('a'), nos('b')
+    assert a.reivindicar(2025, 'PDV-031', 'MES 10')
+    a.encerrar()
+    assert not os.path.exists(tmp_path / COORDENACAO_PASTA / 'no_a.json')
+    assert b.reivindicar(2025, 'PDV-031', 'MES 10')
+    assert _dono(tmp_path) == 'b'
+
+
+def test_lease_tomado_por_outro_no_meio_volta_para_o_lugar(tmp_path, nos, monkeypatch):
+    a, b = nos('a'), nos('b')
+    assert a.reivindicar(2025, 'PDV-031', 'MES 10')
+    # "b" vê o lease de "a" como parado, mas entre a leitura e o rename um
+    # terceiro nó já o assumiu: o lease retirado é o do terceiro e é devolvido
+    monkeypatch.setattr(b, 'vivo', lambda no: False)
+    caminho = b._arquivo_lease(2025, 'PDV-031', 'MES 10')
+    ler = b._ler
+
+    def ler_e_trocar(arquivo):
+        dados = ler(arquivo)
+        if arquivo == caminho and dados and dados['no'] == 'a':
+            with open(caminho, 'w', encoding='utf-8') as f:
+                json.dump({'no': 'c'}, f)
+        return dados
+    monkeypatch.setattr(b, '_ler', ler_e_trocar)
+    assert not b.reivindicar(2025, 'PDV-031', 'MES 10')
+    assert _dono(tmp_path) == 'c'
+    assert not [nome for nome in os.listdir(tmp_path / COORDENACAO_PASTA) if nome.endswith('.antigo')]
+
+
+def test_destino_remoto_nao_e_suportado():
+    with pytest.raises(ValueError):
+        CoordenadorNos('http://servidor/nfce', 'a')
@@ -0,0 +1,78 @@
+import errno
+import hashlib
+import os
+
+import pytest
+
+import nfce_destinos
+from nfce_destinos import gravar_deduplicado, situacao_blobs
+
+XML = b'<nfeProc><NFe>mesmo conteudo</NFe></nfeProc>'
+
+
+def _destino(tmp_path, *partes):
+    pasta = tmp_path.joinpath('NFCE', '2025', 'PDV-031', 'MES 10')
+    pasta.mkdir(parents=True, exist_ok=True)
+    return str(pasta.joinpath(*partes))
+
+
+def test_conteudo_igual_ocupa_o_disco_uma_vez(tmp_path):
+    blobs = str(tmp_path / '.nfce_blobs')
+    primeiro, segundo = _destino(tmp_path, 'a-NFCe.xml'), _destino(tmp_path, 'b-NFCe.xml')
+    assert not gravar_deduplicado(primeiro, XML, blobs)
+    assert gravar_deduplicado(segundo, XML, blobs)
+
+    digest = hashlib.sha256(XML).hexdigest()
+    blob = os.path.join(blobs, digest[:2], digest + '.xml')
+    assert os.path.samefile(primeiro, blob) and os.path.samefile(segundo, blob)
+    with open(segundo, 'rb') as f:
+        assert f.read() == XML
+    assert not gravar_deduplicado(_destino(tmp_path, 'c-NFCe.xml'), b'<outro/>', blobs)
+
+    situacao = situacao_blobs([blobs])
+    assert (situacao['blobs'], situacao['referencias'], situacao['orfaos']) == (2, 3, 0)
+    assert situacao['bytes_economizados'] == len(XML)
+
+
+def test_nao_sobrescreve(tmp_path):
+    blobs = str(tmp_path / '.nfce_blobs')
+    caminho = _destino(tmp_path, 'a-NFCe.xml')
+    gravar_deduplicado(caminho, XML, blobs)
+    with pytest.raises(FileExistsError):
+        gravar_deduplicado(caminho, b'<outra versao/>', blobs)
+    with open(caminho, 'rb') as f:
+        assert f.read() == XML
+
+
+def test_orfaos_contados_e_removidos(tmp_path):
+    blobs = str(tmp_path / '.nfce_blobs')
+    caminho = _destino(tmp_path, 'a-NFCe.xml')
+    gravar_deduplicado(caminho, XML, blobs)
+    gravar_deduplicado(_destino(tmp_path, 'b-NFCe.xml'), b'<outro/>', blobs)
+    # Ex.: a nota foi movida para outro shard e o blob ficou sem caminho visível
+    os.remove(caminho)
+    assert situacao_blobs([blobs])['orfaos'] == 1
+    assert situacao_blobs([blobs], limpar_orfaos=True)['orfaos'] == 1
+    situacao = situacao_blobs([blobs])
+    assert (situacao['blobs'], situacao['orfaos']) == (1, 0)
+
+
+def test_volume_sem_hardlink_grava_copia_normal(tmp_path, monkeypatch):
+    monkeypatch.setattr(nfce_destinos, '_BLOBS_SEM_HARDLINK', set())
+    monkeypatch.setattr(nfce_destinos, '_PASTAS_SEM_HARDLINK', set())
+
+    def sem_hardlink(origem, destino):
+        raise OSError(errno.EPERM, 'hardlink não suportado', destino)
+    monkeypatch.setattr(os, 'link', sem_hardlink)
+    blobs = str(tmp_path / '.nfce_blobs')
+    primeiro, segundo = _destino(tmp_path, 'a-NFCe.xml'), _destino(tmp_path, 'b-NFCe.xml')
+    assert not gravar_deduplicado(primeiro, XML, blobs)
+    assert not gravar_deduplicado(segundo, XML, blobs)
+    for caminho in (primeiro, segundo):
+        with open(caminho, 'rb') as f:
+            assert f.read() == XML
+    # Sem link o blob pareceria órfão: nenhum fica guardado
+    assert not [arquivo for _, _, arquivos in os.walk(blobs) for arquivo in arquivos]
+    assert blobs in nfce_destinos._BLOBS_SEM_HARDLINK
+    with pytest.raises(FileExistsError):
+        gravar_deduplicado(primeiro, XML, blobs)
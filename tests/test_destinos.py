@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from nfce_ciclo import CopiadorNotas, ItemPlano
+from nfce_destinos import DestinoLocal, DestinoRemoto, MapaDestinos
+
+NOME = '35251002775652000123650320000001001000000001-NFCe.xml'
+XML = b'<nfeProc><NFe/></nfeProc>'
+
+
+@pytest.fixture(params=['local', 'http'])
+def mapa(request, tmp_path, servidor):
+    if request.param == 'local':
+        return MapaDestinos(str(tmp_path / 'destino')), tmp_path / 'destino'
+    endereco, pasta = servidor
+    return MapaDestinos.de_config(endereco, {'destino_remoto': {'tentativas': 1}}), pasta
+
+
+def _item(tmp_path, mapa, nome=NOME):
+    origem = tmp_path / 'origem' / 'Mes 10'
+    origem.mkdir(parents=True, exist_ok=True)
+    (origem / nome).write_bytes(XML)
+    pasta_destino = mapa.pasta(2025, 'PDV-032', 'MES 10', nome)
+    return ItemPlano(nome, str(origem / nome), 2025, 'MES 10', 'PDV-032', pasta_destino,
+                       os.path.join(pasta_destino, nome), len(XML), False, 0)
+
+
+def test_destinos_tem_a_mesma_interface(tmp_path, servidor):
+    endereco, pasta = servidor
+    for destino, raiz in ((DestinoLocal(str(tmp_path / 'local')), tmp_path / 'local'),
+                          (DestinoRemoto.de_config(endereco, {}), pasta)):
+        assert destino.disponivel() == (True, '')
+        assert destino.listar(os.path.join('2025', 'PDV-032')) == set()
+        destino.gravar(os.path.join('2025', 'PDV-032', 'a.xml'), XML, 1700000000.0)
+        with pytest.raises(FileExistsError):
+            destino.gravar(os.path.join('2025', 'PDV-032', 'a.xml'), b'outro')
+        resultados = destino.enviar_lote([
+            (os.path.join('2025', 'PDV-032', 'a.xml'), XML, None, None),
+            (os.path.join('2025', 'PDV-032', 'b.xml'), XML, None, None),
+        ])
+        assert isinstance(resultados[0], FileExistsError) and not isinstance(resultados[1], Exception)
+        assert destino.listar(os.path.join('2025', 'PDV-032')) == {'a.xml', 'b.xml'}
+        assert (raiz / 'NFCE' / '2025' / 'PDV-032' / 'a.xml').read_bytes() == XML
+
+
+def test_copiador_grava_pelo_destino(tmp_path, mapa):
+    mapa, raiz = mapa
+    eventos = []
+    copiador = CopiadorNotas(mapa, evento=lambda arquivo, status, *args, **kwargs: eventos.append(status))
+    item = _item(tmp_path, mapa)
+    gravados = copiador.copiar(item, (True, '', None, XML)) + copiador.concluir()
+    assert gravados == [item]
+    assert mapa.listar(item.pasta_destino) == {NOME}
+    assert (raiz / 'NFCE' / mapa.relativo(item.destino_final)).read_bytes() == XML
+
+    # A segunda cópia não sobrescreve: conta como já existente
+    assert copiador.copiar(item, (True, '', None, XML)) + copiador.concluir() == []
+    assert eventos == ['Copiado', 'Já existe']
+    assert copiador.contadores['copiados'] == 1
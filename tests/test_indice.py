@@ -0,0 +1,82 @@
+import hashlib
+
+import pytest
+
+from nfce_indice import IndiceNotas
+
+CNPJ = '02775652000123'
+
+
+def _metadados(numero, pdv='PDV-031', dia=3, valor=100.0, cnpj=CNPJ):
+    return {
+        'tipo': 'NFCe', 'chave': f'{numero:044d}', 'cnpj': cnpj,
+        'data_emissao': f'2025-10-{dia:02d}T10:{numero % 60:02d}:00-03:00', 'valor_total': valor,
+        'pdv': pdv, 'serie': int(pdv[-3:]), 'numero': numero, 'numero_final': None, 'cstat': '100',
+    }
+
+
+@pytest.fixture
+def indice(tmp_path):
+    indice = IndiceNotas(str(tmp_path / 'indice.db'))
+    yield indice
+    indice.fechar()
+
+
+def _registrar(indice, metadados, dados=None):
+    arquivo = f'{metadados["chave"]}-NFCe.xml'
+    indice.registrar(metadados, arquivo, f'/destino/{arquivo}', dados)
+
+
+def test_consultar_por_pdv_data_cnpj_e_valor(indice):
+    _registrar(indice, _metadados(1, valor=50.0))
+    _registrar(indice, _metadados(2, valor=600.0))
+    _registrar(indice, _metadados(3, pdv='PDV-032', valor=700.0))
+    _registrar(indice, _metadados(4, dia=5, valor=800.0))
+    _registrar(indice, _metadados(5, cnpj='11111111000111', valor=900.0))
+
+    assert [nota['numero'] for nota in indice.consultar(pdv='PDV-031', data='2025-10-03', cnpj=CNPJ,
+                                                        valor_minimo=500)] == [2]
+    assert [nota['numero'] for nota in indice.consultar(data='2025-10-03', data_final='2025-10-05',
+                                                        valor_maximo=700)] == [1, 2, 3]
+    assert len(indice.consultar(limite=2)) == 2
+    # A emissão guarda a hora local, sem o fuso, e a data à parte
+    nota = indice.consultar(pdv='PDV-032')[0]
+    assert (nota['data_emissao'], nota['data']) == ('2025-10-03T10:03:00', '2025-10-03')
+    assert nota['caminho'] == f'/destino/{nota["chave"]}-NFCe.xml'
+
+
+def test_registrar_de_novo_substitui_e_sem_chave_ignora(indice):
+    _registrar(indice, _metadados(1, valor=10.0))
+    _registrar(indice, _metadados(1, valor=20.0))
+    indice.registrar({'tipo': 'NFCe'}, 'sem-chave.xml', '/destino/sem-chave.xml')
+    assert [nota['valor_total'] for nota in indice.consultar()] == [20.0]
+
+
+def test_hashes_caminhos_e_mover(indice):
+    _registrar(indice, _metadados(2), b'<nota 2/>')
+    _registrar(indice, _metadados(1))
+    assert indice.hash_registrado(f'{2:044d}') == hashlib.sha256(b'<nota 2/>').hexdigest()
+    assert indice.hash_registrado(f'{1:044d}') is None
+    indice.registrar_hash(f'{1:044d}', 'abc')
+    assert indice.hash_registrado(f'{1:044d}') == 'abc'
+
+    # Percorre o índice em fatias, em ordem de chave
+    assert [chave for chave, _ in indice.caminhos(limite=1)] == [f'{1:044d}']
+    assert [chave for chave, _ in indice.caminhos(apos=f'{1:044d}')] == [f'{2:044d}']
+    indice.mover(f'{2:044d}', '/outro/shard/nota.xml')
+    assert dict(indice.caminhos())[f'{2:044d}'] == '/outro/shard/nota.xml'
+
+
+def test_confirma_em_lotes_e_persiste(tmp_path, monkeypatch):
+    caminho = str(tmp_path / 'indice.db')
+    monkeypatch.setattr(IndiceNotas, 'LOTE_COMMIT', 3)
+    indice = IndiceNotas(caminho)
+    for numero in range(1, 5):
+        _registrar(indice, _metadados(numero))
+    # A terceira escrita confirmou o lote; a quarta espera o fim do ciclo
+    assert indice.pendentes == 1
+    outra = IndiceNotas(caminho)
+    assert len(outra.consultar()) == 3
+    indice.fechar()
+    assert len(outra.consultar()) == 4
+    outra.fechar()
@@ -0,0 +1,68 @@
+import datetime
+import os
+
+import pytest
+
+from nfce_destinos import MapaDestinos
+from nfce_layout import extrair_pdv_do_arquivo, LayoutDestino, normalizar_pdv
+
+CNPJ = '02775652000123'
+NFCE = f'352510{CNPJ}650310000001231000001230-NFCe.xml'
+INUTILIZACAO = f'3525{CNPJ}65032000000005000000007-InutNFCe.xml'
+GRAVADO = datetime.datetime(2025, 10, 5, 14, 0).timestamp()
+
+
+def test_layout_padrao():
+    layout = LayoutDestino.compilar()
+    assert layout.padrao
+    assert layout.construir('/NFCE', 2025, 'PDV-031', 'MES 10', NFCE, GRAVADO) == os.path.join(
+        '/NFCE', '2025', 'PDV-031', 'MES 10')
+
+
+def test_template_com_campos_da_chave_e_da_data():
+    layout = LayoutDestino('{cnpj}/{ano}/{mes_num}/{dia}/{tipo}-{serie}')
+    assert not layout.padrao
+    assert layout.construir('/NFCE', 2025, 'PDV-031', 'MES 10', NFCE, GRAVADO) == os.path.join(
+        '/NFCE', CNPJ, '2025', '10', '05', 'NFCe-031')
+    assert layout.construir('/NFCE', 2025, 'PDV-032', 'MES 10', INUTILIZACAO, GRAVADO) == os.path.join(
+        '/NFCE', CNPJ, '2025', '10', '05', 'InutNFCe-032')
+    # Nome fora do padrão não derruba a cópia: vai para uma pasta 'desconhecido'
+    assert layout.construir('/NFCE', 2025, 'PDV-000', 'MES 10', 'relatorio.xml', GRAVADO) == os.path.join(
+        '/NFCE', 'desconhecido', '2025', '10', '05', 'NFCe-desconhecido')
+    assert LayoutDestino('{data}/{ano_emissao}-{mes_emissao}').construir(
+        '/NFCE', 2025, 'PDV-031', 'MES 10', NFCE, GRAVADO) == os.path.join('/NFCE', '2025-10-05', '2025-10')
+
+
+@pytest.mark.parametrize('template, erro', [
+    ('', 'vazio'),
+    ('{ano}/../{pdv}', 'Segmento inválido'),
+    ('{loja}/{ano}', 'Campo desconhecido'),
+    ('{ano!x}', 'Conversão desconhecida'),
+    ('{ano:{pdv}}', 'Formato inválido'),
+    ('{pdv:d}', 'Formato inválido'),
+])
+def test_template_invalido_falha_ao_carregar(template, erro):
+    with pytest.raises(ValueError, match=erro):
+        LayoutDestino(template)
+
+
+def test_compilar_compartilha_o_layout_e_o_cache_de_pastas(tmp_path):
+    layout = LayoutDestino.compilar('{pdv}/{ano}')
+    assert LayoutDestino.compilar('{pdv}/{ano}') is layout
+    mapa = MapaDestinos(str(tmp_path), layout=layout)
+    pasta = mapa.pasta(2025, 'PDV-031', 'MES 10', NFCE)
+    assert pasta == os.path.join(str(tmp_path), 'NFCE', 'PDV-031', '2025')
+    assert layout.garantir(pasta) == pasta and os.path.isdir(pasta)
+    # Pasta apagada por fora: o cache só é refeito depois de esquecer
+    os.rmdir(pasta)
+    layout.garantir(pasta)
+    assert not os.path.isdir(pasta)
+    layout.esquecer()
+    layout.garantir(pasta)
+    assert os.path.isdir(pasta)
+
+
+def test_pdv_a_partir_do_nome():
+    assert extrair_pdv_do_arquivo(NFCE) == 'PDV-031'
+    assert extrair_pdv_do_arquivo(INUTILIZACAO) == 'PDV-032'
+    assert [normalizar_pdv(texto) for texto in ('31', '031', 'pdv31', 'PDV-031')] == ['PDV-031'] * 4
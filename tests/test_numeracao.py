@@ -0,0 +1,108 @@
+from nfce_ciclo import ItemPlano
+from nfce_numeracao import decodificar_numeracao, DetectorLacunas, MarcasNumeracao
+
+CNPJ = '02775652000123'
+
+
+def _nfce(numero, serie=31):
+    return f'352510{CNPJ}65{serie:03d}{numero:09d}1{numero:08d}0-NFCe.xml'
+
+
+def _inutilizacao(inicial, final, serie=31):
+    return f'3525{CNPJ}65{serie:03d}{inicial:09d}{final:09d}-InutNFCe.xml'
+
+
+def _itens(*nomes, mes='MES 10'):
+    return [ItemPlano(nome, f'/origem/{nome}', 2025, mes, 'PDV-031', '/destino', f'/destino/{nome}', 100, False, 0)
+            for nome in nomes]
+
+
+def test_decodificar_numeracao():
+    assert decodificar_numeracao(_nfce(42)) == ('PDV-031', 31, 42, 42, 'NFCe')
+    assert decodificar_numeracao(_inutilizacao(9, 7)) == ('PDV-031', 31, 7, 9, 'InutNFCe')
+    assert decodificar_numeracao('relatorio.xml') is None
+
+
+def test_lacunas_explicadas_e_duplicidades(tmp_path):
+    detector = DetectorLacunas(str(tmp_path / 'lacunas.json'))
+    for numero in (1, 2, 5, 6, 9, 10):
+        assert not detector.registrar(_nfce(numero))
+    assert not detector.registrar(_nfce(1, serie=32))
+    assert not detector.registrar(_inutilizacao(7, 8))
+    # O mesmo número por outro arquivo é duplicidade; o que já estava no destino não
+    assert detector.registrar(_nfce(5))
+    assert not detector.registrar(_nfce(6), verificar_duplicado=False)
+
+    assert detector.lacunas() == {
+        ('PDV-031', 31): {'faltando': [(3, 4)], 'explicadas': [(7, 8)], 'duplicados': [5]},
+        ('PDV-032', 32): {'faltando': [], 'explicadas': [], 'duplicados': []},
+    }
+
+
+def test_novas_lacunas_informadas_uma_vez(tmp_path):
+    detector = DetectorLacunas(str(tmp_path / 'lacunas.json'))
+    for numero in (1, 2, 6):
+        detector.registrar(_nfce(numero))
+    # A nota 3 está na origem, só não foi copiada ainda: não é lacuna
+    assert detector.novas_lacunas([_nfce(3)]) == [('PDV-031', 31, 4, 5)]
+    # Sem a nota 3 na origem a lacuna cresce e volta inteira
+    assert detector.novas_lacunas() == [('PDV-031', 31, 3, 5)]
+    assert detector.novas_lacunas() == []
+
+    # Fechar parte de uma lacuna informada não a informa de novo
+    detector.registrar(_nfce(4))
+    assert detector.novas_lacunas() == []
+    # Uma lacuna fechada sai do registro e, se voltar a abrir, é informada de novo
+    for numero in (3, 5):
+        detector.registrar(_nfce(numero))
+    assert detector.novas_lacunas() == []
+    detector.registrar(_nfce(8))
+    assert detector.novas_lacunas() == [('PDV-031', 31, 7, 7)]
+
+
+def test_persistencia(tmp_path):
+    caminho = str(tmp_path / 'lacunas.json')
+    detector = DetectorLacunas(caminho)
+    for nome in (_nfce(1), _nfce(4), _nfce(1), _inutilizacao(2, 2)):
+        detector.registrar(nome)
+    assert detector.novas_lacunas() == [('PDV-031', 31, 3, 3)]
+    detector.salvar()
+
+    recarregado = DetectorLacunas(caminho)
+    assert recarregado.lacunas() == detector.lacunas()
+    assert recarregado.novas_lacunas() == []
+    assert DetectorLacunas(caminho, carregar=False).lacunas() == {}
+
+
+def test_marcas_para_abaixo_do_menor_pendente(tmp_path):
+    marcas = MarcasNumeracao(str(tmp_path / 'marcas.json'))
+    itens = _itens(*(_nfce(numero) for numero in range(1, 7)), _nfce(3, serie=32), _inutilizacao(7, 8))
+    resolvidos = {_nfce(numero) for numero in (1, 2, 4, 5, 6)} | {_nfce(3, serie=32)}
+    marcas.atualizar(itens, resolvidos)
+    # A nota 3 ficou de fora (adiada, inválida...): continua candidata
+    assert marcas.marcas == {'2025|MES 10|PDV-031|31': 2, '2025|MES 10|PDV-032|32': 3}
+    assert marcas.conhecido(2025, 'MES 10', _nfce(2))
+    assert not marcas.conhecido(2025, 'MES 10', _nfce(3))
+    assert not marcas.conhecido(2025, 'MES 11', _nfce(1))
+    # Inutilizações e nomes fora do padrão são sempre candidatos
+    assert not marcas.conhecido(2025, 'MES 10', _inutilizacao(1, 1))
+
+    marcas.atualizar(_itens(_nfce(3), _nfce(7)), {_nfce(3), _nfce(7)})
+    assert marcas.marcas['2025|MES 10|PDV-031|31'] == 7
+
+
+def test_marcas_sem_resolvidos_mantem_o_piso(tmp_path):
+    caminho = str(tmp_path / 'marcas.json')
+    marcas = MarcasNumeracao(caminho)
+    marcas.atualizar(_itens(_nfce(1), _nfce(2)), {_nfce(1), _nfce(2)})
+    marcas.salvar()
+    # Destino fora do ar: nada resolvido, a marca não volta
+    marcas.atualizar(_itens(_nfce(3), _nfce(4)), set())
+    assert marcas.marcas['2025|MES 10|PDV-031|31'] == 2 and not marcas.alterado
+    # Um pendente abaixo da marca (arquivo fora de ordem) faz a marca recuar
+    marcas.atualizar(_itens(_nfce(1), _nfce(2), _nfce(5)), {_nfce(2), _nfce(5)})
+    assert marcas.marcas['2025|MES 10|PDV-031|31'] == 0 and marcas.alterado
+
+    assert MarcasNumeracao(caminho).marcas == {'2025|MES 10|PDV-031|31': 2}
+    marcas.salvar()
+    assert MarcasNumeracao(caminho).marcas == {'2025|MES 10|PDV-031|31': 0}
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from nfce_ciclo import reconciliar
+from nfce_destinos import MapaDestinos
+from nfce_layout import LayoutDestino
+
+CNPJ = '02775652000123'
+
+
+def _nome(pdv, numero):
+    return f'352510{CNPJ}65{pdv:03d}{numero:09d}1{numero:08d}0-NFCe.xml'
+
+
+def _origem(tmp_path, notas):
+    """Origem `Ano 2025/Mes 10` com as notas {nome: conteúdo}"""
+    pasta = tmp_path / 'origem' / 'Ano 2025' / 'Mes 10'
+    pasta.mkdir(parents=True)
+    for nome, dados in notas.items():
+        (pasta / nome).write_bytes(dados)
+    return str(pasta.parent)
+
+
+def _gravar(mapa, nome, dados, pdv='PDV-031'):
+    mapa.gravar(os.path.join(mapa.pasta(2025, pdv, 'MES 10', nome), nome), dados)
+
+
+@pytest.fixture(params=['local', 'http'])
+def mapa(request, tmp_path, servidor):
+    if request.param == 'local':
+        return MapaDestinos(str(tmp_path / 'destino'))
+    return MapaDestinos.de_config(servidor[0], {'destino_remoto': {'tentativas': 1}})
+
+
+def test_faltando_sobrando_e_tamanho_divergente(tmp_path, mapa):
+    origem = _origem(tmp_path, {_nome(31, 1): b'<a/>', _nome(31, 2): b'<b/>', _nome(31, 3): b'<c/>',
+                                _nome(32, 1): b'<d/>'})
+    _gravar(mapa, _nome(31, 1), b'<a/>')
+    _gravar(mapa, _nome(31, 2), b'<b com outro tamanho/>')
+    _gravar(mapa, _nome(31, 9), b'<extra/>')
+    _gravar(mapa, _nome(32, 1), b'<d/>', 'PDV-032')
+
+    relatorio = reconciliar(origem, mapa.bases[0], mapa)
+    assert relatorio[('PDV-031', 'MES 10')] == {
+        'origem': 3, 'destino': 3, 'faltando': [_nome(31, 3)], 'sobrando': [_nome(31, 9)],
+        'tamanho_divergente': [_nome(31, 2)],
+    }
+    assert relatorio[('PDV-032', 'MES 10')] == {
+        'origem': 1, 'destino': 1, 'faltando': [], 'sobrando': [], 'tamanho_divergente': [],
+    }
+
+
+def test_considera_todos_os_shards(tmp_path):
+    origem = _origem(tmp_path, {_nome(31, 1): b'<a/>', _nome(31, 2): b'<b/>'})
+    shards = [str(tmp_path / 'shard0'), str(tmp_path / 'shard1')]
+    # Uma nota no shard certo, outra ainda no antigo (antes do rebalanceamento)
+    mapa = MapaDestinos(shards[0], shards[1:], {'PDV-031': 1})
+    _gravar(mapa, _nome(31, 1), b'<a/>')
+    _gravar(MapaDestinos(shards[0]), _nome(31, 2), b'<b/>')
+
+    relatorio = reconciliar(origem, shards[0], mapa)
+    assert relatorio[('PDV-031', 'MES 10')]['destino'] == 2
+    assert not relatorio[('PDV-031', 'MES 10')]['faltando']
+
+
+def test_layout_personalizado_le_so_as_pastas_esperadas(tmp_path):
+    origem = _origem(tmp_path, {_nome(31, 1): b'<a/>', _nome(31, 2): b'<b/>'})
+    mapa = MapaDestinos(str(tmp_path / 'destino'), layout=LayoutDestino.compilar('{cnpj}/{ano}/{mes_num}'))
+    _gravar(mapa, _nome(31, 1), b'<a/>')
+    _gravar(mapa, _nome(31, 9), b'<extra/>')
+
+    # A pasta não diz a que PDV/mês um arquivo extra pertence: nada sobrando
+    assert reconciliar(origem, mapa.bases[0], mapa)[('PDV-031', 'MES 10')] == {
+        'origem': 2, 'destino': 1, 'faltando': [_nome(31, 2)], 'sobrando': [], 'tamanho_divergente': [],
+    }
@@ -0,0 +1,257 @@
+"""
+Ciclo da interface sob um compartilhamento de rede (SMB) simulado sobre o
+disco local: latência, limite de banda e falhas intermitentes na origem e
+no destino. Confere que o destino fica idêntico à origem e mede o custo do
+ciclo em operações no compartilhamento.
+"""
+import builtins
+import collections
+import errno
+import json
+import os
+import random
+import threading
+import time
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+pytest.importorskip('PyQt5')
+import verificador_nfce as v  # noqa: E402
+from nfce_ciclo import reconciliar  # noqa: E402
+from nfce_destinos import MapaDestinos  # noqa: E402
+
+CNPJ = '02775652000123'
+XML = (
+    '<?xml version="1.0" encoding="UTF-8"?><nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">'
+    '<NFe><infNFe Id="NFe{chave}" versao="4.00"><ide><serie>{serie}</serie><nNF>{numero}</nNF>'
+    '<dhEmi>2025-10-01T10:00:00-03:00</dhEmi></ide><emit><CNPJ>' + CNPJ + '</CNPJ></emit>'
+    '<total><ICMSTot><vNF>157.50</vNF></ICMSTot></total></infNFe></NFe>'
+    '<protNFe versao="4.00"><infProt><chNFe>{chave}</chNFe><cStat>100</cStat></infProt></protNFe></nfeProc>'
+)
+PDVS = (31, 32)
+NOTAS_POR_PDV = 20
+
+
+class _ArquivoSimulado:
+    """Arquivo aberto no compartilhamento simulado: leitura/escrita no ritmo do limite de banda"""
+
+    def __init__(self, arquivo, simulador):
+        self._arquivo = arquivo
+        self._simulador = simulador
+
+    def read(self, *args):
+        dados = self._arquivo.read(*args)
+        self._simulador._transferir(len(dados))
+        return dados
+
+    def write(self, dados):
+        # Falha no meio da escrita deixa um arquivo parcial, como numa queda de rede
+        if self._simulador._sortear_falha():
+            self._arquivo.write(dados[:len(dados) // 2])
+            raise self._simulador._erro('write', getattr(self._arquivo, 'name', ''))
+        self._simulador._transferir(len(dados))
+        return self._arquivo.write(dados)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._arquivo.close()
+        return False
+
+    def __iter__(self):
+        return iter(self._arquivo)
+
+    def __getattr__(self, nome):
+        return getattr(self._arquivo, nome)
+
+
+class SimuladorCompartilhamento:
+    """
+    Enquanto ativo (with), as chamadas de sistema de arquivos usadas pelo
+    motor (scandir, listdir, stat, mkdir, open, replace, remove, link, utime)
+    em caminhos abaixo de `raizes` ganham:
+    - latência por operação sorteada em `latencia` (segundos, mínimo e máximo);
+    - limite de banda em leitura e escrita (`bytes_por_segundo`, 0 = sem limite);
+    - erros intermitentes com probabilidade `taxa_erros` por operação (EIO,
+      ETIMEDOUT, ECONNRESET), inclusive escrita interrompida no meio.
+    As funções são trocadas no módulo os e em builtins, então valem para o
+    processo todo (threads incluídas) até sair do with. `semente` torna as
+    falhas reproduzíveis. Os contadores ficam em `operacoes`, `falhas` e
+    `bytes_transferidos`.
+    """
+    OPERACOES = ('scandir', 'listdir', 'stat', 'mkdir', 'replace', 'remove', 'link', 'utime')
+    ERROS = (errno.EIO, errno.ETIMEDOUT, errno.ECONNRESET)
+
+    def __init__(self, raizes, latencia=(0.0, 0.0), bytes_por_segundo=0, taxa_erros=0.0, semente=None):
+        self.raizes = [os.path.abspath(raiz) for raiz in raizes if raiz]
+        self.latencia = latencia
+        self.bytes_por_segundo = bytes_por_segundo
+        self.taxa_erros = taxa_erros
+        self.aleatorio = random.Random(semente)
+        self.lock = threading.Lock()
+        self.operacoes = collections.Counter()
+        self.falhas = collections.Counter()
+        self.bytes_transferidos = 0
+        self._originais = {}
+
+    def _remoto(self, caminho):
+        if isinstance(caminho, int):
+            return False  # descritor de arquivo
+        try:
+            caminho = os.path.abspath(os.fsdecode(caminho))
+        except TypeError:
+            return False
+        return any(caminho == raiz or caminho.startswith(raiz + os.sep) for raiz in self.raizes)
+
+    def _sortear_falha(self):
+        with self.lock:
+            return self.taxa_erros > 0 and self.aleatorio.random() < self.taxa_erros
+
+    def _erro(self, operacao, caminho):
+        with self.lock:
+            self.falhas[operacao] += 1
+            codigo = self.aleatorio.choice(self.ERROS)
+        return OSError(codigo, f'Falha simulada no compartilhamento ({operacao})', caminho)
+
+    def _atrasar(self, operacao, caminho):
+        with self.lock:
+            self.operacoes[operacao] += 1
+            espera = self.aleatorio.uniform(*self.latencia) if self.latencia[1] else 0
+        if espera:
+            time.sleep(espera)
+        if self._sortear_falha():
+            raise self._erro(operacao, caminho)
+
+    def _transferir(self, tamanho):
+        with self.lock:
+            self.bytes_transferidos += tamanho
+        if self.bytes_por_segundo and tamanho:
+            time.sleep(tamanho / self.bytes_por_segundo)
+
+    def _envolver(self, operacao, funcao):
+        def chamada(caminho, *args, **kwargs):
+            if self._remoto(caminho):
+                self._atrasar(operacao, caminho)
+            return funcao(caminho, *args, **kwargs)
+        return chamada
+
+    def _abrir(self, arquivo, modo='r', *args, **kwargs):
+        if not self._remoto(arquivo):
+            return self._originais['open'](arquivo, modo, *args, **kwargs)
+        self._atrasar('open', arquivo)
+        return _ArquivoSimulado(self._originais['open'](arquivo, modo, *args, **kwargs), self)
+
+    def __enter__(self):
+        for operacao in self.OPERACOES:
+            self._originais[operacao] = getattr(os, operacao)
+            setattr(os, operacao, self._envolver(operacao, self._originais[operacao]))
+        self._originais['open'] = builtins.open
+        builtins.open = self._abrir
+        return self
+
+    def __exit__(self, *exc):
+        builtins.open = self._originais.pop('open')
+        for operacao, funcao in self._originais.items():
+            setattr(os, operacao, funcao)
+        self._originais.clear()
+        return False
+
+
+def _chave(pdv, numero):
+    return f'352510{CNPJ}65{pdv:03d}{numero:09d}1{numero:08d}0'
+
+
+def _gerar_origem(origem):
+    pasta = origem / 'Mes 10'
+    pasta.mkdir(parents=True)
+    for pdv in PDVS:
+        for numero in range(1, NOTAS_POR_PDV + 1):
+            chave = _chave(pdv, numero)
+            (pasta / f'{chave}-NFCe.xml').write_text(XML.format(chave=chave, serie=pdv, numero=numero),
+                                                     encoding='utf-8')
+    return pasta
+
+
+@pytest.fixture(scope='module')
+def aplicacao():
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def verificador(aplicacao, tmp_path, monkeypatch):
+    # config.json, índice, log e spool do widget ficam na pasta do teste
+    monkeypatch.chdir(tmp_path)
+    # A origem configurada é a pasta do ano, como nas lojas
+    origem, destino = tmp_path / 'origem' / 'Ano 2025', tmp_path / 'destino'
+    _gerar_origem(origem)
+    destino.mkdir()
+    # Destino local simples: sem shards, réplicas ou destino remoto
+    config = {'origem': str(origem), 'destino': str(destino), 'intervalo': 10}
+    (tmp_path / v.CONFIG_FILE).write_text(json.dumps(config), encoding='utf-8')
+    verificador = v.VerificadorNFCe()
+    yield verificador
+    verificador.indice.fechar()
+    verificador.replicador.encerrar()
+
+
+def _ciclo(aplicacao, verificador, simulador):
+    operacoes = sum(simulador.operacoes.values())
+    inicio = time.perf_counter()
+    with simulador:
+        # Verificação manual: planejamento em segundo plano e cópia em fatias,
+        # até o ciclo concluir
+        verificador.verificacao_manual()
+        while verificador.ciclo_pendente:
+            aplicacao.processEvents()
+            time.sleep(0.001)
+    return (time.perf_counter() - inicio, sum(simulador.operacoes.values()) - operacoes,
+            collections.Counter(verificador.totais_ciclo))
+
+
+def test_ciclo_sob_compartilhamento_instavel(aplicacao, verificador):
+    origem, destino = verificador.origem_edit.text(), verificador.destino_edit.text()
+    total = len(PDVS) * NOTAS_POR_PDV
+    simulador = SimuladorCompartilhamento([origem, destino], (0.001, 0.003), 2 * 1024 * 1024,
+                                          taxa_erros=0.02, semente=7)
+
+    # Falhas de rede (inclusive na listagem e na sonda do destino, que manda
+    # notas para o spool) ficam para o ciclo seguinte, até tudo constar como
+    # já existente no destino e o spool esvaziar
+    copiados = operacoes_total = tempo_total = 0
+    for _ in range(8):
+        duracao, operacoes, totais = _ciclo(aplicacao, verificador, simulador)
+        copiados += totais['Copiado']
+        operacoes_total += operacoes
+        tempo_total += duracao
+        if totais['Já existe'] == total and not len(verificador.spool):
+            break
+    assert totais['Já existe'] == total and not len(verificador.spool)
+    assert sum(simulador.falhas.values())
+    # Uma falha depois da gravação (ex.: no utime) conta como erro, mas a nota
+    # já está no destino: nenhuma é gravada duas vezes
+    assert copiados <= total
+    # Custo limitado por arquivo, somando as repetições: listagem por pasta,
+    # leitura, gravação no temporário, publicação por link e conferência
+    assert operacoes_total <= 14 * total
+    # O tempo dos ciclos vem do compartilhamento (latência e banda), não de
+    # esperas do próprio motor
+    custo_rede = operacoes_total * simulador.latencia[1] + simulador.bytes_transferidos / simulador.bytes_por_segundo
+    assert tempo_total < custo_rede + 3
+
+    # Em regime, nada a copiar: o ciclo lista as pastas sem tocar cada arquivo
+    simulador.taxa_erros = 0
+    duracao, operacoes, totais = _ciclo(aplicacao, verificador, simulador)
+    assert not totais['Copiado']
+    assert operacoes < total
+    assert duracao < 5
+
+    # Conferência fora do simulador: nada faltando, nenhum parcial esquecido
+    mapa = MapaDestinos.de_config(destino, verificador.config)
+    divergencias = reconciliar(origem, destino, mapa)
+    assert sum(d['origem'] for d in divergencias.values()) == total
+    assert not any(d['faltando'] or d['tamanho_divergente'] for d in divergencias.values())
+    for raiz, _, arquivos in os.walk(destino):
+        assert all(nome.endswith('.xml') for nome in arquivos), raiz
@@ -0,0 +1,81 @@
+import datetime
+import os
+
+from nfce_ciclo import AgendadorTrabalho, ItemPlano
+from nfce_destinos import SpoolLocal
+
+AGORA = datetime.datetime(2025, 10, 15, 12, 0)
+
+
+def _item(nome, mes='MES 10', idade=7200):
+    return ItemPlano(nome, f'/origem/{nome}', 2025, mes, 'PDV-031', '/destino/MES 10', f'/destino/MES 10/{nome}',
+                     100, False, AGORA.timestamp() - idade)
+
+
+def _guardar(spool, destino_final, dados=b'<nota/>'):
+    spool.guardar(destino_final, dados, None, arquivo=os.path.basename(destino_final))
+
+
+def test_so_o_prioritario_entra_e_ate_o_maximo(tmp_path):
+    spool = SpoolLocal(str(tmp_path / 'spool'))
+    agendador = AgendadorTrabalho(janela_recentes=3600)
+    # Mês corrente ou modificado há pouco entra; backlog antigo espera o destino voltar
+    assert spool.cabe(_item('corrente.xml'), agendador, AGORA)
+    assert spool.cabe(_item('recente.xml', mes='MES 09', idade=60), agendador, AGORA)
+    assert not spool.cabe(_item('antigo.xml', mes='MES 09'), agendador, AGORA)
+
+    _guardar(spool, '/destino/MES 10/a.xml')
+    _guardar(spool, '/destino/MES 10/b.xml')
+    # O limite conta o que já está no spool e o que o lote em montagem reservou
+    assert spool.cabe(_item('c.xml'), agendador, AGORA, maximo=3)
+    assert not spool.cabe(_item('c.xml'), agendador, AGORA, maximo=3, reservadas=1)
+    assert spool.cabe(_item('c.xml'), agendador, AGORA, maximo=0, reservadas=1000)
+    # O que já está no spool sempre cabe
+    assert spool.cabe(_item('a.xml', mes='MES 01'), agendador, AGORA, maximo=1)
+
+
+def test_sobrevive_a_reinicio(tmp_path):
+    pasta = str(tmp_path / 'spool')
+    spool = SpoolLocal(pasta)
+    _guardar(spool, '/destino/MES 10/a.xml')
+    _guardar(spool, '/destino/MES 10/b.xml')
+    # Queda durante a gravação do diário deixa a última linha incompleta
+    with open(os.path.join(pasta, SpoolLocal.DIARIO), 'a', encoding='utf-8') as f:
+        f.write('{"seq": 3, "destino"')
+
+    reaberto = SpoolLocal(pasta)
+    assert len(reaberto) == 2 and reaberto.contem('/destino/MES 10/b.xml')
+    _guardar(reaberto, '/destino/MES 10/c.xml')
+    assert [entrada['seq'] for entrada in reaberto.pendentes] == [1, 2, 3]
+
+
+def test_drenar_em_ordem_por_pasta_parando_na_primeira_falha(tmp_path):
+    spool = SpoolLocal(str(tmp_path / 'spool'))
+    for destino_final in ('/destino/x/1.xml', '/destino/y/1.xml', '/destino/x/2.xml', '/destino/y/2.xml',
+                          '/destino/x/3.xml'):
+        _guardar(spool, destino_final, destino_final.encode())
+    gravados = []
+
+    def gravar(entrada, caminho_spool):
+        with open(caminho_spool, 'rb') as f:
+            assert f.read() == entrada['destino'].encode()
+        if entrada['destino'] == '/destino/x/2.xml':
+            raise OSError('destino caiu de novo')
+        if entrada['destino'] == '/destino/y/2.xml':
+            raise FileExistsError(entrada['destino'])
+        gravados.append(entrada['destino'])
+
+    gravadas, existentes, falhas = spool.drenar(gravar)
+    # Na pasta x a falha na 2 segura a 3, para não furar a fila
+    assert sorted(gravados) == ['/destino/x/1.xml', '/destino/y/1.xml']
+    assert [entrada['destino'] for entrada in existentes] == ['/destino/y/2.xml']
+    assert falhas == 1 and len(gravadas) == 2
+    assert [entrada['destino'] for entrada in spool.pendentes] == ['/destino/x/2.xml', '/destino/x/3.xml']
+    assert sorted(os.listdir(spool.pasta)) == ['00000003_2.xml', '00000005_3.xml', SpoolLocal.DIARIO]
+
+    # O diário reescrito só tem o que ficou; na próxima volta do destino o resto vai
+    reaberto = SpoolLocal(spool.pasta)
+    assert [entrada['destino'] for entrada in reaberto.pendentes] == ['/destino/x/2.xml', '/destino/x/3.xml']
+    gravadas, existentes, falhas = reaberto.drenar(lambda entrada, caminho_spool: None)
+    assert (len(gravadas), existentes, falhas, len(reaberto)) == (2, [], 0, 0)
+    assert not reaberto.contem('/destino/x/3.xml')
@@ -0,0 +1,111 @@
+import pytest
+
+from nfce_validacao import status_da_validacao, VALIDACAO_LOTE_MINIMO, validar_em_lote, validar_nfce
+
+CNPJ = '02775652000123'
+NFCE = (
+    '<?xml version="1.0" encoding="UTF-8"?><nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">'
+    '<NFe><infNFe Id="NFe{chave}" versao="4.00"><ide><serie>32</serie><nNF>{numero}</nNF>'
+    '<dhEmi>2025-10-01T10:00:00-03:00</dhEmi></ide><emit><CNPJ>' + CNPJ + '</CNPJ></emit>'
+    '<total><ICMSTot><vNF>157.50</vNF></ICMSTot></total></infNFe></NFe>'
+    '<protNFe versao="4.00"><infProt><chNFe>{protocolo}</chNFe><cStat>{cstat}</cStat></infProt></protNFe></nfeProc>'
+)
+INUTILIZACAO = (
+    '<?xml version="1.0" encoding="UTF-8"?><ProcInutNFe xmlns="http://www.portalfiscal.inf.br/nfe">'
+    '<inutNFe><infInut Id="ID{id}"><xServ>INUTILIZAR</xServ><CNPJ>' + CNPJ + '</CNPJ><serie>32</serie>'
+    '<nNFIni>5</nNFIni><nNFFin>7</nNFFin></infInut></inutNFe>'
+    '<retInutNFe><infInut><cStat>{cstat}</cStat><dhRecbto>2025-10-02T08:00:00-03:00</dhRecbto></infInut>'
+    '</retInutNFe></ProcInutNFe>'
+)
+
+
+def _chave(numero, modelo='65'):
+    return f'352510{CNPJ}{modelo}032{numero:09d}1{numero:08d}0'
+
+
+def _nfce(pasta, numero, modelo='65', protocolo=None, cstat='100', nome=None):
+    chave = _chave(numero, modelo)
+    caminho = pasta / (nome or f'{chave}-NFCe.xml')
+    caminho.write_text(NFCE.format(chave=chave, numero=numero, protocolo=protocolo or chave, cstat=cstat),
+                       encoding='utf-8')
+    return str(caminho)
+
+
+def test_nfce_autorizada_traz_os_metadados(tmp_path):
+    valido, motivo, metadados = validar_nfce(_nfce(tmp_path, 1))
+    assert (valido, motivo) == (True, '')
+    assert metadados['chave'] == _chave(1)
+    assert metadados['pdv'] == 'PDV-032' and metadados['numero'] == 1
+    assert metadados['cnpj'] == CNPJ and metadados['valor_total'] == 157.50
+    assert metadados['cstat'] == '100'
+
+
+@pytest.mark.parametrize('argumentos, motivo', [
+    ({'cstat': '110'}, 'NFC-e não autorizada (cStat 110)'),
+    ({'modelo': '55'}, 'Modelo 55 não é NFC-e'),
+    ({'protocolo': _chave(9)}, 'Chave do protocolo não confere com a NFC-e'),
+    ({'nome': f'{_chave(2)}-NFCe.xml'}, 'não confere com o nome do arquivo'),
+])
+def test_nfce_reprovada(tmp_path, argumentos, motivo):
+    valido, obtido, _ = validar_nfce(_nfce(tmp_path, 1, **argumentos))
+    assert not valido and motivo in obtido
+    assert status_da_validacao(obtido) == 'XML Inválido'
+
+
+def test_xml_mal_formado_e_falha_de_leitura(tmp_path):
+    caminho = tmp_path / f'{_chave(1)}-NFCe.xml'
+    caminho.write_bytes(b'<nfeProc><NFe>')
+    valido, motivo, _ = validar_nfce(str(caminho))
+    assert not valido and motivo.startswith('XML mal formado')
+
+    # Arquivo que não pôde ser lido é erro transitório, não XML inválido
+    valido, motivo, _ = validar_nfce(str(tmp_path / 'sumiu-NFCe.xml'))
+    assert not valido and status_da_validacao(motivo) == 'Erro'
+
+
+def test_inutilizacao(tmp_path):
+    identificador = _chave(5)[:41]
+    caminho = tmp_path / f'{identificador}-InutNFCe.xml'
+    caminho.write_text(INUTILIZACAO.format(id=identificador, cstat='102'), encoding='utf-8')
+    valido, _, metadados = validar_nfce(str(caminho))
+    assert valido
+    assert (metadados['numero'], metadados['numero_final'], metadados['pdv']) == (5, 7, 'PDV-032')
+
+    caminho.write_text(INUTILIZACAO.format(id=identificador, cstat='241'), encoding='utf-8')
+    valido, motivo, _ = validar_nfce(str(caminho))
+    assert not valido and 'não homologada' in motivo
+
+
+def test_dados_em_memoria_em_vez_do_arquivo(tmp_path):
+    caminho = _nfce(tmp_path, 1)
+    with open(caminho, 'rb') as f:
+        dados = f.read()
+    # O nome ainda vem do caminho, o conteúdo vem dos bytes
+    assert validar_nfce(str(tmp_path / 'ausente' / f'{_chave(1)}-NFCe.xml'), dados)[0]
+    assert not validar_nfce(caminho, b'<lixo')[0]
+
+
+@pytest.mark.parametrize('quantidade', [3, VALIDACAO_LOTE_MINIMO + 10])
+def test_validar_em_lote(tmp_path, quantidade):
+    # Abaixo do lote mínimo valida na hora; acima, no pool de processos
+    caminhos = [_nfce(tmp_path, numero) for numero in range(1, quantidade + 1)]
+    caminhos.append(_nfce(tmp_path, quantidade + 1, cstat='302'))
+    resultados = validar_em_lote(caminhos, max_processos=2, com_dados=True)
+    assert list(resultados) == caminhos
+    assert sum(1 for valido, _, _, _ in resultados.values() if valido) == quantidade
+    valido, motivo, metadados, dados = resultados[caminhos[0]]
+    assert valido and metadados['numero'] == 1
+    with open(caminhos[0], 'rb') as f:
+        assert dados == f.read()
+    assert not resultados[caminhos[-1]][0]
+
+
+def test_validar_em_lote_com_dados_de_destino_remoto(tmp_path):
+    caminhos = [str(tmp_path / f'{_chave(numero)}-NFCe.xml') for numero in (1, 2)]
+    conteudos = {
+        caminhos[0]: NFCE.format(chave=_chave(1), numero=1, protocolo=_chave(1), cstat='100').encode(),
+        caminhos[1]: b'<nfeProc/>',
+    }
+    resultados = validar_em_lote(caminhos, dados=conteudos)
+    assert resultados[caminhos[0]][0]
+    assert resultados[caminhos[1]][1] == 'Documento sem infNFe'
@@ -2,29 +2,178 @@ import sys
 import os
 import json
 import datetime
-import shutil
-import threading
 import time
-import xml.etree.ElementTree as ET
-import re
+import multiprocessing
+import collections
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QLabel, QPushButton, QLineEdit, QFileDialog,
     QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QSpinBox,
-    QSystemTrayIcon, QMenu, QAction, QTabWidget, QComboBox, QDateEdit, QMessageBox
+    QSystemTrayIcon, QMenu, QAction, QTabWidget, QComboBox, QDateEdit, QMessageBox,
+    QProgressBar, QCheckBox, QInputDialog
 )
 from PyQt5.QtCore import Qt, QDate, pyqtSignal, QTimer, QThread, QObject
 from PyQt5.QtGui import QIcon
-import concurrent.futures
-import requests
 import subprocess
 import tempfile
 
-CONFIG_FILE = 'config.json'
-LOG_FILE = 'log.txt'
+from nfce_limites import LimitadorTaxa, reduzir_prioridade_thread
+from nfce_validacao import (
+    ler_e_validar, status_da_validacao, VALIDACAO_LOTE_MINIMO, validar_em_lote
+)
+from nfce_indice import IndiceNotas
+from nfce_layout import (
+    extrair_ano_da_origem, extrair_pdv_do_arquivo, normalizar_pdv
+)
+from nfce_destinos import MapaDestinos, SondaDestino, SPOOL_MAXIMO, SpoolLocal
+from nfce_replicacao import Replicador
+from nfce_coordenacao import CoordenadorNos
+from nfce_numeracao import DetectorLacunas, MarcasNumeracao
+from nfce_historico import AgregadorEventos, exportar_historico, LOG_FILE, pyarrow, registrar_operacao, ResumoDiario
+from nfce_metricas import formatar_bytes, formatar_segundos, MetricasLatencia
+from nfce_atualizacao import (
+    baixar_com_retomada, consultar_release, GITHUB_RELEASE_URL, hash_publicado, sha256_arquivo,
+    versao_comparavel, VERSION
+)
+from nfce_ciclo import AgendadorTrabalho, AlvoVerificacao, CopiadorNotas, planejar_ciclo, rodar_em_segundo_plano
+from nfce_carga import carga_pendente, executar_carga_inicial
+from nfce_integridade import VerificacaoIntegridade
+from nfce_cli import CONFIG_FILE, executar_cli
+
+# Maior bloco validado de uma vez quando o ciclo tem orçamento de tempo
+CICLO_BLOCO_MAXIMO = 5000
+# Intervalo entre consultas ao planejamento que roda em segundo plano
+CICLO_CONSULTA_MS = 50
+
+
+class ExportacaoWorker(QObject):
+    """Worker para exportar o histórico em thread separada"""
+    progresso = pyqtSignal(int)
+    concluido = pyqtSignal(int, str)
+    erro = pyqtSignal(str)
+    finished = pyqtSignal()
+
+    def __init__(self, destino, formato, filtros):
+        super().__init__()
+        self.destino = destino
+        self.formato = formato
+        self.filtros = filtros
+
+    def executar(self):
+        try:
+            linhas = exportar_historico(
+                self.destino, self.formato, progresso=self.progresso.emit, **self.filtros
+            )
+            self.concluido.emit(linhas, self.destino)
+        except Exception as e:
+            self.erro.emit(str(e))
+        finally:
+            self.finished.emit()
+
+
+class AtualizacaoWorker(QObject):
+    """Worker para verificar e baixar atualizações fora da thread da interface"""
+    progresso = pyqtSignal(int)
+    mensagem = pyqtSignal(str, str)
+    pronto = pyqtSignal(str)
+    finished = pyqtSignal()
+
+    def __init__(self, url=GITHUB_RELEASE_URL):
+        super().__init__()
+        self.url = url
+
+    def executar(self):
+        try:
+            release = consultar_release(self.url)
+            latest_version = release['tag_name'].lstrip('v')
+            if versao_comparavel(latest_version) <= versao_comparavel(VERSION):
+                self.mensagem.emit('Atualização', 'Você já está usando a versão mais recente.')
+                return
+            asset = next((a for a in release.get('assets', []) if a['name'].endswith('.exe')), None)
+            if asset is None:
+                self.mensagem.emit('Erro', 'Arquivo executável não encontrado na versão mais recente.')
+                return
+            hash_esperado = hash_publicado(release, asset)
+            if not hash_esperado:
+                self.mensagem.emit('Erro', 'A versão mais recente não publica o hash SHA-256 do executável.')
+                return
+            # Nome fixo por versão: uma nova tentativa retoma o mesmo parcial
+            destino = os.path.join(tempfile.gettempdir(), f'verificador_nfce_{latest_version}_{asset["name"]}')
+            caminho = baixar_com_retomada(asset['browser_download_url'], destino, self.progresso.emit)
+            if sha256_arquivo(caminho) != hash_esperado:
+                os.remove(caminho)
+                self.mensagem.emit('Erro', 'O arquivo baixado não confere com o hash publicado.')
+                return
+            self.pronto.emit(caminho)
+        except Exception as e:
+            self.mensagem.emit('Erro', f'Erro ao verificar atualização: {str(e)}')
+        finally:
+            self.finished.emit()
+
+
+class CargaInicialWorker(QObject):
+    """Worker para a carga inicial em thread separada, sem parar o monitoramento"""
+    progresso = pyqtSignal(int, int, float, float)
+    concluido = pyqtSignal(dict)
+    erro = pyqtSignal(str)
+    finished = pyqtSignal()
+
+    def __init__(self, origem, destino, config, indice=None, lacunas=None, replicador=None):
+        super().__init__()
+        self.origem = origem
+        self.destino = destino
+        self.config = config
+        self.indice = indice
+        self.lacunas = lacunas
+        self.replicador = replicador
+        self.cancelado = False
+
+    def parar(self):
+        self.cancelado = True
+
+    def executar(self):
+        try:
+            if self.config.get('baixa_prioridade', False):
+                reduzir_prioridade_thread()
+            estado = executar_carga_inicial(
+                self.origem, self.destino, self.config, progresso=self.progresso.emit,
+                parar=lambda: self.cancelado, indice=self.indice,
+                lacunas=self.lacunas, replicador=self.replicador
+            )
+            self.concluido.emit(estado)
+        except Exception as e:
+            self.erro.emit(str(e))
+        finally:
+            self.finished.emit()
+
+
+class IntegridadeWorker(QObject):
+    """Worker para uma fatia da verificação de integridade, sempre com prioridade reduzida"""
+    concluido = pyqtSignal(dict)
+    erro = pyqtSignal(str)
+    finished = pyqtSignal()
+
+    def __init__(self, verificacao, orcamento, reparar):
+        super().__init__()
+        self.verificacao = verificacao
+        self.orcamento = orcamento
+        self.reparar = reparar
+        self.cancelado = False
+
+    def parar(self):
+        self.cancelado = True
+
+    def executar(self):
+        try:
+            # A verificação nunca disputa CPU e disco com a sincronização
+            reduzir_prioridade_thread()
+            self.concluido.emit(
+                self.verificacao.executar_fatia(self.orcamento, lambda: self.cancelado, self.reparar)
+            )
+        except Exception as e:
+            self.erro.emit(str(e))
+        finally:
+            self.finished.emit()
 
-VERSION = "1.0.3"
-GITHUB_REPO = "mtzcode/sincroniza_nfce"
-GITHUB_RELEASE_URL = f"https://api.github.com/repos/{GITHUB_REPO}/releases/latest"
 
 class MonitoramentoWorker(QObject):
     """Worker para executar o monitoramento em thread separada"""
@@ -72,18 +221,54 @@ class MonitoramentoWorker(QObject):
         self.finished.emit()
 
 class VerificadorNFCe(QWidget):
+    # Fim de uma verificação manual ou direcionada: (alvo ou None, mensagem de status)
+    verificacao_concluida = pyqtSignal(object, str)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle('Verificador NFC-e')
         self.setGeometry(100, 100, 600, 400)
         
         # Variáveis de controle
+        self.config = {}
         self.monitorando = False
+        self.backlog_pendente = 0
         self.worker = None
         self.worker_thread = None
         self.tray_icon = None
         self._monitoramento_iniciado = False
         
+        # Índice de metadados das notas copiadas
+        try:
+            self.indice = IndiceNotas()
+        except Exception as e:
+            print(f'Erro ao abrir índice de notas: {e}')
+            self.indice = None
+        self.detector_lacunas = DetectorLacunas()
+        self.metricas = MetricasLatencia()
+        # Resultados por arquivo agregados por PDV/mês em cada ciclo
+        self.eventos_ciclo = AgregadorEventos()
+        self.totais_ciclo = collections.Counter()
+        # Contadores por dia x PDV x status para o painel de resumo
+        self.resumo_diario = ResumoDiario()
+        # Maior numeração resolvida por PDV/série/mês (ciclo rápido)
+        self.marcas_numeracao = MarcasNumeracao()
+        self.ultima_varredura_completa = 0
+        # Spool local para quando o destino estiver fora do ar
+        self.sonda_destino = SondaDestino()
+        self.destino_indisponivel = False
+        try:
+            self.spool = SpoolLocal()
+        except Exception as e:
+            print(f'Erro ao abrir spool local: {e}')
+            self.spool = None
+        
+        # Coordenação com outras máquinas no mesmo destino (opcional)
+        self.coordenador = None
+        self.pastas_outros_nos = 0
+        # Arquivos gravados antes disso são backlog: não entram na latência ponta a ponta
+        self.inicio_execucao = time.time()
+        
         # Inicializar interface
         self.init_ui()
         
@@ -96,8 +281,40 @@ class VerificadorNFCe(QWidget):
         # Carregar configuração (isso pode alterar a flag)
         self.load_config()
         
+        # Limites de I/O (ajustáveis ao vivo pela interface)
+        self.limitador = LimitadorTaxa.de_config(self.config)
+        
+        # Réplicas do destino (ex.: disco de backup), cada uma no seu ritmo
+        self.replicador = Replicador(
+            self.config.get('replicas_destino', []), limitador=self.limitador,
+            baixa_prioridade=self.config.get('baixa_prioridade', False)
+        )
+        
         self.create_tray_icon()
         
+        # Carga inicial em andamento (thread própria)
+        self.worker_carga = None
+        self.thread_carga = None
+        # Ciclo que esgotou o orçamento de tempo e continua na próxima fatia
+        self.ciclo_pendente = None
+        self.copiados_ciclo = 0  # cópias das fatias já rodadas do ciclo em andamento
+        # Pedido de parada do ciclo em andamento (timer, manual ou direcionado)
+        self.parar_ciclo = False
+        # Verificação direcionada pedida pela bandeja: o resultado volta por lá
+        self.avisar_bandeja = False
+        self.verificacao_concluida.connect(self.verificacao_alvo_concluida)
+        # Arquivos pendentes que já deram sua amostra de descoberta
+        self.descobertos = set()
+        # Verificação de integridade do destino, em fatias nos intervalos ociosos
+        self.worker_integridade = None
+        self.thread_integridade = None
+        self.verificacao_integridade = None
+        self.ultima_integridade = 0
+        carga = carga_pendente()
+        if carga and self.destino_edit.text():
+            # Retomar a carga interrompida (app fechado ou queda) a partir do checkpoint
+            QTimer.singleShot(3000, lambda: self.iniciar_carga_inicial(carga['origem']))
+        
         # Timer para verificação periódica (alternativa mais estável)
         self.timer_verificacao = QTimer()
         self.timer_verificacao.timeout.connect(self.verificacao_timer)
@@ -219,6 +436,25 @@ class VerificadorNFCe(QWidget):
         intervalo_layout.addWidget(self.intervalo_spin)
         layout.addLayout(intervalo_layout)
 
+        # Limites de I/O para não disputar com o PDV (0 = sem limite)
+        limites_layout = QHBoxLayout()
+        self.limite_kb_spin = QSpinBox()
+        self.limite_kb_spin.setMaximum(1000000)
+        self.limite_kb_spin.setSpecialValueText('Sem limite')
+        self.limite_kb_spin.valueChanged.connect(self.limites_alterados)
+        self.limite_arquivos_spin = QSpinBox()
+        self.limite_arquivos_spin.setMaximum(100000)
+        self.limite_arquivos_spin.setSpecialValueText('Sem limite')
+        self.limite_arquivos_spin.valueChanged.connect(self.limites_alterados)
+        self.baixa_prioridade_check = QCheckBox('Baixa prioridade')
+        self.baixa_prioridade_check.stateChanged.connect(self.limites_alterados)
+        limites_layout.addWidget(QLabel('Limite (KB/s):'))
+        limites_layout.addWidget(self.limite_kb_spin)
+        limites_layout.addWidget(QLabel('Arquivos/s:'))
+        limites_layout.addWidget(self.limite_arquivos_spin)
+        limites_layout.addWidget(self.baixa_prioridade_check)
+        layout.addLayout(limites_layout)
+
         # Botões de controle
         botoes_layout = QHBoxLayout()
         self.iniciar_btn = QPushButton('Iniciar Monitoramento')
@@ -232,6 +468,39 @@ class VerificadorNFCe(QWidget):
         botoes_layout.addWidget(self.atualizar_btn)
         layout.addLayout(botoes_layout)
 
+        # Verificação direcionada: só um PDV, mês e/ou padrão de arquivo
+        selecao_layout = QHBoxLayout()
+        selecao_layout.addWidget(QLabel('PDV:'))
+        self.selecao_pdv = QLineEdit()
+        self.selecao_pdv.setPlaceholderText('Todos')
+        self.selecao_pdv.setMaximumWidth(60)
+        selecao_layout.addWidget(self.selecao_pdv)
+        selecao_layout.addWidget(QLabel('Mês:'))
+        self.selecao_mes = QComboBox()
+        self.selecao_mes.addItem('Todos')
+        self.selecao_mes.addItems([f'{mes:02d}' for mes in range(1, 13)])
+        selecao_layout.addWidget(self.selecao_mes)
+        selecao_layout.addWidget(QLabel('Arquivos:'))
+        self.selecao_padrao = QLineEdit()
+        self.selecao_padrao.setPlaceholderText('ex.: *3525100277*')
+        selecao_layout.addWidget(self.selecao_padrao)
+        self.verificar_selecao_btn = QPushButton('Verificar Seleção')
+        self.verificar_selecao_btn.clicked.connect(self.verificar_selecao)
+        selecao_layout.addWidget(self.verificar_selecao_btn)
+        layout.addLayout(selecao_layout)
+
+        # Carga inicial (backfill) de arquivos antigos, em segundo plano
+        carga_layout = QHBoxLayout()
+        self.carga_btn = QPushButton('Carga Inicial...')
+        self.carga_btn.clicked.connect(self.toggle_carga_inicial)
+        self.barra_carga = QProgressBar()
+        self.barra_carga.setVisible(False)
+        self.carga_label = QLabel('')
+        carga_layout.addWidget(self.carga_btn)
+        carga_layout.addWidget(self.barra_carga)
+        carga_layout.addWidget(self.carga_label)
+        layout.addLayout(carga_layout)
+
         # Painel de status (tabela)
         self.status_table = QTableWidget(0, 4)
         self.status_table.setHorizontalHeaderLabels(['Arquivo', 'Status', 'Data', 'Hora'])
@@ -255,7 +524,10 @@ class VerificadorNFCe(QWidget):
         filtro_layout.addWidget(QLabel('Status:'))
         self.filtro_status = QComboBox()
         self.filtro_status.addItem('Todos')
-        self.filtro_status.addItems(['Copiado', 'Já existe', 'Erro', 'XML Inválido'])
+        self.filtro_status.addItems([
+            'Copiado', 'Já existe', 'Erro', 'XML Inválido',
+            'Lacuna na numeração', 'Numeração duplicada'
+        ])
         filtro_layout.addWidget(self.filtro_status)
         
         self.btn_atualizar_historico = QPushButton('Atualizar Histórico')
@@ -267,13 +539,66 @@ class VerificadorNFCe(QWidget):
         filtro_layout.addWidget(self.btn_limpar_filtros)
         historico_layout.addLayout(filtro_layout)
         
+        # Exportação (usa também o filtro de Status acima)
+        exportacao_layout = QHBoxLayout()
+        exportacao_layout.addWidget(QLabel('Exportar de:'))
+        self.exportar_de = QDateEdit()
+        self.exportar_de.setCalendarPopup(True)
+        self.exportar_de.setDate(QDate.currentDate().addDays(1 - QDate.currentDate().day()))
+        exportacao_layout.addWidget(self.exportar_de)
+        exportacao_layout.addWidget(QLabel('até:'))
+        self.exportar_ate = QDateEdit()
+        self.exportar_ate.setCalendarPopup(True)
+        self.exportar_ate.setDate(QDate.currentDate())
+        exportacao_layout.addWidget(self.exportar_ate)
+        exportacao_layout.addWidget(QLabel('PDV:'))
+        self.exportar_pdv = QLineEdit()
+        self.exportar_pdv.setPlaceholderText('Todos')
+        self.exportar_pdv.setMaximumWidth(60)
+        exportacao_layout.addWidget(self.exportar_pdv)
+        self.exportar_formato = QComboBox()
+        self.exportar_formato.addItem('CSV')
+        if pyarrow is not None:
+            self.exportar_formato.addItem('Parquet')
+        exportacao_layout.addWidget(self.exportar_formato)
+        self.btn_exportar_historico = QPushButton('Exportar')
+        self.btn_exportar_historico.clicked.connect(self.exportar_historico)
+        exportacao_layout.addWidget(self.btn_exportar_historico)
+        self.barra_exportacao = QProgressBar()
+        self.barra_exportacao.setVisible(False)
+        exportacao_layout.addWidget(self.barra_exportacao)
+        historico_layout.addLayout(exportacao_layout)
+        
         self.tabela_historico = QTableWidget(0, 4)
         self.tabela_historico.setHorizontalHeaderLabels(['Data', 'Hora', 'Arquivo', 'Status'])
         historico_layout.addWidget(self.tabela_historico)
         
+        # Resumo por dia e PDV (contadores agregados, sem ler o log)
+        historico_layout.addWidget(QLabel('Resumo do mês da data selecionada (por dia e PDV):'))
+        self.tabela_resumo = QTableWidget(0, 2 + len(ResumoDiario.STATUS) + 1)
+        self.tabela_resumo.setHorizontalHeaderLabels(['Data', 'PDV'] + list(ResumoDiario.STATUS) + ['Bytes copiados'])
+        historico_layout.addWidget(self.tabela_resumo)
+        self.filtro_data.dateChanged.connect(self.atualizar_resumo)
+        
         self.tab_historico.setLayout(historico_layout)
         self.tabs.addTab(self.tab_historico, 'Histórico')
         
+        # Aba de métricas (latência na última hora)
+        self.tab_metricas = QWidget()
+        metricas_layout = QVBoxLayout()
+        metricas_layout.addWidget(QLabel('Latência na última hora (p50 / p95 / p99):'))
+        self.tabela_metricas = QTableWidget(0, 6)
+        self.tabela_metricas.setHorizontalHeaderLabels(
+            ['PDV', 'Cópias', 'Ponta a ponta', 'Descoberta', 'Validação', 'Cópia']
+        )
+        metricas_layout.addWidget(self.tabela_metricas)
+        self.deduplicacao_label = QLabel('')
+        metricas_layout.addWidget(self.deduplicacao_label)
+        self.integridade_label = QLabel('')
+        metricas_layout.addWidget(self.integridade_label)
+        self.tab_metricas.setLayout(metricas_layout)
+        self.tabs.addTab(self.tab_metricas, 'Métricas')
+        
         main_layout.addWidget(self.tabs)
         self.setLayout(main_layout)
 
@@ -283,42 +608,174 @@ class VerificadorNFCe(QWidget):
         self.usuario_abriu_manualmente = False
         if self.monitorando:
             self.timer_verificacao.setInterval(self.intervalo_spin.value() * 1000)
+        if hasattr(self, 'limitador'):
+            # O balde acumula até um intervalo de taxa entre os ciclos
+            self.limitador.ajustar(rajada=self.intervalo_spin.value())
+
+    def limites_alterados(self):
+        """Aplica na hora os limites de I/O alterados na interface"""
+        # Resetar flag quando o usuário interagir com a interface
+        self.usuario_abriu_manualmente = False
+        self.config['limite_kb_s'] = self.limite_kb_spin.value()
+        self.config['limite_arquivos_s'] = self.limite_arquivos_spin.value()
+        self.config['baixa_prioridade'] = self.baixa_prioridade_check.isChecked()
+        if hasattr(self, 'limitador'):
+            self.limitador.ajustar(self.limite_kb_spin.value() * 1024, self.limite_arquivos_spin.value())
 
     def verificar_agora(self):
-        """Executa uma verificação manual imediata"""
+        """Executa uma verificação manual imediata; com ela em andamento, o botão a interrompe"""
         # Resetar flag quando o usuário interagir com a interface
         self.usuario_abriu_manualmente = False
-        self.verificar_agora_btn.setEnabled(False)
-        self.verificar_agora_btn.setText('Verificando...')
-        
+        if self.ciclo_pendente and not self.ciclo_pendente['automatico']:
+            self.parar_verificacao()
+            return
+        self.verificacao_manual()
+
+    def verificar_selecao(self):
+        """Verificação manual só do PDV/mês/padrão escolhido na aba principal"""
+        # Resetar flag quando o usuário interagir com a interface
+        self.usuario_abriu_manualmente = False
+        mes = self.selecao_mes.currentText()
+        alvo = AlvoVerificacao(
+            normalizar_pdv(self.selecao_pdv.text()) if self.selecao_pdv.text().strip() else None,
+            int(mes) if mes != 'Todos' else None,
+            self.selecao_padrao.text().strip() or None,
+        )
+        if not any(alvo):
+            self.mostrar_mensagem('Erro', 'Informe um PDV, um mês ou um padrão de arquivo.')
+            return
+        # O botão volta quando a verificação termina (sinal verificacao_concluida)
+        self.verificar_selecao_btn.setEnabled(False)
+        self.verificacao_manual(alvo)
+
+    def verificar_selecao_bandeja(self):
+        """Verificação direcionada pelo menu da bandeja, sem abrir a janela"""
+        texto, ok = QInputDialog.getText(
+            self, 'Verificar PDV/Mês', 'PDV, mês e/ou padrão de arquivo (ex.: 031 10 ou *3525100277*):'
+        )
+        if not ok or not texto.strip():
+            return
         try:
-            total_copiados = self.executar_transferencia_unica(True)
-            if total_copiados > 0:
-                self.adicionar_status_geral(f"Verificação manual | OK ({total_copiados} copiados)")
-            else:
-                self.adicionar_status_geral("Verificação manual | Nenhum arquivo novo")
+            alvo = AlvoVerificacao.interpretar(texto)
+        except ValueError as e:
+            self.mostrar_mensagem('Erro', str(e))
+            return
+        self.avisar_bandeja = True
+        self.verificacao_manual(alvo)
+
+    def verificacao_alvo_concluida(self, alvo, mensagem):
+        """Fim da verificação direcionada: libera o botão e, se veio da bandeja, avisa por lá"""
+        if alvo is None:
+            return
+        self.verificar_selecao_btn.setEnabled(True)
+        if self.avisar_bandeja and self.tray_icon:
+            self.tray_icon.showMessage('Verificador NFC-e', mensagem, QSystemTrayIcon.Information, 3000)
+        self.avisar_bandeja = False
+
+    def verificacao_manual(self, alvo=None, continuar=False):
+        """
+        Verificação manual ou direcionada (alvo), ou a próxima fatia dela, mesmo
+        com o monitoramento parado. Listagem em segundo plano e cópia nas
+        fatias do timer; o status sai uma vez, com o ciclo concluído, também
+        pelo sinal verificacao_concluida
+        """
+        if not continuar:
+            if self.ciclo_pendente and not self.ciclo_pendente['automatico']:
+                # Uma nova verificação manual substitui a que estava em andamento
+                self.parar_verificacao()
+            self.copiados_ciclo = 0
+            self.verificar_agora_btn.setText('Parar Verificação')
+        try:
+            self.copiados_ciclo += self.executar_transferencia_unica(True, alvo, continuar=continuar)
+            if self.ciclo_pendente:
+                return
+            self.encerrar_verificacao_manual(alvo)
         except Exception as e:
-            self.adicionar_status_geral(f"Verificação manual | Erro: {e}")
-        finally:
-            self.verificar_agora_btn.setEnabled(True)
-            self.verificar_agora_btn.setText('Verificar Agora')
-            
-            # Minimizar para a bandeja após verificação manual (se estiver monitorando)
-            if self.monitorando:
-                self.deve_mostrar_janela = False
-                self.usuario_abriu_manualmente = False  # Resetar flag
-                # Aguardar um pouco para mostrar o status e depois minimizar
-                QTimer.singleShot(2000, self.minimizar_para_bandeja)
+            self.ciclo_pendente = None
+            self.encerrar_verificacao_manual(alvo, erro=e)
 
-    def verificacao_timer(self):
-        """Executa verificação pelo timer"""
+    def encerrar_verificacao_manual(self, alvo, interrompida=False, erro=None):
+        """Status da verificação manual ou direcionada concluída (ou interrompida)"""
+        total_copiados, self.copiados_ciclo = self.copiados_ciclo, 0
+        if erro:
+            resultado = f"Erro: {erro}"
+        elif interrompida:
+            resultado = f"Interrompida ({total_copiados} copiados)"
+        else:
+            resultado = f"OK ({total_copiados} copiados)" if total_copiados else "Nenhum arquivo novo"
+        descricao = f"Verificação de {alvo.descricao()}" if alvo else "Verificação manual"
+        mensagem = f"{descricao} | {resultado}"
+        self.adicionar_status_geral(mensagem)
+        self.verificar_agora_btn.setText('Verificar Agora')
+        self.verificacao_concluida.emit(alvo, mensagem)
+        
+        # Minimizar para a bandeja após verificação manual (se estiver monitorando)
+        if not alvo and self.monitorando:
+            self.deve_mostrar_janela = False
+            self.usuario_abriu_manualmente = False  # Resetar flag
+            # Aguardar um pouco para mostrar o status e depois minimizar
+            QTimer.singleShot(2000, self.minimizar_para_bandeja)
+
+    def ciclo_interrompido(self):
+        """Parar vale para qualquer ciclo em andamento, entre um arquivo e outro"""
+        return self.parar_ciclo
+
+    def parar_verificacao(self):
+        """
+        Interrompe o ciclo em andamento (timer, manual ou direcionado): descarta
+        o cursor das fatias e publica o que elas já fizeram
+        """
+        self.parar_ciclo = True
+        continuacao, self.ciclo_pendente = self.ciclo_pendente, None
+        if not continuacao:
+            return
+        self.publicar_eventos_ciclo(continuacao['mostrar_ja_existe'])
+        if continuacao['automatico']:
+            self.copiados_ciclo = 0
+        else:
+            self.encerrar_verificacao_manual(continuacao['alvo'], interrompida=True)
+
+    def continuar_ciclo(self):
+        """Próxima fatia de um ciclo que esgotou o orçamento de tempo"""
+        if not self.ciclo_pendente:
+            return
+        if self.ciclo_pendente['automatico']:
+            self.verificacao_timer(continuar=True)
+        else:
+            self.verificacao_manual(self.ciclo_pendente['alvo'], continuar=True)
+
+    def verificacao_timer(self, continuar=False):
+        """Executa verificação pelo timer (ou a continuação de um ciclo em fatias)"""
         try:
-            total_copiados = self.executar_transferencia_unica(self.primeira_verificacao)
+            self.copiados_ciclo += self.executar_transferencia_unica(
+                self.primeira_verificacao, continuar=continuar, automatico=True
+            )
+            if self.ciclo_pendente:
+                # Ciclo em fatias: o status sai uma vez, com o total do ciclo inteiro
+                return
+            total_copiados, self.copiados_ciclo = self.copiados_ciclo, 0
+            backlog = f", {self.backlog_pendente} no backlog" if self.backlog_pendente else ""
+            for destino, situacao in self.replicador.situacao().items():
+                if situacao['pendentes'] or not situacao['online']:
+                    estado = 'fora do ar' if not situacao['online'] else 'atrasada'
+                    backlog += f", réplica {destino} {estado} ({situacao['pendentes']} pendentes)"
+                if situacao['divergencias']:
+                    backlog += f", réplica {destino} com {situacao['divergencias']} divergência(s)"
+            if self.spool and len(self.spool):
+                backlog += f", {len(self.spool)} no spool local"
+            if self.pastas_outros_nos:
+                backlog += f", {self.pastas_outros_nos} pasta(s) com outro nó"
+            if self.totais_ciclo['Já existe']:
+                backlog += f", {self.totais_ciclo['Já existe']} já existentes"
+            if self.totais_ciclo['Erro'] or self.totais_ciclo['XML Inválido']:
+                backlog += f", {self.totais_ciclo['Erro']} erros, {self.totais_ciclo['XML Inválido']} inválidos"
             if total_copiados > 0:
-                self.adicionar_status_geral(f"Arquivos atualizados | OK ({total_copiados} copiados)")
+                self.adicionar_status_geral(f"Arquivos atualizados | OK ({total_copiados} copiados{backlog})")
             else:
-                self.adicionar_status_geral("Nenhum arquivo novo encontrado")
+                self.adicionar_status_geral(f"Nenhum arquivo novo encontrado{backlog}")
             self.primeira_verificacao = False
+            self.atualizar_metricas()
+            self.agendar_integridade()
         except Exception as e:
             self.adicionar_status_geral(f"Erro na verificação: {e}")
             print(f"Erro na verificação timer: {e}")
@@ -342,10 +799,13 @@ class VerificadorNFCe(QWidget):
         # Menu da bandeja
         menu = QMenu()
         show_action = QAction('Mostrar', self)
+        selecao_action = QAction('Verificar PDV/Mês...', self)
         quit_action = QAction('Sair', self)
         show_action.triggered.connect(self.showNormal)
+        selecao_action.triggered.connect(self.verificar_selecao_bandeja)
         quit_action.triggered.connect(self.fechar_aplicacao)
         menu.addAction(show_action)
+        menu.addAction(selecao_action)
         menu.addAction(quit_action)
         
         self.tray_icon.setContextMenu(menu)
@@ -388,9 +848,18 @@ class VerificadorNFCe(QWidget):
             try:
                 with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
                     config = json.load(f)
+                self.config = config
                 self.origem_edit.setText(config.get('origem', ''))
                 self.destino_edit.setText(config.get('destino', ''))
                 self.intervalo_spin.setValue(config.get('intervalo', 10))
+                # Ler antes de preencher: cada widget atualiza self.config ao mudar
+                limite_kb, limite_arquivos, baixa_prioridade = (
+                    config.get('limite_kb_s', 0), config.get('limite_arquivos_s', 0),
+                    config.get('baixa_prioridade', False)
+                )
+                self.limite_kb_spin.setValue(limite_kb)
+                self.limite_arquivos_spin.setValue(limite_arquivos)
+                self.baixa_prioridade_check.setChecked(baixa_prioridade)
                 
                 # Verificar se as pastas estão configuradas
                 if not config.get('origem') or not config.get('destino'):
@@ -410,11 +879,17 @@ class VerificadorNFCe(QWidget):
     def save_config(self):
         # Resetar flag quando o usuário salvar configuração
         self.usuario_abriu_manualmente = False
-        config = {
+        # Preserva as chaves avançadas editadas direto no config.json
+        config = dict(self.config)
+        config.update({
             'origem': self.origem_edit.text(),
             'destino': self.destino_edit.text(),
-            'intervalo': self.intervalo_spin.value()
-        }
+            'intervalo': self.intervalo_spin.value(),
+            'limite_kb_s': self.limite_kb_spin.value(),
+            'limite_arquivos_s': self.limite_arquivos_spin.value(),
+            'baixa_prioridade': self.baixa_prioridade_check.isChecked()
+        })
+        self.config = config
         try:
             with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
                 json.dump(config, f, ensure_ascii=False, indent=4)
@@ -448,6 +923,8 @@ class VerificadorNFCe(QWidget):
             QTimer.singleShot(2000, self.minimizar_para_bandeja)
         else:
             self.monitorando = False
+            # Parar vale também para a verificação manual ou direcionada em andamento
+            self.parar_verificacao()
             self.iniciar_btn.setText('Iniciar Monitoramento')
             self.timer_verificacao.stop()
             self.adicionar_status_geral("Monitoramento parado")
@@ -461,8 +938,23 @@ class VerificadorNFCe(QWidget):
     def fechar_aplicacao(self):
         """Fecha completamente a aplicação"""
         self.monitorando = False
+        self.ciclo_pendente = None
         if self.timer_verificacao.isActive():
             self.timer_verificacao.stop()
+        if self.worker_carga:
+            # O checkpoint do último lote permite retomar na próxima execução
+            self.worker_carga.parar()
+            self.thread_carga.quit()
+            self.thread_carga.wait()
+        if self.worker_integridade:
+            self.worker_integridade.parar()
+            self.thread_integridade.quit()
+            self.thread_integridade.wait()
+        if self.indice:
+            self.indice.fechar()
+        if self.coordenador:
+            self.coordenador.encerrar()
+        self.replicador.encerrar()
         self.save_config()
         QApplication.instance().quit()
 
@@ -496,29 +988,7 @@ class VerificadorNFCe(QWidget):
                     )
         super().changeEvent(event)
 
-    def criar_estrutura_pastas(self, raiz, ano, pdv, mes):
-        caminho = os.path.join(raiz, str(ano), pdv, mes)
-        os.makedirs(caminho, exist_ok=True)
-        return caminho
-
-    def log_operacao(self, arquivo, status, data, hora, erro=None):
-        try:
-            # Limitar o tamanho do log a 1MB
-            if os.path.exists(LOG_FILE) and os.path.getsize(LOG_FILE) > 1024 * 1024:
-                with open(LOG_FILE, 'w', encoding='utf-8') as f:
-                    f.write('')  # Limpa o log
-            
-            # Registrar TODOS os status para o histórico
-            # Removido o filtro que impedia alguns status de serem registrados
-            with open(LOG_FILE, 'a', encoding='utf-8') as f:
-                linha = f'{data} {hora} | {arquivo} | {status}'
-                if erro:
-                    linha += f' | {erro}'
-                f.write(linha + '\n')
-        except Exception as e:
-            print(f'Erro ao registrar log: {e}')
-
-    def adicionar_status(self, arquivo, status):
+    def adicionar_status(self, arquivo, status, erro=None, quantidade=1, tamanho=0):
         agora = datetime.datetime.now()
         data_str = agora.strftime('%d/%m/%Y')
         hora_str = agora.strftime('%H:%M:%S')
@@ -531,7 +1001,8 @@ class VerificadorNFCe(QWidget):
         self.status_table.setItem(row, 2, QTableWidgetItem(data_str))
         self.status_table.setItem(row, 3, QTableWidgetItem(hora_str))
         
-        self.log_operacao(arquivo, status, data_str, hora_str)
+        # Registrar TODOS os status para o histórico (e o resumo diário)
+        registrar_operacao(arquivo, status, erro, quantidade, tamanho, self.resumo_diario, agora)
 
     def adicionar_status_geral(self, status):
         agora = datetime.datetime.now()
@@ -552,159 +1023,427 @@ class VerificadorNFCe(QWidget):
         self.status_table.setItem(row, 2, QTableWidgetItem(data_str))
         self.status_table.setItem(row, 3, QTableWidgetItem(hora_str))
 
-    def validar_xml(self, caminho_arquivo):
-        try:
-            ET.parse(caminho_arquivo)
-            return True
-        except Exception:
-            return False
+    def registrar_evento(self, arquivo, status, pdv, mes, erro=None, tamanho=0):
+        """Conta o resultado no ciclo; só cópias, erros e inválidos ganham linha própria"""
+        if self.eventos_ciclo.registrar(pdv, mes, status):
+            self.adicionar_status(arquivo, status, erro, tamanho=tamanho)
 
-    def processar_arquivo(self, arquivo, caminho_arquivo, ano, mes, pdv, pasta_destino, destino_final, mostrar_ja_existe):
-        try:
-            if os.path.exists(destino_final):
-                if mostrar_ja_existe:
-                    self.adicionar_status(arquivo, 'Já existe')
-                return 0
-            
-            if not self.validar_xml(caminho_arquivo):
-                self.adicionar_status(arquivo, 'XML Inválido')
-                return 0
-            
-            shutil.copy2(caminho_arquivo, destino_final)
-            self.adicionar_status(arquivo, 'Copiado')
-            return 1
-            
-        except Exception as e:
-            self.adicionar_status(arquivo, f'Erro: {e}')
-            return 0
+    def publicar_eventos_ciclo(self, mostrar_resumo):
+        """Uma linha (tabela e log) por PDV/mês/status agregado, em vez de uma por arquivo"""
+        resumos, self.totais_ciclo = self.eventos_ciclo.fechar_ciclo()
+        for pdv, mes, status, quantidade in resumos:
+            # 'Já existe' só interessa na primeira verificação; o resto sempre
+            if mostrar_resumo or status != 'Já existe':
+                self.adicionar_status(f'{pdv}/{mes} ({quantidade} arquivos)', status, quantidade=quantidade)
 
-    def executar_transferencia_unica(self, mostrar_ja_existe=False):
+    def executar_transferencia_unica(self, mostrar_ja_existe=False, alvo=None, continuar=False, automatico=False):
+        """
+        Uma fatia de um ciclo de verificação e cópia: do timer (automatico=True),
+        manual ou direcionado (alvo). O planejamento roda em segundo plano e,
+        com `orcamento_ciclo_segundos` no config.json, a cópia para ao esgotar
+        o tempo, guarda o que falta em self.ciclo_pendente e agenda a
+        continuação logo em seguida (continuar=True), devolvendo o controle à
+        interface entre as fatias. parar_verificacao interrompe qualquer um.
+        """
         origem = self.origem_edit.text()
         destino_base = self.destino_edit.text()
-        
-        if not origem or not destino_base:
-            # Mostrar na tela quando não houver configuração
-            self.deve_mostrar_janela = True
-            self.usuario_abriu_manualmente = False  # Resetar flag
-            self.showNormal()
-            self.activateWindow()
+        if not self.pastas_configuradas(origem, destino_base):
             return 0
         
-        if not os.path.exists(origem):
-            self.adicionar_status_geral("Pasta de origem não encontrada")
-            # Mostrar na tela quando houver problema com pastas
-            self.deve_mostrar_janela = True
-            self.usuario_abriu_manualmente = False  # Resetar flag
-            self.showNormal()
-            self.activateWindow()
+        pendente = self.ciclo_pendente or {}
+        if automatico and not continuar and pendente and not pendente['automatico']:
+            # Verificação manual ou direcionada em fatias: o tick do timer espera ela terminar
+            return 0
+        planejando = pendente.get('planejamento')
+        if automatico and planejando and not planejando.done():
+            # A listagem ainda roda em segundo plano: o tick do timer não
+            # replaneja, e a consulta da continuação volta a olhar em seguida
+            if continuar:
+                QTimer.singleShot(CICLO_CONSULTA_MS, self.continuar_ciclo)
             return 0
         
         total_copiados = 0
+        pendentes = None  # notas do ciclo que ficaram fora do destino (None: ciclo interrompido)
+        inicio_ciclo = time.perf_counter()
+        # A sincronização tem preferência: a fatia de integridade em andamento para
+        if self.worker_integridade:
+            self.worker_integridade.parar()
         
         try:
-            for subpasta in os.listdir(origem):
-                caminho_mes = os.path.join(origem, subpasta)
-                if os.path.isdir(caminho_mes) and subpasta.lower().startswith('mes'):
-                    try:
-                        arquivos_xml = [f for f in os.listdir(caminho_mes) if f.lower().endswith('.xml')]
-                        if not arquivos_xml:
-                            continue
-                        
-                        for arquivo in arquivos_xml:
-                            if not self.monitorando:  # Verificar se ainda deve continuar
-                                break
-                                
-                            caminho_arquivo = os.path.join(caminho_mes, arquivo)
-                            
-                            # Extrair informações do arquivo
-                            ano = self.extrair_ano_da_origem(origem)
-                            mes = subpasta.upper()
-                            
-                            # Extrair PDV baseado no tipo de arquivo
-                            pdv = self.extrair_pdv_do_arquivo(arquivo)
-                            
-                            pasta_destino = self.criar_estrutura_pastas(
-                                os.path.join(destino_base, 'NFCE'), ano, pdv, mes
-                            )
-                            destino_final = os.path.join(pasta_destino, arquivo)
-                            
-                            resultado = self.processar_arquivo(
-                                arquivo, caminho_arquivo, ano, mes, pdv, 
-                                pasta_destino, destino_final, mostrar_ja_existe
-                            )
-                            total_copiados += resultado
-                            
-                    except Exception as e:
-                        print(f'Erro ao processar subpasta {subpasta}: {e}')
-                        continue
-                        
+            # Planejar o ciclo inteiro antes de copiar: agrupado e ordenado por
+            # pasta de destino, com uma listagem por pasta em vez de um
+            # os.path.exists por arquivo
+            mapa = MapaDestinos.de_config(destino_base, self.config)
+            
+            # Continuação de um ciclo que esgotou o orçamento: segue a fila sem
+            # sondar nem replanejar. Um ciclo normal, manual ou direcionado
+            # replaneja (o que faltava continua fora do destino e volta ao plano)
+            continuacao, self.ciclo_pendente = self.ciclo_pendente, None
+            retomar = bool(continuacao and (continuar or (automatico and 'planejamento' in continuacao))
+                           and continuacao['origem'] == origem and continuacao['destino'] == destino_base)
+            if not retomar:
+                total_copiados += self.sondar_destino(mapa)
+                if continuacao:
+                    mostrar_ja_existe = mostrar_ja_existe or continuacao['mostrar_ja_existe']
+                self.parar_ciclo = False
+                continuacao = self.planejar_continuacao(origem, destino_base, mapa, mostrar_ja_existe, alvo,
+                                                        inicio_ciclo, automatico)
+            if 'planejamento' in continuacao:
+                if not continuacao['planejamento'].done():
+                    self.ciclo_pendente = continuacao
+                    QTimer.singleShot(CICLO_CONSULTA_MS, self.continuar_ciclo)
+                    return total_copiados
+                continuacao = self.concluir_planejamento(continuacao, continuacao['planejamento'].result(), mapa)
+            mostrar_ja_existe = continuacao['mostrar_ja_existe']
+            self.backlog_pendente = continuacao['adiados']
+            
+            copiador = CopiadorNotas(mapa, self.config, self.registrar_evento, self.indice, self.detector_lacunas,
+                                     self.replicador, self.metricas, self.inicio_execucao)
+            copiados, sem_saldo = self.copiar_fatia(continuacao, mapa, copiador)
+            total_copiados += copiados
+            pendentes = self.encerrar_fatia(continuacao, copiador, sem_saldo)
         except Exception as e:
             print(f'Erro no ciclo de monitoramento: {e}')
             self.adicionar_status_geral(f"Erro no monitoramento: {e}")
+        finally:
+            self.registrar_fatia(inicio_ciclo, mostrar_ja_existe)
         
+        if not self.ciclo_pendente:
+            self.informar_lacunas(pendentes)
         return total_copiados
 
-    def extrair_pdv_do_arquivo(self, nome_arquivo):
+    def pastas_configuradas(self, origem, destino_base):
+        """False (e a janela aparece) sem origem e destino configurados ou com a origem fora do ar"""
+        if origem and destino_base and os.path.exists(origem):
+            return True
+        if origem and destino_base:
+            self.adicionar_status_geral("Pasta de origem não encontrada")
+        # Mostrar na tela quando não houver configuração ou houver problema com pastas
+        self.deve_mostrar_janela = True
+        self.usuario_abriu_manualmente = False  # Resetar flag
+        self.showNormal()
+        self.activateWindow()
+        return False
+
+    def sondar_destino(self, mapa):
+        """
+        Sonda rápida do destino no começo do ciclo: fora do ar, as notas vão
+        para o spool local; de volta, o spool é drenado. Devolve quantas
+        notas do spool foram copiadas.
         """
-        Extrai o número do PDV baseado no tipo de arquivo.
-        Detecta automaticamente se é NFCe ou InutNFCe e extrai das posições corretas.
+        disponivel, motivo = self.sonda_destino.verificar(mapa.destinos)
+        if disponivel == self.destino_indisponivel:
+            mapa.layout.esquecer()
+            self.adicionar_status_geral(
+                "Destino disponível novamente" if disponivel
+                else f"Destino indisponível ({motivo}): usando spool local"
+            )
+        self.destino_indisponivel = not disponivel and self.spool is not None
+        if disponivel and self.spool:
+            return self.drenar_spool(mapa)
+        return 0
+
+    def copiar_fatia(self, continuacao, mapa, copiador):
+        """
+        Copia a fila do ciclo em blocos até esvaziar, esgotar o orçamento da
+        fatia, faltar saldo de I/O ou o ciclo ser interrompido. Devolve
+        (copiados, sem_saldo); o que sobra continua na fila.
+        """
+        fila, resolvidos = continuacao['fila'], continuacao['resolvidos']
+        validacoes, mostrar_ja_existe = continuacao['validacoes'], continuacao['mostrar_ja_existe']
+        baixa_prioridade = self.config.get('baixa_prioridade', False)
+        orcamento = self.config.get('orcamento_ciclo_segundos', 0.5)
+        limite = time.perf_counter() + orcamento if orcamento else None
+        bloco = VALIDACAO_LOTE_MINIMO if limite else len(fila)
+        copiados, sem_saldo = 0, False
+        while fila and not self.ciclo_interrompido() and not (limite and time.perf_counter() >= limite):
+            lote, sem_saldo = self.separar_lote(continuacao, bloco)
+            inicio_bloco = time.perf_counter()
+            self.validar_lote(lote, validacoes, baixa_prioridade)
+            for posicao, item in enumerate(lote):
+                # Parar ou esgotar o orçamento vale entre um arquivo e outro
+                if self.ciclo_interrompido() or (limite and time.perf_counter() >= limite):
+                    fila.extendleft(reversed(lote[posicao:]))
+                    break
+                validacao = validacoes.pop(item.caminho_arquivo, None)
+                continuacao['pagos'].discard(item.caminho_arquivo)
+                if self.destino_indisponivel:
+                    if self.guardar_no_spool(item, validacao, mapa.relativo(item.destino_final)):
+                        resolvidos.add(item.arquivo)
+                    continue
+                # O copiador junta as notas e grava cada grupo de uma vez (no remoto, em paralelo)
+                for copiado in copiador.copiar(item, validacao, mostrar_ja_existe):
+                    resolvidos.add(copiado.arquivo)
+                    copiados += 1
+            for copiado in copiador.concluir():
+                resolvidos.add(copiado.arquivo)
+                copiados += 1
+            if sem_saldo:
+                break
+            if limite and lote:
+                # Próximo bloco do tamanho que cabe no que resta do orçamento
+                por_item = (time.perf_counter() - inicio_bloco) / len(lote)
+                bloco = int(min(max((limite - time.perf_counter()) / max(por_item, 1e-6), 1), CICLO_BLOCO_MAXIMO))
+        return copiados, sem_saldo
+
+    def separar_lote(self, continuacao, bloco):
+        """
+        Tira até `bloco` itens da fila: (lote, sem_saldo). Limite de I/O: o
+        que não couber no saldo do token bucket fica para o próximo ciclo,
+        sem travar a interface esperando.
         """
+        fila, pagos = continuacao['fila'], continuacao['pagos']
+        agendador, agora = AgendadorTrabalho.de_config(self.config), datetime.datetime.now()
+        maximo = self.config.get('spool_maximo', SPOOL_MAXIMO)
+        lote = []
+        while fila and len(lote) < bloco:
+            if self.destino_indisponivel and not self.spool.cabe(fila[0], agendador, agora, maximo, len(lote)):
+                # Backlog antigo espera o destino voltar, sem validar nem ocupar o spool
+                fila.popleft()
+                continuacao['adiados'] += 1
+                self.backlog_pendente += 1
+                continue
+            if fila[0].caminho_arquivo not in pagos and not self.limitador.tentar_consumir(fila[0].tamanho):
+                return lote, True
+            pagos.add(fila[0].caminho_arquivo)
+            lote.append(fila.popleft())
+        return lote, False
+
+    def validar_lote(self, lote, validacoes, baixa_prioridade):
+        """Valida o lote de uma vez, em paralelo (o que já foi validado numa fatia anterior não repete)"""
+        inicio_validacao = time.perf_counter()
+        a_validar = [item for item in lote if item.caminho_arquivo not in validacoes]
+        validacoes.update(validar_em_lote(
+            [item.caminho_arquivo for item in a_validar], baixa_prioridade=baixa_prioridade, com_dados=True
+        ))
+        if a_validar:
+            por_arquivo = (time.perf_counter() - inicio_validacao) / len(a_validar)
+            for item in a_validar:
+                self.metricas.registrar(item.pdv, 'validacao', por_arquivo)
+
+    def encerrar_fatia(self, continuacao, copiador, sem_saldo):
+        """
+        Fim da fatia: com a fila por copiar e orçamento esgotado, guarda o
+        cursor e agenda a continuação; senão fecha o ciclo (marcas de
+        numeração e já existentes). Devolve as notas que ficaram fora do
+        destino, ou None se o ciclo continua ou foi interrompido.
+        """
+        fila, itens, resolvidos = continuacao['fila'], continuacao['itens'], continuacao['resolvidos']
+        self.backlog_pendente += len(fila)
+        if fila and not sem_saldo and not self.ciclo_interrompido():
+            # Orçamento esgotado: guarda o cursor e devolve o controle à interface
+            self.ciclo_pendente = continuacao
+            QTimer.singleShot(0, self.continuar_ciclo)
+            return None
+        
+        pendentes = None
+        # Marcas só com o ciclo concluído; com padrão de nome o recorte
+        # pode não ter todos os arquivos da série
+        if not self.ciclo_interrompido():
+            alvo = continuacao['alvo']
+            if not (alvo and alvo.padrao):
+                self.marcas_numeracao.atualizar(itens, resolvidos)
+            pendentes = [item.arquivo for item in itens if not item.existe and item.arquivo not in resolvidos]
+        # Os já existentes não têm urgência: ficam para depois das cópias
+        for item in itens:
+            if self.ciclo_interrompido():
+                break
+            if item.existe:
+                copiador.ja_existe(item, continuacao['mostrar_ja_existe'])
+        return pendentes
+
+    def registrar_fatia(self, inicio_ciclo, mostrar_ja_existe):
+        """Confirma índice, réplicas e marcas a cada fatia; eventos e métricas do ciclo quando ele fecha"""
+        if self.indice:
+            self.indice.confirmar()
+        self.replicador.salvar()
+        self.marcas_numeracao.salvar()
+        if not (self.ciclo_pendente and 'planejamento' in self.ciclo_pendente):
+            self.metricas.registrar('Todos', 'ciclo', time.perf_counter() - inicio_ciclo)
+        if not self.ciclo_pendente:
+            # Eventos e lacunas são publicados uma vez por ciclo, não por fatia
+            self.metricas.contar('ciclos')
+            self.publicar_eventos_ciclo(mostrar_ja_existe)
+        self.metricas.exportar()
+
+    def planejar_continuacao(self, origem, destino_base, mapa, mostrar_ja_existe, alvo, inicio_ciclo, automatico):
+        """
+        Planeja um ciclo novo e devolve o estado que as fatias consomem (fila,
+        resolvidos...). A listagem de origem e destino roda numa thread e o
+        estado volta só com o Future em 'planejamento'; concluir_planejamento
+        monta o resto quando ele terminar.
+        """
+        # Ciclo rápido: só candidatos acima das marcas de numeração.
+        # Varredura completa na primeira verificação, na manual e periodicamente
+        # Uma verificação direcionada (alvo) olha o recorte inteiro
+        varredura_completa = mostrar_ja_existe or (
+            time.monotonic() - self.ultima_varredura_completa
+            >= self.config.get('varredura_completa_segundos', 600)
+        )
+        if varredura_completa and not alvo:
+            self.ultima_varredura_completa = time.monotonic()
+            # Pastas podem ter sido apagadas no destino desde a última varredura
+            mapa.layout.esquecer()
+        varredura_completa = varredura_completa or alvo is not None
+        # Com o destino fora, só candidatos acima das marcas (nada a listar no destino)
+        argumentos = (
+            origem, destino_base, mapa,
+            None if varredura_completa and not self.destino_indisponivel else self.marcas_numeracao,
+            not self.destino_indisponivel, alvo
+        )
+        return {
+            'origem': origem, 'destino': destino_base, 'alvo': alvo, 'mostrar_ja_existe': mostrar_ja_existe,
+            'automatico': automatico, 'varredura_completa': varredura_completa, 'inicio': inicio_ciclo,
+            'planejamento': rodar_em_segundo_plano(planejar_ciclo, *argumentos),
+        }
+
+    def concluir_planejamento(self, continuacao, plano, mapa):
+        """Filtra, amostra a descoberta e agenda o plano; devolve o estado das fatias"""
+        varredura_completa, alvo = continuacao['varredura_completa'], continuacao['alvo']
+        descoberto_em = time.time()
+        self.metricas.registrar('Todos', 'ciclo_descoberta', time.perf_counter() - continuacao['inicio'])
+        
+        itens = [item for itens_pasta in plano.values() for item in itens_pasta]
+        if self.config.get('coordenacao', False) and not self.destino_indisponivel:
+            itens = self.filtrar_por_lease(continuacao['destino'], itens)
+        # Uma amostra de descoberta por arquivo: o que continua pendente (inválido,
+        # adiado, sem saldo) e volta em cada replanejamento não conta de novo
+        pendentes = {item.caminho_arquivo for item in itens if not item.existe}
+        for item in itens:
+            if (item.caminho_arquivo in pendentes and item.caminho_arquivo not in self.descobertos
+                    and item.mtime >= self.inicio_execucao):
+                self.metricas.registrar(item.pdv, 'descoberta', descoberto_em - item.mtime)
+                self.descobertos.add(item.caminho_arquivo)
+        if varredura_completa and not alvo:
+            self.descobertos &= pendentes
+        
+        # Mês corrente e arquivos recentes na frente; backlog com fração garantida
+        prioritarios, backlog, adiados = AgendadorTrabalho.de_config(self.config).agendar(
+            [item for item in itens if not item.existe]
+        )
+        return {
+            'origem': continuacao['origem'], 'destino': continuacao['destino'], 'alvo': alvo,
+            'mostrar_ja_existe': continuacao['mostrar_ja_existe'], 'automatico': continuacao['automatico'],
+            'itens': itens, 'fila': collections.deque(prioritarios + backlog), 'adiados': len(adiados),
+            'resolvidos': {item.arquivo for item in itens if item.existe},
+            'validacoes': {}, 'pagos': set(),  # validados e já descontados do limite de I/O
+        }
+
+    def guardar_no_spool(self, item, validacao, relativo=None):
+        """Destino fora do ar: valida e guarda a nota no spool local. True se ficou guardada"""
         try:
-            # Remover extensão .xml se existir
-            nome_sem_ext = nome_arquivo.replace('.xml', '')
-            
-            # Verificar se é arquivo de inutilização (InutNFCe)
-            if 'InutNFCe' in nome_arquivo:
-                # Para InutNFCe: posições 21-23 (ex: 35252434286900018265031000001542000001542-InutNFCe.xml)
-                if len(nome_sem_ext) >= 23:
-                    pdv_numero = nome_sem_ext[20:23]  # Posições 21-23 (0-indexed)
-                    print(f"DEBUG - InutNFCe detectado: {nome_arquivo} -> PDV: {pdv_numero}")
-                    return f"PDV-{pdv_numero}"
-                else:
-                    print(f"DEBUG - InutNFCe muito curto: {nome_arquivo}")
-                    return "PDV-000"
-            
-            # Para NFCe normal: posições 23-25 (ex: 35250802775652000123650310000000901564004651-NFCe.xml)
-            elif 'NFCe' in nome_arquivo:
-                if len(nome_sem_ext) >= 25:
-                    pdv_numero = nome_sem_ext[22:25]  # Posições 23-25 (0-indexed)
-                    print(f"DEBUG - NFCe detectado: {nome_arquivo} -> PDV: {pdv_numero}")
-                    return f"PDV-{pdv_numero}"
-                else:
-                    print(f"DEBUG - NFCe muito curto: {nome_arquivo}")
-                    return "PDV-000"
-            
-            # Para outros tipos de arquivo, tentar detectar automaticamente
-            else:
-                # Tentar encontrar padrão de 3 dígitos que pode ser o PDV
-                # Procurar por sequência de 3 dígitos após um padrão específico
-                # Padrão: procurar por 3 dígitos após uma sequência de números
-                match = re.search(r'\d{3}(?=\d{11,})', nome_sem_ext)
-                if match:
-                    pdv_numero = match.group()
-                    print(f"DEBUG - Padrão genérico detectado: {nome_arquivo} -> PDV: {pdv_numero}")
-                    return f"PDV-{pdv_numero}"
-                else:
-                    print(f"DEBUG - Nenhum padrão encontrado: {nome_arquivo}")
-                    return "PDV-000"
-                    
+            if self.spool.contem(item.destino_final):
+                return True
+            valido, motivo, metadados, dados = validacao or ler_e_validar(item.caminho_arquivo)
+            if not valido:
+                self.registrar_evento(item.arquivo, status_da_validacao(motivo), item.pdv, item.mes, motivo)
+                return False
+            self.spool.guardar(
+                item.destino_final, dados, item.caminho_arquivo, arquivo=item.arquivo,
+                relativo=relativo or os.path.join(str(item.ano), item.pdv, item.mes, item.arquivo),
+                pdv=item.pdv, mes=item.mes
+            )
+            if self.indice and metadados:
+                self.indice.registrar(metadados, item.arquivo, item.destino_final, dados)
+            self.registrar_evento(item.arquivo, 'No spool', item.pdv, item.mes)
+            if self.detector_lacunas.registrar(item.arquivo):
+                self.registrar_evento(item.arquivo, 'Numeração duplicada', item.pdv, item.mes)
+            return True
         except Exception as e:
-            print(f"Erro ao extrair PDV do arquivo {nome_arquivo}: {e}")
-            return "PDV-000"
+            self.registrar_evento(item.arquivo, f'Erro: {e}', item.pdv, item.mes)
+            return False
+
+    def drenar_spool(self, mapa):
+        """Destino de volta: grava o que ficou no spool, em paralelo, e retorna quantas gravou"""
+        if not len(self.spool):
+            return 0
+        
+        def gravar(entrada, caminho_spool):
+            with open(caminho_spool, 'rb') as f:
+                dados = f.read()
+            mapa.gravar(entrada['destino'], dados, os.path.getmtime(caminho_spool), caminho_spool)
+            self.replicador.enfileirar(entrada['relativo'], entrada['destino'], dados)
+        
+        gravadas, existentes, falhas = self.spool.drenar(gravar)
+        # As que já existiam não viram evento: o plano do mesmo ciclo lista o
+        # destino e já as conta como existentes
+        for entrada in gravadas:
+            self.registrar_evento(entrada['arquivo'], 'Copiado', entrada['pdv'], entrada['mes'])
+        self.metricas.contar('copiados', len(gravadas))
+        self.adicionar_status_geral(
+            f"Spool local esvaziado: {len(gravadas)} gravados, {len(existentes)} já existiam"
+            + (f", {len(self.spool)} pendentes" if falhas else "")
+        )
+        return len(gravadas)
+
+    def filtrar_por_lease(self, destino_base, itens):
+        """Mantém só as cópias dos PDV/mês cujo lease é deste nó (ou foi assumido agora)"""
+        if self.coordenador is None or self.coordenador.destino_base != destino_base:
+            if self.coordenador:
+                self.coordenador.encerrar()
+            self.coordenador = CoordenadorNos.de_config(destino_base, self.config)
+        permitidos = {}
+        for item in itens:
+            grupo = (item.ano, item.pdv, item.mes)
+            if not item.existe and grupo not in permitidos:
+                permitidos[grupo] = self.coordenador.reivindicar(*grupo)
+        self.pastas_outros_nos = sum(1 for permitido in permitidos.values() if not permitido)
+        return [item for item in itens if permitidos.get((item.ano, item.pdv, item.mes), True)]
+
+    def informar_lacunas(self, pendentes=()):
+        """
+        Registra as lacunas de numeração surgidas no ciclo (sem InutNFCe que as
+        explique). `pendentes`: notas do ciclo ainda não copiadas (adiadas,
+        sem saldo, com erro), que estão na origem e não são lacuna; None
+        quando o ciclo foi interrompido e não dá para saber (nada é informado).
+        """
+        try:
+            novas = self.detector_lacunas.novas_lacunas(pendentes) if pendentes is not None else []
+            for pdv, serie, inicio, fim in novas:
+                faixa = f'nº {inicio}' if inicio == fim else f'nº {inicio} a {fim}'
+                self.adicionar_status(f'{pdv} série {serie:03d}', 'Lacuna na numeração', faixa)
+            self.detector_lacunas.salvar()
+            self.resumo_diario.salvar()
+        except Exception as e:
+            print(f'Erro ao verificar numeração: {e}')
+
+    def atualizar_metricas(self):
+        """Preenche a aba de métricas com os percentis de latência por PDV"""
+        self.tabela_metricas.setRowCount(0)
+        for pdv, etapas in self.metricas.resumo().items():
+            if pdv == 'Todos':
+                continue
+            row = self.tabela_metricas.rowCount()
+            self.tabela_metricas.insertRow(row)
+            self.tabela_metricas.setItem(row, 0, QTableWidgetItem(pdv))
+            copias = etapas.get('copia', {}).get('n', 0)
+            self.tabela_metricas.setItem(row, 1, QTableWidgetItem(str(copias)))
+            for coluna, etapa in enumerate(MetricasLatencia.ETAPAS, start=2):
+                dados = etapas.get(etapa)
+                texto = ' / '.join(
+                    formatar_segundos(dados[p]) for p in ('p50', 'p95', 'p99')
+                ) if dados else '-'
+                self.tabela_metricas.setItem(row, coluna, QTableWidgetItem(texto))
+        
+        contadores = self.metricas.contadores
+        if contadores['deduplicados']:
+            fisicos = contadores['bytes_copiados'] - contadores['bytes_economizados']
+            razao = contadores['bytes_copiados'] / fisicos if fisicos else 0
+            self.deduplicacao_label.setText(
+                f"Deduplicação: {contadores['deduplicados']} arquivo(s) idêntico(s), "
+                f"{formatar_bytes(contadores['bytes_economizados'])} economizados (razão {razao:.2f}:1)"
+            )
+
+    def extrair_pdv_do_arquivo(self, nome_arquivo):
+        return extrair_pdv_do_arquivo(nome_arquivo)
 
     def extrair_ano_da_origem(self, origem):
-        partes = origem.split(os.sep)
-        for parte in partes:
-            if parte.lower().startswith('ano'):
-                try:
-                    return int(parte.split()[-1])
-                except:
-                    pass
-        return datetime.datetime.now().year
+        return extrair_ano_da_origem(origem)
 
     def atualizar_historico(self):
         # Resetar flag quando o usuário interagir com a interface
         self.usuario_abriu_manualmente = False
+        self.atualizar_resumo()
         self.tabela_historico.setRowCount(0)
         data_filtro = self.filtro_data.date().toString('dd/MM/yyyy')
         status_filtro = self.filtro_status.currentText()
@@ -761,6 +1500,190 @@ class VerificadorNFCe(QWidget):
             # Mostrar erro na interface
             self.adicionar_status_geral(f"Erro ao carregar histórico: {e}")
 
+    def atualizar_resumo(self):
+        """Preenche o resumo do mês da data selecionada a partir dos contadores"""
+        data = self.filtro_data.date().toPyDate()
+        inicio = data.replace(day=1)
+        fim = (inicio + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+        self.tabela_resumo.setRowCount(0)
+        for (dia, pdv), por_status in self.resumo_diario.consultar(inicio.isoformat(), fim.isoformat()).items():
+            row = self.tabela_resumo.rowCount()
+            self.tabela_resumo.insertRow(row)
+            self.tabela_resumo.setItem(row, 0, QTableWidgetItem(f'{dia[8:10]}/{dia[5:7]}/{dia[0:4]}'))
+            self.tabela_resumo.setItem(row, 1, QTableWidgetItem(pdv))
+            for coluna, status in enumerate(ResumoDiario.STATUS, start=2):
+                quantidade = por_status.get(status, [0, 0])[0]
+                self.tabela_resumo.setItem(row, coluna, QTableWidgetItem(str(quantidade)))
+            tamanho = por_status.get('Copiado', [0, 0])[1]
+            self.tabela_resumo.setItem(row, len(ResumoDiario.STATUS) + 2, QTableWidgetItem(formatar_bytes(tamanho)))
+
+    def exportar_historico(self):
+        """Exporta o histórico filtrado em segundo plano, sem passar pela tabela"""
+        # Resetar flag quando o usuário interagir com a interface
+        self.usuario_abriu_manualmente = False
+        formato = self.exportar_formato.currentText().lower()
+        extensao = 'parquet' if formato == 'parquet' else 'csv'
+        destino, _ = QFileDialog.getSaveFileName(
+            self, 'Exportar Histórico', f'historico.{extensao}', f'{formato.upper()} (*.{extensao})'
+        )
+        if not destino:
+            return
+        filtros = {
+            'data_inicial': self.exportar_de.date().toPyDate(),
+            'data_final': self.exportar_ate.date().toPyDate(),
+            'status': self.filtro_status.currentText(),
+            'pdv': normalizar_pdv(self.exportar_pdv.text()) if self.exportar_pdv.text().strip() else None,
+        }
+        self.btn_exportar_historico.setEnabled(False)
+        self.barra_exportacao.setValue(0)
+        self.barra_exportacao.setVisible(True)
+        
+        self.thread_exportacao = QThread()
+        self.worker_exportacao = ExportacaoWorker(destino, formato, filtros)
+        self.worker_exportacao.moveToThread(self.thread_exportacao)
+        self.thread_exportacao.started.connect(self.worker_exportacao.executar)
+        self.worker_exportacao.progresso.connect(self.barra_exportacao.setValue)
+        self.worker_exportacao.concluido.connect(self.exportacao_concluida)
+        self.worker_exportacao.erro.connect(self.exportacao_com_erro)
+        self.worker_exportacao.finished.connect(self.thread_exportacao.quit)
+        self.thread_exportacao.start()
+
+    def toggle_carga_inicial(self):
+        # Resetar flag quando o usuário interagir com a interface
+        self.usuario_abriu_manualmente = False
+        if self.worker_carga:
+            self.worker_carga.parar()
+            self.carga_btn.setEnabled(False)
+            self.carga_label.setText('Parando após o lote atual...')
+            return
+        if not self.destino_edit.text():
+            self.mostrar_mensagem('Erro', 'Por favor, configure a pasta de destino.')
+            return
+        origem = QFileDialog.getExistingDirectory(self, 'Selecionar Pasta para Carga Inicial')
+        if origem:
+            self.iniciar_carga_inicial(origem)
+
+    def iniciar_carga_inicial(self, origem):
+        """Inicia (ou retoma do checkpoint) a carga inicial em segundo plano"""
+        if self.worker_carga or not os.path.isdir(origem):
+            return
+        self.carga_btn.setText('Parar Carga Inicial')
+        self.barra_carga.setValue(0)
+        self.barra_carga.setVisible(True)
+        self.carga_label.setText('Listando a origem...')
+        self.adicionar_status_geral(f"Carga inicial iniciada: {origem}")
+        
+        self.thread_carga = QThread()
+        self.worker_carga = CargaInicialWorker(
+            origem, self.destino_edit.text(), dict(self.config),
+            indice=self.indice, lacunas=self.detector_lacunas, replicador=self.replicador
+        )
+        self.worker_carga.moveToThread(self.thread_carga)
+        self.thread_carga.started.connect(self.worker_carga.executar)
+        self.worker_carga.progresso.connect(self.progresso_carga)
+        self.worker_carga.concluido.connect(self.carga_concluida)
+        self.worker_carga.erro.connect(self.carga_com_erro)
+        self.worker_carga.finished.connect(self.thread_carga.quit)
+        self.thread_carga.start()
+
+    def agendar_integridade(self):
+        """
+        Inicia uma fatia da verificação de integridade quando a sincronização
+        está ociosa: nada no backlog nem no spool, destino no ar, sem carga
+        inicial e fora do horário comercial (quando configurado).
+        """
+        destino = self.destino_edit.text()
+        if not self.config.get('verificacao_integridade', True) or self.worker_integridade or not destino:
+            return
+        if (self.backlog_pendente or self.destino_indisponivel or self.worker_carga
+                or (self.spool and len(self.spool)) or self.limitador.loja_aberta()):
+            return
+        if time.monotonic() - self.ultima_integridade < self.config.get('integridade_intervalo', 60):
+            return
+        self.ultima_integridade = time.monotonic()
+        # A mesma verificação segue de fatia em fatia enquanto origem e destino não mudam
+        mapa = MapaDestinos.de_config(destino, self.config)
+        verificacao = self.verificacao_integridade
+        if verificacao is None or verificacao.origem != self.origem_edit.text() or verificacao.mapa.bases != mapa.bases:
+            verificacao = self.verificacao_integridade = VerificacaoIntegridade(
+                mapa, self.indice, self.origem_edit.text(), self.config.get('replicas_destino', [])
+            )
+        self.thread_integridade = QThread()
+        self.worker_integridade = IntegridadeWorker(
+            verificacao, self.config.get('integridade_orcamento_segundos', 2),
+            self.config.get('integridade_reparar', False)
+        )
+        self.worker_integridade.moveToThread(self.thread_integridade)
+        self.thread_integridade.started.connect(self.worker_integridade.executar)
+        self.worker_integridade.concluido.connect(lambda fatia: self.integridade_concluida(fatia, verificacao))
+        self.worker_integridade.erro.connect(self.integridade_com_erro)
+        self.worker_integridade.finished.connect(self.thread_integridade.quit)
+        self.thread_integridade.start()
+
+    def integridade_concluida(self, fatia, verificacao):
+        self.worker_integridade = None
+        for problema in fatia['problemas']:
+            self.adicionar_status(problema['arquivo'], 'Reparado' if problema['reparado'] else 'Divergência no destino',
+                                  problema['motivo'])
+        estado = verificacao.estado
+        ultima = estado['resumo_ultima_passagem']
+        if fatia['passagem_concluida']:
+            self.adicionar_status_geral(
+                f"Verificação de integridade concluída | {ultima['verificados']} arquivo(s), "
+                f"{ultima['reparados']} reparado(s), {ultima['divergentes']} divergência(s)"
+            )
+        texto = f"Integridade: passagem atual {estado['verificados']} arquivo(s) (fase {estado['fase']})"
+        if ultima:
+            texto += (f" | última completa em {estado['ultima_passagem']}: {ultima['verificados']} arquivo(s), "
+                      f"{ultima['reparados']} reparado(s), {ultima['divergentes']} divergência(s)")
+        self.integridade_label.setText(texto)
+
+    def integridade_com_erro(self, erro):
+        self.worker_integridade = None
+        print(f'Erro na verificação de integridade: {erro}')
+
+    def progresso_carga(self, processados, total, taxa, eta):
+        self.barra_carga.setValue(int(processados * 100 / total) if total else 100)
+        restante = formatar_segundos(eta) if eta >= 0 else '-'
+        self.carga_label.setText(f'{processados}/{total} | {taxa:.0f} arq/s | restam {restante}')
+
+    def _carga_finalizada(self):
+        self.worker_carga = None
+        self.carga_btn.setEnabled(True)
+        self.carga_btn.setText('Carga Inicial...')
+        self.barra_carga.setVisible(False)
+
+    def carga_concluida(self, estado):
+        self._carga_finalizada()
+        resumo = (f"{estado['copiados']} copiados, {estado['existentes']} já existiam, "
+                  f"{estado['invalidos']} inválidos, {estado['erros']} erros")
+        if estado.get('concluida'):
+            self.carga_label.setText(f'Concluída: {resumo}')
+            self.adicionar_status_geral(f"Carga inicial concluída | {resumo}")
+            self.informar_lacunas()
+        elif estado['falhas'] and estado['processados'] >= estado.get('total', 0):
+            # Origem toda percorrida; só as notas com erro ficam para a próxima carga
+            self.carga_label.setText(f"{len(estado['falhas'])} nota(s) com erro: tentadas de novo na próxima carga")
+            self.adicionar_status_geral(f"Carga inicial com falhas pendentes | {resumo}")
+        else:
+            self.carga_label.setText(f"Interrompida em {estado['processados']}/{estado.get('total', 0)}")
+            self.adicionar_status_geral(f"Carga inicial interrompida | {resumo}")
+
+    def carga_com_erro(self, erro):
+        self._carga_finalizada()
+        self.carga_label.setText('')
+        self.adicionar_status_geral(f"Carga inicial | Erro: {erro}")
+
+    def exportacao_concluida(self, linhas, destino):
+        self.btn_exportar_historico.setEnabled(True)
+        self.barra_exportacao.setVisible(False)
+        self.mostrar_mensagem('Exportação', f'{linhas} linha(s) exportada(s) para {destino}')
+
+    def exportacao_com_erro(self, erro):
+        self.btn_exportar_historico.setEnabled(True)
+        self.barra_exportacao.setVisible(False)
+        self.mostrar_mensagem('Erro', f'Erro ao exportar histórico: {erro}')
+
     def limpar_filtros_historico(self):
         """Limpa os filtros e atualiza o histórico"""
         # Resetar flag quando o usuário interagir com a interface
@@ -774,59 +1697,34 @@ class VerificadorNFCe(QWidget):
         self.atualizar_historico()
 
     def verificar_atualizacao(self):
+        """Verifica e baixa a atualização em segundo plano, sem travar a interface"""
         # Resetar flag quando o usuário interagir com a interface
         self.usuario_abriu_manualmente = False
-        try:
-            self.atualizar_btn.setEnabled(False)
-            self.atualizar_btn.setText('Verificando...')
-            
-            # Headers para acessar repositório
-            headers = {
-                'User-Agent': 'VerificadorNFCe/1.0.0',
-                'Accept': 'application/vnd.github.v3+json'
-            }
-            
-            # Verificar versão mais recente no GitHub
-            response = requests.get(GITHUB_RELEASE_URL, headers=headers, timeout=10)
-            if response.status_code == 200:
-                release_data = response.json()
-                latest_version = release_data['tag_name'].lstrip('v')
-                
-                if latest_version > VERSION:
-                    # Há atualização disponível
-                    download_url = None
-                    for asset in release_data['assets']:
-                        if asset['name'].endswith('.exe'):
-                            download_url = asset['browser_download_url']
-                            break
-                    
-                    if download_url:
-                        self.baixar_e_instalar_atualizacao(download_url)
-                    else:
-                        self.mostrar_mensagem('Erro', 'Arquivo executável não encontrado na versão mais recente.')
-                else:
-                    self.mostrar_mensagem('Atualização', 'Você já está usando a versão mais recente.')
-            else:
-                self.mostrar_mensagem('Erro', f'Não foi possível verificar atualizações. Status: {response.status_code}')
-        except Exception as e:
-            self.mostrar_mensagem('Erro', f'Erro ao verificar atualização: {str(e)}')
-        finally:
-            self.atualizar_btn.setEnabled(True)
-            self.atualizar_btn.setText('Verificar Atualizações')
+        self.atualizar_btn.setEnabled(False)
+        self.atualizar_btn.setText('Verificando...')
+        
+        self.thread_atualizacao = QThread()
+        self.worker_atualizacao = AtualizacaoWorker(self.config.get('url_atualizacao', GITHUB_RELEASE_URL))
+        self.worker_atualizacao.moveToThread(self.thread_atualizacao)
+        self.thread_atualizacao.started.connect(self.worker_atualizacao.executar)
+        self.worker_atualizacao.progresso.connect(
+            lambda percentual: self.atualizar_btn.setText(f'Baixando... {percentual}%')
+        )
+        self.worker_atualizacao.mensagem.connect(self.mostrar_mensagem)
+        self.worker_atualizacao.pronto.connect(self.instalar_atualizacao)
+        self.worker_atualizacao.finished.connect(self.thread_atualizacao.quit)
+        self.worker_atualizacao.finished.connect(self.atualizacao_finalizada)
+        self.thread_atualizacao.start()
+
+    def atualizacao_finalizada(self):
+        self.atualizar_btn.setEnabled(True)
+        self.atualizar_btn.setText('Verificar Atualizações')
 
-    def baixar_e_instalar_atualizacao(self, download_url):
+    def instalar_atualizacao(self, caminho_exe):
+        """Substitui o executável pela versão baixada (já com o hash conferido) e reinicia"""
         try:
-            # Baixar nova versão
-            response = requests.get(download_url, stream=True)
-            if response.status_code == 200:
-                # Salvar em arquivo temporário
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.exe') as temp_file:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        temp_file.write(chunk)
-                    temp_path = temp_file.name
-                
-                # Criar script de atualização
-                atualizador_script = f"""
+            # Criar script de atualização
+            atualizador_script = f"""
 import os
 import time
 import subprocess
@@ -838,26 +1736,24 @@ time.sleep(2)
 # Substituir executável
 try:
     os.remove(r"{sys.executable}")
-    os.rename(r"{temp_path}", r"{sys.executable}")
+    os.rename(r"{caminho_exe}", r"{sys.executable}")
     
     # Reiniciar aplicativo
     subprocess.Popen([r"{sys.executable}"])
 except Exception as e:
     print(f"Erro na atualização: {{e}}")
 """
-                
-                # Salvar e executar script de atualização
-                with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.py') as script_file:
-                    script_file.write(atualizador_script)
-                    script_path = script_file.name
-                
-                # Executar script de atualização
-                subprocess.Popen([sys.executable, script_path])
-                
-                # Fechar aplicativo atual
-                self.fechar_aplicacao()
-            else:
-                self.mostrar_mensagem('Erro', 'Falha ao baixar atualização.')
+            
+            # Salvar e executar script de atualização
+            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.py') as script_file:
+                script_file.write(atualizador_script)
+                script_path = script_file.name
+            
+            # Executar script de atualização
+            subprocess.Popen([sys.executable, script_path])
+            
+            # Fechar aplicativo atual
+            self.fechar_aplicacao()
         except Exception as e:
             self.mostrar_mensagem('Erro', f'Erro ao instalar atualização: {str(e)}')
 
@@ -867,7 +1763,15 @@ except Exception as e:
         msg.setText(mensagem)
         msg.exec_()
 
+
 if __name__ == '__main__':
+    # Necessário para o pool de validação no executável gerado (Windows)
+    multiprocessing.freeze_support()
+    
+    # Com argumentos, executa um comando de linha de comando sem abrir a interface
+    if len(sys.argv) > 1:
+        sys.exit(executar_cli(sys.argv[1:]))
+    
     app = QApplication(sys.argv)
     
     # Configurar aplicação para não fechar quando a janela é fechada